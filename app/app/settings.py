@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -53,11 +54,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.RequestProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -97,6 +100,20 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -150,6 +167,117 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# Token authentication cache. Workers keep tokens for LOCAL_TTL seconds,
+# which bounds how long another worker may accept a revoked token. Set
+# TOKEN_AUTH_SHARED_CACHE to a CACHES alias to add a shared tier.
+TOKEN_AUTH_CACHE = {
+    'LOCAL_TTL': int(os.environ.get('TOKEN_AUTH_LOCAL_TTL', 30)),
+    'LOCAL_MAX_SIZE': int(os.environ.get('TOKEN_AUTH_LOCAL_MAX_SIZE', 10000)),
+    'SHARED_ALIAS': os.environ.get('TOKEN_AUTH_SHARED_CACHE') or None,
+    'SHARED_TTL': int(os.environ.get('TOKEN_AUTH_SHARED_TTL', 300)),
+}
+
+RECIPE_API_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.environ.get('RECIPE_API_CACHE_TIMEOUT', 300)),
+}
+
+# Resized copies generated for uploaded recipe images. Set
+# RECIPE_IMAGE_WORKERS to 0 to render them inline instead of in a pool.
+RECIPE_IMAGE_VARIANT_SIZES = (128, 512, 1024)
+RECIPE_IMAGE_VARIANT_FORMATS = ('jpeg', 'webp')
+RECIPE_IMAGE_VARIANT_QUALITY = 85
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+# Interpreter the pool spawns; by default the one running the app.
+RECIPE_IMAGE_PYTHON = os.environ.get('RECIPE_IMAGE_PYTHON') or None
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = int(
+    os.environ.get('RECIPE_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+)
+
+# Hand authenticated image downloads to nginx (X-Accel-Redirect) instead of
+# streaming them from Django. The prefix must match an internal location.
+MEDIA_ACCEL_REDIRECT = bool(int(os.environ.get('MEDIA_ACCEL_REDIRECT', 0)))
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Recipe search uses the tsvector column on Postgres ('auto') and an in
+# process inverted index per user otherwise, or when set to 'python'.
+RECIPE_SEARCH_BACKEND = os.environ.get('RECIPE_SEARCH_BACKEND', 'auto')
+RECIPE_SEARCH_CONFIG = 'english'
+RECIPE_SEARCH_INDEX_MAX_USERS = int(
+    os.environ.get('RECIPE_SEARCH_INDEX_MAX_USERS', 128)
+)
+
+# Per-process ingredient -> recipe indexes behind the pantry endpoint. Writes
+# patch them in place; after the TTL they are rebuilt from scratch, which
+# drops the slots that deleted recipes left behind.
+RECIPE_PANTRY_INDEX_MAX_USERS = int(
+    os.environ.get('RECIPE_PANTRY_INDEX_MAX_USERS', 128)
+)
+RECIPE_PANTRY_INDEX_TTL = int(os.environ.get('RECIPE_PANTRY_INDEX_TTL', 300))
+
+# Tag and ingredient autocomplete; 'python' keeps sorted names in process.
+RECIPE_AUTOCOMPLETE_BACKEND = os.environ.get(
+    'RECIPE_AUTOCOMPLETE_BACKEND', 'auto'
+)
+RECIPE_AUTOCOMPLETE_LIMIT = 10
+RECIPE_AUTOCOMPLETE_MAX_LIMIT = 50
+RECIPE_AUTOCOMPLETE_INDEX_MAX_USERS = int(
+    os.environ.get('RECIPE_AUTOCOMPLETE_INDEX_MAX_USERS', 128)
+)
+# Seconds before autocomplete checks again whether pg_trgm is installed.
+RECIPE_AUTOCOMPLETE_TRIGRAM_TTL = int(
+    os.environ.get('RECIPE_AUTOCOMPLETE_TRIGRAM_TTL', 60)
+)
+
+RECIPE_SIMILAR_LIMIT = 10
+RECIPE_SIMILAR_MAX_LIMIT = 50
+
+# Largest array the bulk recipe endpoint accepts in one request.
+RECIPE_BULK_MAX_ITEMS = int(os.environ.get('RECIPE_BULK_MAX_ITEMS', 10000))
+
+# Recipes read per server-side cursor fetch when streaming an export.
+RECIPE_EXPORT_CHUNK_SIZE = int(
+    os.environ.get('RECIPE_EXPORT_CHUNK_SIZE', 2000)
+)
+
+# Request instrumentation (core.middleware). Requests slower than
+# REQUEST_SLOW_MS are logged with their SQL, at the given sample rate.
+REQUEST_SERVER_TIMING = bool(int(os.environ.get('REQUEST_SERVER_TIMING', 1)))
+REQUEST_SLOW_MS = int(os.environ.get('REQUEST_SLOW_MS', 500))
+REQUEST_SLOW_LOG_SAMPLE_RATE = float(
+    os.environ.get('REQUEST_SLOW_LOG_SAMPLE_RATE', 1.0)
+)
+
+# Staff may profile single requests with ?_profile= or X-Profile (see
+# core.profiling); the interval is the sampling profiler's period.
+REQUEST_PROFILING = bool(int(os.environ.get('REQUEST_PROFILING', 1)))
+REQUEST_PROFILING_INTERVAL = float(
+    os.environ.get('REQUEST_PROFILING_INTERVAL', 0.001)
+)
+
+# Readiness probes (core.health): each probe gets HEALTH_CHECK_TIMEOUT
+# seconds and results are reused for HEALTH_CHECK_TTL seconds.
+HEALTH_CHECK_TIMEOUT = float(os.environ.get('HEALTH_CHECK_TIMEOUT', 1.0))
+HEALTH_CHECK_TTL = float(os.environ.get('HEALTH_CHECK_TTL', 2.0))
+
+# Per-process metric files, summed by the /api/metrics endpoint. Every
+# uWSGI worker must see the same directory.
+METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/recipe-app-metrics')
+
+# /api/metrics answers only clients whose address is in one of these
+# networks and, when METRICS_TOKEN is set, that send it as a bearer token.
+# Behind nginx the address is the one nginx passes on, so list the scraper
+# network here as well as in the proxy's allow-list.
+METRICS_ALLOWED_NETWORKS = [
+    network.strip() for network in os.environ.get(
+        'METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128',
+    ).split(',') if network.strip()
+]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+RECIPE_PAGE_SIZE = int(os.environ.get('RECIPE_PAGE_SIZE', 50))
+RECIPE_MAX_PAGE_SIZE = int(os.environ.get('RECIPE_MAX_PAGE_SIZE', 500))
+
 SPECTACULAR_SETTINGS = {
 
     'COMPONENT_SPLIT_REQUEST': True
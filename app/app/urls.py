@@ -27,6 +27,9 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
     path('api/helath-check', core_views.health_check, name='health-check'),
+    path('api/health/live', core_views.health_check, name='health-live'),
+    path('api/health/ready', core_views.readiness, name='health-ready'),
+    path('api/metrics', core_views.prometheus_metrics, name='metrics'),
     path(
         'api/docs/',
         SpectacularSwaggerView.as_view(url_name='api-schema'),
@@ -0,0 +1,196 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import itertools
+import json
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from recipe import counts
+
+BATCH_SIZE = 10000
+
+# Accounts made by seed_bench, heaviest first, all sharing one password.
+BENCH_USER_EMAIL = 'bench-user-{}@example.com'
+BENCH_PASSWORD = 'benchpass123'
+
+# Vocabulary for generated titles, descriptions and names, most common
+# first so word frequencies follow the same Zipf curve as the links.
+WORDS = (
+    'chicken garlic onion tomato rice pasta cheese lemon butter potato '
+    'beef pepper soup salad curry bread egg mushroom spinach bean '
+    'ginger basil chili carrot pork noodle coconut yogurt honey apple '
+    'salmon tofu lentil corn cumin mint avocado lime shrimp oat '
+    'almond cinnamon cabbage pumpkin chickpea walnut fennel saffron '
+    'tarragon quince'
+).split()
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of samples (nearest-rank)."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """Summarize timing samples given in seconds as milliseconds."""
+    millis = [s * 1000 for s in samples]
+    return {
+        'n': len(millis),
+        'mean_ms': round(statistics.fmean(millis), 3) if millis else 0.0,
+        'p50_ms': round(percentile(millis, 50), 3),
+        'p95_ms': round(percentile(millis, 95), 3),
+        'p99_ms': round(percentile(millis, 99), 3),
+        'max_ms': round(max(millis), 3) if millis else 0.0,
+    }
+
+
+def time_call(fn, repeat, warmup=1):
+    """Call fn warmup + repeat times and return the timed samples."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def zipf_weights(n, skew=1.1):
+    """Return cumulative Zipf weights for picking one of n items."""
+    return list(itertools.accumulate(1 / (i ** skew) for i in range(1, n + 1)))
+
+
+def skewed_sample(rng, population, cum_weights, k):
+    """Pick k distinct items from population following cum_weights."""
+    k = min(k, len(population))
+    picked = set()
+    while len(picked) < k:
+        picked.update(rng.choices(population, cum_weights=cum_weights, k=k))
+    return rng.sample(sorted(picked), k)
+
+
+def get_bench_user(email):
+    """Return the user owning benchmark data, creating it if needed."""
+    user_model = get_user_model()
+    user = user_model.objects.filter(email=email).first()
+    if user is None:
+        user = user_model.objects.create_user(email=email, name='Benchmark')
+    return user
+
+
+def auth_header(user):
+    """Return request headers authenticating as user with a token."""
+    token, _ = Token.objects.get_or_create(user=user)
+    return {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+
+@contextmanager
+def api_client(user=None):
+    """Yield an API client, sending the user's token if one is given.
+
+    Requests run through the full middleware and authentication stack,
+    as a remote client's would.
+    """
+    client = APIClient()
+    if user is not None:
+        client.credentials(**auth_header(user))
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        yield client
+
+
+def make_rng(seed):
+    """Return a seeded random generator so runs are comparable."""
+    return random.Random(seed)
+
+
+def write_report(path, report):
+    """Write a benchmark report as JSON."""
+    with open(path, 'w') as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
+
+
+def random_text(rng, cum_weights, k):
+    """Return k vocabulary words drawn following cum_weights."""
+    return ' '.join(rng.choices(WORDS, cum_weights=cum_weights, k=k))
+
+
+def _link(through, field, recipes, target_ids, rows_total, rng):
+    """Spread rows_total skewed links from recipes to target_ids."""
+    if not recipes or not target_ids:
+        return
+    weights = zipf_weights(len(target_ids))
+    per_recipe, extra = divmod(rows_total, len(recipes))
+    rows = []
+    for i, recipe in enumerate(recipes):
+        count = per_recipe + (1 if i < extra else 0)
+        for target_id in skewed_sample(rng, target_ids, weights, count):
+            rows.append(through(recipe_id=recipe.id, **{field: target_id}))
+        if len(rows) >= BATCH_SIZE:
+            through.objects.bulk_create(rows)
+            rows = []
+    through.objects.bulk_create(rows)
+
+
+def seed_recipes(user, rng, recipes, tags=0, tag_links=0,
+                 ingredients=0, ingredient_links=0):
+    """Replace a user's recipes, tags and ingredients with skewed data.
+
+    Rows are bulk inserted, so no signals fire. Recipe counts are
+    recomputed here, since deleting with stale counts fails their check
+    constraint; callers refresh any other derived state themselves.
+    Returns the created recipes.
+    """
+    word_weights = zipf_weights(len(WORDS))
+    with transaction.atomic():
+        Recipe.objects.filter(user=user).delete()
+        Tag.objects.filter(user=user).delete()
+        Ingredient.objects.filter(user=user).delete()
+        tag_objs = Tag.objects.bulk_create(
+            Tag(user=user, name=f'{WORDS[i % len(WORDS)]} {i}')
+            for i in range(tags)
+        )
+        ingredient_objs = Ingredient.objects.bulk_create(
+            Ingredient(user=user, name=f'{WORDS[i % len(WORDS)]} {i}')
+            for i in range(ingredients)
+        )
+        recipe_objs = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    user=user,
+                    title=random_text(rng, word_weights, 3).capitalize(),
+                    description=random_text(rng, word_weights, 12),
+                    time_minutes=rng.randint(5, 180),
+                    price=Decimal(rng.randint(100, 9999)) / 100,
+                )
+                for _ in range(recipes)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+    _link(
+        Recipe.tags.through, 'tag_id', recipe_objs,
+        [tag.id for tag in tag_objs], tag_links, rng,
+    )
+    _link(
+        Recipe.ingredients.through, 'ingredient_id', recipe_objs,
+        [ingredient.id for ingredient in ingredient_objs],
+        ingredient_links, rng,
+    )
+    counts.recount(Tag, Tag.objects.filter(user=user))
+    counts.recount(Ingredient, Ingredient.objects.filter(user=user))
+    return recipe_objs
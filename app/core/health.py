@@ -0,0 +1,170 @@
+"""
+Dependency probes behind the readiness endpoint.
+
+Each probe checks one dependency and raises when it is unusable. Probes
+run concurrently on a small thread pool, each bounded by a timeout, so a
+readiness check takes as long as its slowest probe. Results are kept for
+HEALTH_CHECK_TTL seconds and concurrent callers share one run, so load
+balancer polling from many sources costs at most one round of probes per
+TTL per worker.
+
+A probe that times out keeps its pool thread until it returns; while it
+does, later checks report it as timed out instead of queueing another.
+"""
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+PROBE_KEY = 'health:probe'
+
+_pool = {'executor': None}
+_pool_lock = threading.Lock()
+_running = {}
+_cached = {'at': None, 'result': None}
+_check_lock = threading.Lock()
+
+
+def check_database(alias='default'):
+    """Run a trivial query on a fresh connection to a database."""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    finally:
+        # Pool threads own their connections; never keep one open.
+        connection.close()
+
+
+def connect_database(alias='default', timeout=None):
+    """Open a raw connection to a database, run SELECT 1 and close it.
+
+    This bypasses Django's connection handling and system checks, and on
+    Postgres bounds the connect with libpq's connect_timeout, which takes
+    whole seconds.
+    """
+    connection = connections[alias]
+    params = connection.get_connection_params()
+    if timeout is not None and connection.vendor == 'postgresql':
+        params['connect_timeout'] = max(1, math.ceil(timeout))
+    raw = connection.Database.connect(**params)
+    try:
+        cursor = raw.cursor()
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    finally:
+        raw.close()
+
+
+def check_cache(alias='default'):
+    """Write, read back and delete a key in a cache."""
+    cache = caches[alias]
+    value = os.urandom(8).hex()
+    cache.set(PROBE_KEY, value, 10)
+    try:
+        if cache.get(PROBE_KEY) != value:
+            raise RuntimeError('Cache did not return the value written.')
+    finally:
+        cache.delete(PROBE_KEY)
+
+
+def check_media(root=None):
+    """Create and remove a file in the media directory."""
+    with tempfile.NamedTemporaryFile(
+        dir=root or settings.MEDIA_ROOT, prefix='.health-',
+    ) as fh:
+        fh.write(b'ok')
+        fh.flush()
+
+
+def default_probes():
+    """Return the probes readiness depends on, keyed by name."""
+    return {
+        'database': check_database,
+        'cache': check_cache,
+        'media': check_media,
+    }
+
+
+def _executor():
+    with _pool_lock:
+        if _pool['executor'] is None:
+            _pool['executor'] = ThreadPoolExecutor(
+                max_workers=4, thread_name_prefix='health',
+            )
+        return _pool['executor']
+
+
+def _timed(probe):
+    """Run a probe; return its duration and the error it raised, if any."""
+    start = time.perf_counter()
+    try:
+        probe()
+    except Exception as exc:
+        return time.perf_counter() - start, f'{type(exc).__name__}: {exc}'
+    return time.perf_counter() - start, None
+
+
+def run_probes(probes, timeout):
+    """Run probes concurrently; return each one's outcome by name.
+
+    Outcomes hold ``ok``, ``latency_ms`` and, on failure, ``error``.
+    """
+    start = time.perf_counter()
+    futures = {}
+    results = {}
+    for name, probe in probes.items():
+        previous = _running.get(name)
+        if previous is not None and not previous.done():
+            results[name] = {
+                'ok': False,
+                'latency_ms': None,
+                'error': 'Previous probe has not finished.',
+            }
+            continue
+        futures[name] = _running[name] = _executor().submit(_timed, probe)
+    wait(futures.values(), timeout=timeout)
+    for name, future in futures.items():
+        if not future.done():
+            results[name] = {
+                'ok': False,
+                'latency_ms': round((time.perf_counter() - start) * 1000, 3),
+                'error': f'Timed out after {timeout}s.',
+            }
+            continue
+        seconds, error = future.result()
+        results[name] = {
+            'ok': error is None,
+            'latency_ms': round(seconds * 1000, 3),
+        }
+        if error is not None:
+            results[name]['error'] = error
+    return results
+
+
+def readiness():
+    """Return (ready, probe outcomes), reusing results for the TTL."""
+    with _check_lock:
+        now = time.monotonic()
+        at = _cached['at']
+        if at is None or now - at >= settings.HEALTH_CHECK_TTL:
+            _cached['result'] = run_probes(
+                default_probes(), settings.HEALTH_CHECK_TIMEOUT,
+            )
+            _cached['at'] = time.monotonic()
+        results = _cached['result']
+    return all(result['ok'] for result in results.values()), results
+
+
+def reset():
+    """Forget cached results."""
+    with _check_lock:
+        _cached['at'] = None
+        _cached['result'] = None
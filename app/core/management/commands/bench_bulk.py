@@ -0,0 +1,180 @@
+"""
+Django command to benchmark the bulk recipe endpoint against single writes.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+from core import bench
+from core.models import Ingredient, Recipe, Tag
+
+
+def make_payloads(rng, count, tags, ingredients):
+    """Return count recipe payloads naming skewed tags and ingredients."""
+    word_weights = bench.zipf_weights(len(bench.WORDS))
+    tag_weights = bench.zipf_weights(len(tags))
+    ingredient_weights = bench.zipf_weights(len(ingredients))
+    return [
+        {
+            'title': bench.random_text(rng, word_weights, 3).capitalize(),
+            'time_minutes': rng.randint(5, 180),
+            'price': f'{rng.randint(100, 9999) / 100:.2f}',
+            'tags': [
+                {'name': name}
+                for name in bench.skewed_sample(rng, tags, tag_weights, 3)
+            ],
+            'ingredients': [
+                {'name': name}
+                for name in bench.skewed_sample(
+                    rng, ingredients, ingredient_weights, 8,
+                )
+            ],
+        }
+        for _ in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    """Time creating, updating and deleting recipes one by one and in bulk."""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', default='bench-bulk@example.com')
+        parser.add_argument('--sizes', default='1000,10000')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=100)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument(
+            '--single-limit', type=int, default=1000,
+            help='Most recipes written one by one per size; the rest of '
+                 'the size is extrapolated from their rate.',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write JSON report to file.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        rng = bench.make_rng(options['seed'])
+        user = bench.get_bench_user(options['email'])
+        words = bench.WORDS
+        tags = [f'{words[i % len(words)]} {i}' for i in range(options['tags'])]
+        ingredients = [
+            f'{words[i % len(words)]} {i}'
+            for i in range(options['ingredients'])
+        ]
+
+        results = []
+        with bench.api_client(user) as client:
+            for size in map(int, options['sizes'].split(',')):
+                payloads = make_payloads(rng, size, tags, ingredients)
+                single = min(size, options['single_limit'])
+                for mode, count, fn in (
+                    ('single', single, self._single),
+                    ('bulk', size, self._bulk),
+                ):
+                    self._reset(user)
+                    timings = fn(client, payloads[:count], options)
+                    for op, seconds in timings.items():
+                        row = {
+                            'mode': mode,
+                            'operation': op,
+                            'recipes': size,
+                            'measured': count,
+                            'seconds': round(seconds * size / count, 3),
+                            'recipes_per_s': round(count / seconds, 1),
+                        }
+                        results.append(row)
+                        self.stdout.write(
+                            f"{mode:>6} {op:>6} n={size} "
+                            f"{row['seconds']}s "
+                            f"({row['recipes_per_s']} recipes/s)"
+                        )
+        self._reset(user)
+
+        if options['output']:
+            bench.write_report(options['output'], {
+                'benchmark': 'bulk',
+                'batch_size': options['batch_size'],
+                'results': results,
+            })
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def _reset(self, user):
+        Recipe.objects.filter(user=user).delete()
+        Tag.objects.filter(user=user).delete()
+        Ingredient.objects.filter(user=user).delete()
+
+    def _check(self, res, expected):
+        if res.status_code != expected:
+            raise RuntimeError(
+                f'{res.request["REQUEST_METHOD"]} returned '
+                f'{res.status_code}: {res.content[:200]!r}'
+            )
+
+    def _single(self, client, payloads, options):
+        """Write each recipe with its own request."""
+        timings = {}
+        start = time.perf_counter()
+        ids = []
+        for payload in payloads:
+            res = client.post(
+                reverse('recipe:recipe-list'), payload, format='json',
+            )
+            self._check(res, 201)
+            ids.append(res.data['id'])
+        timings['create'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for recipe_id, payload in zip(ids, payloads):
+            res = client.patch(
+                reverse('recipe:recipe-detail', args=[recipe_id]),
+                {'time_minutes': payload['time_minutes'] + 1,
+                 'tags': payload['tags'][:2]},
+                format='json',
+            )
+            self._check(res, 200)
+        timings['update'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for recipe_id in ids:
+            res = client.delete(
+                reverse('recipe:recipe-detail', args=[recipe_id]),
+            )
+            self._check(res, 204)
+        timings['delete'] = time.perf_counter() - start
+        return timings
+
+    def _bulk(self, client, payloads, options):
+        """Write the recipes in requests of batch_size items."""
+        url = reverse('recipe:recipe-bulk')
+        step = options['batch_size']
+        batches = [
+            payloads[i:i + step] for i in range(0, len(payloads), step)
+        ]
+        timings = {}
+        start = time.perf_counter()
+        ids = []
+        for batch in batches:
+            res = client.post(url, batch, format='json')
+            self._check(res, 201)
+            ids.extend(item['id'] for item in res.data)
+        timings['create'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for offset, batch in zip(range(0, len(ids), step), batches):
+            res = client.patch(url, [
+                {'id': recipe_id,
+                 'time_minutes': payload['time_minutes'] + 1,
+                 'tags': payload['tags'][:2]}
+                for recipe_id, payload in zip(ids[offset:], batch)
+            ], format='json')
+            self._check(res, 200)
+        timings['update'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for offset in range(0, len(ids), step):
+            res = client.delete(url, ids[offset:offset + step], format='json')
+            self._check(res, 204)
+        timings['delete'] = time.perf_counter() - start
+        return timings
@@ -0,0 +1,88 @@
+"""
+Django command to benchmark the recipe tag filter plans.
+"""
+from django.core.management.base import BaseCommand
+
+from core import bench
+from core.models import Recipe, Tag
+from recipe.filters import TAGS_MODE_ALL, TAGS_MODE_ANY, filter_by_tags
+
+
+class Command(BaseCommand):
+    """Seed a large recipe/tag through table and time the filter plans."""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', default='bench-filters@example.com')
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--tags', type=int, default=500)
+        parser.add_argument('--through-rows', type=int, default=1000000)
+        parser.add_argument('--filter-sizes', default='1,3,5')
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--reseed', action='store_true')
+        parser.add_argument('--explain', action='store_true')
+        parser.add_argument('--output', help='Write JSON report to file.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        rng = bench.make_rng(options['seed'])
+        user = bench.get_bench_user(options['email'])
+        through = Recipe.tags.through
+        seeded = through.objects.filter(recipe__user=user).count()
+        if options['reseed'] or seeded != options['through_rows']:
+            self._seed(user, rng, options)
+
+        tag_ids = list(
+            Tag.objects.filter(user=user).order_by('id')
+            .values_list('id', flat=True)
+        )
+        results = []
+        for size in map(int, options['filter_sizes'].split(',')):
+            # Draw from the most popular tags so "all" has matches.
+            filter_ids = tag_ids[:size]
+            for mode in ('join_distinct', TAGS_MODE_ANY, TAGS_MODE_ALL):
+                queryset = self._queryset(user, filter_ids, mode)
+                page = queryset.values_list('id', flat=True)
+                page = page[:options['page_size']]
+                samples = bench.time_call(
+                    lambda: list(page.all()), options['repeat'],
+                )
+                row = {'mode': mode, 'filter_tags': size}
+                row.update(bench.summarize(samples))
+                results.append(row)
+                self.stdout.write(
+                    f"{mode:>14} tags={size} "
+                    f"p50={row['p50_ms']}ms p95={row['p95_ms']}ms"
+                )
+                if options['explain']:
+                    self.stdout.write(page.explain(analyze=True))
+
+        if options['output']:
+            bench.write_report(options['output'], {
+                'benchmark': 'filters',
+                'through_rows': options['through_rows'],
+                'recipes': options['recipes'],
+                'results': results,
+            })
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def _queryset(self, user, tag_ids, mode):
+        """Build the list queryset the recipe API would run."""
+        queryset = Recipe.objects.filter(user=user)
+        if mode == 'join_distinct':
+            queryset = queryset.filter(tags__id__in=tag_ids).distinct()
+        else:
+            queryset = filter_by_tags(queryset, tag_ids, mode)
+        return queryset.order_by('-id')
+
+    def _seed(self, user, rng, options):
+        """Replace the benchmark user's recipes with a skewed data set."""
+        self.stdout.write('Seeding benchmark data...')
+        bench.seed_recipes(
+            user, rng,
+            recipes=options['recipes'],
+            tags=options['tags'],
+            tag_links=options['through_rows'],
+        )
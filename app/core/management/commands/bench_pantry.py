@@ -0,0 +1,101 @@
+"""
+Django command to benchmark pantry matching against a naive scan.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import bench
+from core.models import Ingredient, Recipe
+from recipe import pantry
+
+
+def naive_matches(user_id, available, limit):
+    """Rank recipes by iterating Recipe.ingredients, for comparison."""
+    scored = []
+    recipes = Recipe.objects.filter(user_id=user_id).prefetch_related(
+        'ingredients',
+    )
+    for recipe in recipes:
+        ingredient_ids = {i.id for i in recipe.ingredients.all()}
+        if ingredient_ids & available:
+            coverage = len(ingredient_ids & available) / len(ingredient_ids)
+            scored.append((coverage, recipe.id))
+    return sorted(scored, reverse=True)[:limit]
+
+
+class Command(BaseCommand):
+    """Seed a large recipe set and time pantry lookups."""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', default='bench-pantry@example.com')
+        parser.add_argument('--recipes', type=int, default=50000)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--ingredient-links', type=int, default=400000)
+        parser.add_argument('--pantry-sizes', default='5,10,20')
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--baseline-repeat', type=int, default=3,
+            help='Runs of the naive scan per pantry size, 0 to skip.',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--reseed', action='store_true')
+        parser.add_argument('--output', help='Write JSON report to file.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        rng = bench.make_rng(options['seed'])
+        user = bench.get_bench_user(options['email'])
+        seeded = Recipe.objects.filter(user=user).count()
+        if options['reseed'] or seeded != options['recipes']:
+            self.stdout.write('Seeding benchmark data...')
+            bench.seed_recipes(
+                user, rng,
+                recipes=options['recipes'],
+                ingredients=options['ingredients'],
+                ingredient_links=options['ingredient_links'],
+            )
+
+        pantry.clear_indexes()
+        start = time.perf_counter()
+        pantry.get_index(user.id)
+        build_ms = round((time.perf_counter() - start) * 1000, 3)
+        self.stdout.write(f'index build {build_ms}ms')
+
+        ingredient_ids = list(
+            Ingredient.objects.filter(user=user).order_by('id')
+            .values_list('id', flat=True)
+        )
+        weights = bench.zipf_weights(len(ingredient_ids))
+        results = []
+        for size in map(int, options['pantry_sizes'].split(',')):
+            available = set(
+                bench.skewed_sample(rng, ingredient_ids, weights, size)
+            )
+            runs = [('index', options['repeat'], lambda: pantry.find_matches(
+                user.id, available, limit=options['limit'],
+            ))]
+            if options['baseline_repeat']:
+                runs.append(('naive', options['baseline_repeat'], lambda: (
+                    naive_matches(user.id, available, options['limit'])
+                )))
+            for mode, repeat, fn in runs:
+                samples = bench.time_call(fn, repeat)
+                row = {'mode': mode, 'pantry_size': size}
+                row.update(bench.summarize(samples))
+                results.append(row)
+                self.stdout.write(
+                    f"{mode:>6} pantry={size} "
+                    f"p50={row['p50_ms']}ms p95={row['p95_ms']}ms"
+                )
+
+        if options['output']:
+            bench.write_report(options['output'], {
+                'benchmark': 'pantry',
+                'recipes': options['recipes'],
+                'index_build_ms': build_ms,
+                'results': results,
+            })
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
@@ -0,0 +1,114 @@
+"""
+Django command to benchmark recipe search on both backends.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import bench
+from core.models import Recipe
+from recipe import search
+
+REFRESH_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    """Seed a large recipe set and time ranked search queries."""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', default='bench-search@example.com')
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--tags', type=int, default=300)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--tag-links', type=int, default=300000)
+        parser.add_argument('--ingredient-links', type=int, default=800000)
+        parser.add_argument(
+            '--queries', help='Comma separated search texts to time.',
+        )
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--reseed', action='store_true')
+        parser.add_argument('--explain', action='store_true')
+        parser.add_argument('--output', help='Write JSON report to file.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        rng = bench.make_rng(options['seed'])
+        user = bench.get_bench_user(options['email'])
+        seeded = Recipe.objects.filter(user=user).count()
+        if options['reseed'] or seeded != options['recipes']:
+            self._seed(user, rng, options)
+
+        if options['queries']:
+            queries = options['queries'].split(',')
+        else:
+            # A common word, a rare word and a two word query.
+            words = bench.WORDS
+            queries = [words[0], words[-1], f'{words[2]} {words[7]}']
+
+        backends = [search.BACKEND_PYTHON]
+        if connection.vendor == 'postgresql':
+            backends.insert(0, search.BACKEND_POSTGRES)
+
+        search.clear_indexes()
+        start = time.perf_counter()
+        search.get_index(user.id)
+        build_ms = round((time.perf_counter() - start) * 1000, 3)
+        self.stdout.write(f'python index build {build_ms}ms')
+
+        results = []
+        base = Recipe.objects.filter(user=user)
+        for backend in backends:
+            for text in queries:
+                def first_page(backend=backend, text=text):
+                    # Ranking runs inside search_recipes on the Python
+                    # backend, so it is part of what is timed.
+                    page = search.search_recipes(
+                        base, user.id, text, backend,
+                        limit=options['page_size'],
+                    )
+                    return page.values_list('id', flat=True)[
+                        :options['page_size']
+                    ]
+
+                samples = bench.time_call(
+                    lambda: list(first_page()), options['repeat'],
+                )
+                row = {'backend': backend, 'query': text}
+                row.update(bench.summarize(samples))
+                results.append(row)
+                self.stdout.write(
+                    f"{backend:>8} {text!r:>20} "
+                    f"p50={row['p50_ms']}ms p95={row['p95_ms']}ms"
+                )
+                if options['explain']:
+                    self.stdout.write(first_page().explain(analyze=True))
+
+        if options['output']:
+            bench.write_report(options['output'], {
+                'benchmark': 'search',
+                'recipes': options['recipes'],
+                'python_index_build_ms': build_ms,
+                'results': results,
+            })
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def _seed(self, user, rng, options):
+        """Replace the benchmark user's recipes and index their text."""
+        self.stdout.write('Seeding benchmark data...')
+        recipes = bench.seed_recipes(
+            user, rng,
+            recipes=options['recipes'],
+            tags=options['tags'],
+            tag_links=options['tag_links'],
+            ingredients=options['ingredients'],
+            ingredient_links=options['ingredient_links'],
+        )
+        recipe_ids = [recipe.id for recipe in recipes]
+        for i in range(0, len(recipe_ids), REFRESH_BATCH_SIZE):
+            search.refresh_search_vectors(
+                recipe_ids[i:i + REFRESH_BATCH_SIZE]
+            )
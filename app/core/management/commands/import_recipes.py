@@ -0,0 +1,135 @@
+"""
+Django command to bulk import recipes from NDJSON or CSV files.
+"""
+import json
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe import export, importer
+
+
+def read_checkpoint(path):
+    """Return rows already imported per file, keyed by absolute path."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as fh:
+        return json.load(fh).get('files', {})
+
+
+def write_checkpoint(path, files):
+    """Atomically record rows imported per file."""
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump({'files': files}, fh, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+class Command(BaseCommand):
+    """Stream recipe files into the database in batched transactions."""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+        parser.add_argument(
+            '--user',
+            help='Email owning rows without a "user" field.',
+        )
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='Create users named by rows that do not exist yet.',
+        )
+        parser.add_argument(
+            '--format', dest='file_format', choices=export.FORMATS,
+            help='File format; guessed from the extension by default.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--checkpoint',
+            help='JSON file recording progress; rerun to resume from it.',
+        )
+        parser.add_argument(
+            '--max-errors', type=int, default=100,
+            help='Abort after this many invalid rows.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        default_user = None
+        if options['user']:
+            default_user = get_user_model().objects.filter(
+                email=options['user'],
+            ).first()
+            if default_user is None:
+                raise CommandError(f"Unknown user {options['user']!r}.")
+        self.loader = importer.Loader(default_user, options['create_users'])
+        self.options = options
+        self.errors = 0
+        self.checkpoint = read_checkpoint(options['checkpoint'])
+
+        start = time.perf_counter()
+        total = 0
+        for path in options['files']:
+            total += self._import_file(path)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} recipes in {elapsed:.1f}s '
+            f'({total / elapsed if elapsed else 0:.0f} rows/s), '
+            f'{self.errors} rows skipped.'
+        ))
+
+    def _import_file(self, path):
+        """Import one file, skipping rows a checkpoint already covers."""
+        file_format = self.options['file_format'] or importer.guess_format(
+            path,
+        )
+        if file_format is None:
+            raise CommandError(f'Cannot tell the format of {path}.')
+        key = os.path.abspath(path)
+        done = self.checkpoint.get(key, 0)
+        if done:
+            self.stdout.write(f'{path}: resuming after {done} rows')
+
+        imported = 0
+        read = 0
+        flushed = done
+        batch = []
+        start = time.perf_counter()
+        with open(path, newline='', encoding='utf-8') as fh:
+            for line_num, row in importer.read_rows(fh, file_format):
+                read += 1
+                if read <= done:
+                    continue
+                try:
+                    batch.append(self.loader.prepare(row))
+                except importer.RowError as exc:
+                    self._skip(path, line_num, exc)
+                if len(batch) >= self.options['batch_size']:
+                    imported += self._flush(batch, key, read, done, start)
+                    batch = []
+                    flushed = read
+            # Also checkpoint past invalid rows trailing the last batch.
+            if read > flushed:
+                imported += self._flush(batch, key, read, done, start)
+        return imported
+
+    def _skip(self, path, line_num, exc):
+        self.errors += 1
+        self.stderr.write(f'{path}:{line_num}: {exc}')
+        if self.errors > self.options['max_errors']:
+            raise CommandError('Too many invalid rows, aborting.')
+
+    def _flush(self, batch, key, read, done, start):
+        """Load a batch, then checkpoint and report progress."""
+        imported = len(self.loader.load(batch))
+        if self.options['checkpoint']:
+            self.checkpoint[key] = read
+            write_checkpoint(self.options['checkpoint'], self.checkpoint)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{os.path.basename(key)}: {read} rows read, '
+            f'{(read - done) / elapsed if elapsed else 0:.0f} rows/s'
+        )
+        return imported
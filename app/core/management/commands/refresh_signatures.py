@@ -0,0 +1,47 @@
+"""
+Django command to compute MinHash signatures for similar recipes.
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from core.models import Recipe
+from recipe import similar
+
+
+def missing_signatures():
+    """Return recipes with tags or ingredients but no stored signature."""
+    return Recipe.objects.filter(minhash__isnull=True).filter(
+        Exists(Recipe.tags.through.objects.filter(recipe=OuterRef('pk')))
+        | Exists(
+            Recipe.ingredients.through.objects.filter(recipe=OuterRef('pk'))
+        )
+    )
+
+
+class Command(BaseCommand):
+    """Compute MinHash signatures and LSH buckets of recipes missing them.
+
+    Run after migrating; with --all, recompute every recipe, as needed
+    when the signature or band scheme changes.
+    """
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Recompute every recipe, not only those missing one.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        recipes = Recipe.objects.all() if options['all'] else (
+            missing_signatures()
+        )
+        recipe_ids = list(recipes.order_by('id').values_list('id', flat=True))
+        size = options['batch_size']
+        for start in range(0, len(recipe_ids), size):
+            similar.refresh_signatures(recipe_ids[start:start + size])
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed signatures of {len(recipe_ids)} recipes.'
+        ))
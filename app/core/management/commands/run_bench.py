@@ -0,0 +1,182 @@
+"""
+Django command to benchmark the REST API routes on seeded data.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.urls import reverse
+
+from core import bench
+from core.models import Ingredient, Recipe, Tag
+from recipe import cache
+
+ROUTES = (
+    'recipe-list', 'recipe-list-tags', 'recipe-list-ingredients',
+    'recipe-list-search', 'recipe-detail', 'user-token', 'user-me',
+)
+
+
+class QueryCounter:
+    """Count queries run on a connection while installed as its wrapper."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    """Time the API routes for seed_bench users, weighted by their data."""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--routes', default=','.join(ROUTES),
+            help=f'Comma separated subset of: {", ".join(ROUTES)}.',
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--label', help='Stored in the report, e.g. a commit hash.',
+        )
+        parser.add_argument('--output', help='Write JSON report to file.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        routes = options['routes'].split(',')
+        unknown = set(routes) - set(ROUTES)
+        if unknown:
+            raise CommandError(
+                f'Unknown routes: {", ".join(sorted(unknown))}.'
+            )
+        self.rng = bench.make_rng(options['seed'])
+        users = list(
+            get_user_model().objects.filter(
+                email__startswith=bench.BENCH_USER_EMAIL.split('{')[0],
+            ).annotate(recipes=Count('recipe')).filter(recipes__gt=0)
+        )
+        if not users:
+            raise CommandError('No benchmark data; run seed_bench first.')
+        # Users with more recipes send proportionally more requests.
+        self.users = users
+        self.weights = [user.recipes for user in users]
+        self.headers = {user.pk: bench.auth_header(user) for user in users}
+        self.recipe_ids = {}
+        self.top_ids = {}
+
+        results = []
+        with bench.api_client() as client:
+            for route in routes:
+                row = self._run(client, route, options)
+                results.append(row)
+                self.stdout.write(
+                    f"{route:>24} p50={row['p50_ms']}ms "
+                    f"p95={row['p95_ms']}ms p99={row['p99_ms']}ms "
+                    f"queries={row['queries_mean']} "
+                    f"bytes={row['bytes_mean']}"
+                )
+
+        if options['output']:
+            bench.write_report(options['output'], {
+                'benchmark': 'api',
+                'label': options['label'],
+                'database': connection.vendor,
+                'users': len(users),
+                'recipes': sum(self.weights),
+                'results': results,
+            })
+        self.stdout.write(self.style.SUCCESS('Benchmark complete.'))
+
+    def _run(self, client, route, options):
+        """Send warmup and timed requests for a route; summarize them."""
+        for _ in range(options['warmup']):
+            self._send(client, route, self._request(route))
+        samples = []
+        queries = []
+        sizes = []
+        hits = cache.get_stats()['hits']
+        for _ in range(options['requests']):
+            request = self._request(route)
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                size = self._send(client, route, request)
+                samples.append(time.perf_counter() - start)
+            queries.append(counter.count)
+            sizes.append(size)
+        hits = cache.get_stats()['hits'] - hits
+
+        row = {'route': route}
+        row.update(bench.summarize(samples))
+        row.update({
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+            'bytes_mean': round(sum(sizes) / len(sizes)),
+            'bytes_max': max(sizes),
+            'cache_hit_ratio': round(hits / len(samples), 3),
+        })
+        return row
+
+    def _request(self, route):
+        """Return (method, path, data, headers) for a weighted random user.
+
+        Lookups the request needs run here, outside the timed section.
+        """
+        user = self.rng.choices(self.users, weights=self.weights)[0]
+        headers = self.headers[user.pk]
+        list_url = reverse('recipe:recipe-list')
+        if route == 'recipe-list':
+            return 'get', list_url, {}, headers
+        if route == 'recipe-list-tags':
+            return 'get', list_url, {'tags': self._top_ids(user, Tag)}, headers
+        if route == 'recipe-list-ingredients':
+            return 'get', list_url, {
+                'ingredients': self._top_ids(user, Ingredient),
+            }, headers
+        if route == 'recipe-list-search':
+            text = self.rng.choice(bench.WORDS[:10])
+            return 'get', list_url, {'search': text}, headers
+        if route == 'recipe-detail':
+            recipe_id = self.rng.choice(self._recipe_ids(user))
+            url = reverse('recipe:recipe-detail', args=[recipe_id])
+            return 'get', url, {}, headers
+        if route == 'user-token':
+            return 'post', reverse('user:token'), {
+                'email': user.email, 'password': bench.BENCH_PASSWORD,
+            }, {}
+        return 'get', reverse('user:me'), {}, headers
+
+    def _send(self, client, route, request):
+        """Send a request and return the response size in bytes."""
+        method, path, data, headers = request
+        res = getattr(client, method)(path, data, **headers)
+        if res.status_code != 200:
+            raise RuntimeError(
+                f'{route} returned {res.status_code}: {res.content[:200]!r}'
+            )
+        if res.streaming:
+            return sum(len(chunk) for chunk in res.streaming_content)
+        return len(res.content)
+
+    def _recipe_ids(self, user):
+        if user.pk not in self.recipe_ids:
+            self.recipe_ids[user.pk] = list(
+                Recipe.objects.filter(user=user).values_list('id', flat=True)
+            )
+        return self.recipe_ids[user.pk]
+
+    def _top_ids(self, user, model):
+        """Return the user's two most used ids of model as a filter value."""
+        key = (user.pk, model)
+        if key not in self.top_ids:
+            self.top_ids[key] = ','.join(
+                str(pk) for pk in model.objects.filter(user=user)
+                .order_by('-recipe_count').values_list('id', flat=True)[:2]
+            )
+        return self.top_ids[key]
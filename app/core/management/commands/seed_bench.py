@@ -0,0 +1,74 @@
+"""
+Django command to seed a skewed data set for the API benchmarks.
+"""
+from django.core.management.base import BaseCommand
+
+from core import bench
+from recipe import cache, search, similar
+
+REFRESH_BATCH_SIZE = 5000
+
+
+def split_skewed(total, n, skew):
+    """Split total into n Zipf-shaped shares, largest first."""
+    weights = [1 / (i ** skew) for i in range(1, n + 1)]
+    scale = total / sum(weights)
+    shares = [int(weight * scale) for weight in weights]
+    shares[0] += total - sum(shares)
+    return shares
+
+
+class Command(BaseCommand):
+    """Create users whose recipes, tags and ingredients follow Zipf curves."""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument(
+            '--tags', type=int, default=200, help='Tags per user.',
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=1000,
+            help='Ingredients per user.',
+        )
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Zipf exponent spreading recipes over users.',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        rng = bench.make_rng(options['seed'])
+        shares = split_skewed(
+            options['recipes'], options['users'], options['skew'],
+        )
+        for i, recipes in enumerate(shares):
+            user = bench.get_bench_user(bench.BENCH_USER_EMAIL.format(i))
+            user.set_password(bench.BENCH_PASSWORD)
+            user.save(update_fields=['password'])
+            seeded = bench.seed_recipes(
+                user, rng,
+                recipes=recipes,
+                tags=options['tags'],
+                tag_links=recipes * options['tags_per_recipe'],
+                ingredients=options['ingredients'],
+                ingredient_links=recipes * options['ingredients_per_recipe'],
+            )
+            self._refresh(user, [recipe.id for recipe in seeded])
+            self.stdout.write(f'{user.email}: {recipes} recipes')
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {options['recipes']} recipes for "
+            f"{options['users']} users."
+        ))
+
+    def _refresh(self, user, recipe_ids):
+        """Rebuild the state signals would have kept for bulk rows."""
+        for i in range(0, len(recipe_ids), REFRESH_BATCH_SIZE):
+            batch = recipe_ids[i:i + REFRESH_BATCH_SIZE]
+            similar.refresh_signatures(batch)
+            search.refresh_search_vectors(batch)
+        cache.bump_version(user.id)
@@ -1,25 +1,125 @@
 """
-Django command to wait for the database to be available
+Django command to wait for the database and other dependencies
 """
+import random
+import threading
 import time
-from psycopg2 import OperationalError as Pyscopg2OpError
-from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import health
+
+
+def wait_until_ready(probe, deadline, initial_delay, max_delay, rng,
+                     on_retry=None):
+    """Call probe until it stops raising; return (seconds, attempts).
+
+    Delays double from initial_delay up to max_delay, each drawn from the
+    upper half of its range so that workers starting together spread out.
+    Raises TimeoutError with the last error once deadline (a
+    time.monotonic() value) passes.
+    """
+    start = time.monotonic()
+    delay = initial_delay
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            probe()
+            return time.monotonic() - start, attempts
+        except Exception as exc:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f'{type(exc).__name__}: {exc}') from exc
+            sleep = min(rng.uniform(delay / 2, delay), remaining)
+            if on_retry is not None:
+                on_retry(exc, sleep)
+            time.sleep(sleep)
+            delay = min(delay * 2, max_delay)
 
 
 class Command(BaseCommand):
     """Django Command to wait for database"""
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--wait-for', default='database',
+            help='Comma separated dependencies from: database, cache, '
+                 'media. They are waited for concurrently.',
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=60.0,
+            help='Seconds to wait for everything before giving up.',
+        )
+        parser.add_argument(
+            '--connect-timeout', type=float, default=2.0,
+            help='Seconds allowed for each database connection attempt.',
+        )
+        parser.add_argument('--initial-delay', type=float, default=0.05)
+        parser.add_argument('--max-delay', type=float, default=2.0)
+
     def handle(self, *args, **options):
         """Entry point for command"""
-        self.stdout.write('Waiting for database...')
-        db_up = False
-        while db_up is False:
-            try:
-                self.check(databases=['default'])
-                db_up = True
-            except (Pyscopg2OpError, OperationalError):
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
-
-        self.stdout.write(self.style.SUCCESS('Database avaiable!'))
+        probes = {
+            'database': partial(
+                health.connect_database, 'default',
+                options['connect_timeout'],
+            ),
+            'cache': health.check_cache,
+            'media': health.check_media,
+        }
+        names = options['wait_for'].split(',')
+        unknown = set(names) - set(probes)
+        if unknown:
+            raise CommandError(
+                f'Unknown dependencies: {", ".join(sorted(unknown))}.'
+            )
+
+        self.stdout.write(f'Waiting for {", ".join(names)}...')
+        self._lock = threading.Lock()
+        start = time.monotonic()
+        deadline = start + options['timeout']
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            futures = {
+                name: executor.submit(
+                    self._wait, name, probes[name], deadline, options,
+                )
+                for name in names
+            }
+        failed = [
+            name for name, future in futures.items()
+            if future.exception() is not None
+        ]
+        if failed:
+            raise CommandError(
+                f"Timed out after {options['timeout']}s waiting for "
+                f"{', '.join(failed)}."
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Ready in {time.monotonic() - start:.2f}s.'
+        ))
+
+    def _wait(self, name, probe, deadline, options):
+        def on_retry(exc, sleep):
+            self._write(
+                f'{name} unavailable ({type(exc).__name__}), '
+                f'retrying in {sleep:.2f}s...'
+            )
+
+        try:
+            seconds, attempts = wait_until_ready(
+                probe, deadline, options['initial_delay'],
+                options['max_delay'], random.Random(), on_retry,
+            )
+        except TimeoutError as exc:
+            self._write(f'{name} still unavailable: {exc}')
+            raise
+        self._write(
+            f'{name} available after {seconds:.2f}s ({attempts} attempts)'
+        )
+
+    def _write(self, message):
+        with self._lock:
+            self.stdout.write(message)
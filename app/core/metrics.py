@@ -0,0 +1,294 @@
+"""
+Prometheus metrics shared by every uWSGI worker.
+
+Each process adds to float values in its own memory-mapped file under
+METRICS_DIR, named after its pid. Only the owning process writes a file,
+so no lock is held across processes; a scrape reads every file in the
+directory and sums them. Files of workers that have exited stay and keep
+their counts, so counters never go backwards while the server runs;
+``scripts/run.sh`` clears the directory on start.
+
+File layout: an 8 byte header holding the bytes in use, then entries of
+a 4 byte key length, the UTF-8 key padded to 8 bytes and a float64. A
+writer fills an entry in before moving the header past it, so readers
+only ever see whole entries.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+IMAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'http_request_duration_seconds': (
+        'histogram', 'Request latency by route and status class.',
+        REQUEST_BUCKETS,
+    ),
+    'db_queries_total': ('counter', 'Database queries by route.', None),
+    'db_query_duration_seconds_total': (
+        'counter', 'Time spent in database queries by route.', None,
+    ),
+    'cache_events_total': (
+        'counter', 'Response and token cache events by result.', None,
+    ),
+    'image_processing_duration_seconds': (
+        'histogram', 'Time to render recipe image variants.', IMAGE_BUCKETS,
+    ),
+}
+
+# Events counted as hits and misses for the derived cache_hit_ratio.
+CACHE_HIT_EVENTS = ('hits', 'shared_hits')
+CACHE_MISS_EVENTS = ('misses',)
+
+INITIAL_SIZE = 1 << 16
+
+_HEADER = struct.Struct('<I4x')
+_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+
+
+def _entries(data):
+    """Yield (key, value offset) for the entries of a store's bytes."""
+    used = _HEADER.unpack_from(data, 0)[0]
+    pos = _HEADER.size
+    while pos < used:
+        length = _LENGTH.unpack_from(data, pos)[0]
+        key_end = pos + _LENGTH.size + length
+        value_pos = key_end + (-key_end % 8)
+        yield bytes(data[pos + _LENGTH.size:key_end]).decode(), value_pos
+        pos = value_pos + _VALUE.size
+
+
+def read_file(path):
+    """Return the values stored in one file, keyed by encoded key."""
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    if len(data) < _HEADER.size:
+        return {}
+    return {
+        key: _VALUE.unpack_from(data, pos)[0]
+        for key, pos in _entries(data)
+    }
+
+
+class MmapStore:
+    """Float values keyed by string in a memory-mapped file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fh = open(path, 'a+b')
+        size = os.fstat(self._fh.fileno()).st_size
+        if size < _HEADER.size:
+            self._fh.truncate(INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self._map = mmap.mmap(self._fh.fileno(), size)
+        if _HEADER.unpack_from(self._map, 0)[0] == 0:
+            _HEADER.pack_into(self._map, 0, _HEADER.size)
+        self._positions = dict(_entries(self._map))
+
+    def _add_key(self, key):
+        encoded = key.encode()
+        used = _HEADER.unpack_from(self._map, 0)[0]
+        key_end = used + _LENGTH.size + len(encoded)
+        value_pos = key_end + (-key_end % 8)
+        end = value_pos + _VALUE.size
+        if end > len(self._map):
+            size = len(self._map)
+            while size < end:
+                size *= 2
+            self._map.close()
+            self._fh.truncate(size)
+            self._map = mmap.mmap(self._fh.fileno(), size)
+        _LENGTH.pack_into(self._map, used, len(encoded))
+        self._map[used + _LENGTH.size:key_end] = encoded
+        _VALUE.pack_into(self._map, value_pos, 0.0)
+        _HEADER.pack_into(self._map, 0, end)
+        self._positions[key] = value_pos
+        return value_pos
+
+    def inc(self, key, amount):
+        """Add amount to the value stored under key."""
+        with self._lock:
+            pos = self._positions.get(key)
+            if pos is None:
+                pos = self._add_key(key)
+            value = _VALUE.unpack_from(self._map, pos)[0]
+            _VALUE.pack_into(self._map, pos, value + amount)
+
+    def close(self):
+        self._map.close()
+        self._fh.close()
+
+
+_state = {'owner': None, 'store': None}
+_state_lock = threading.Lock()
+_keys = {}
+
+
+def _store():
+    """Return this process's store, reopening it after a fork."""
+    owner = (os.getpid(), settings.METRICS_DIR)
+    if _state['owner'] == owner:
+        return _state['store']
+    with _state_lock:
+        if _state['owner'] != owner:
+            previous = _state['store']
+            if previous is not None and _state['owner'][0] == owner[0]:
+                previous.close()
+            store = None
+            try:
+                os.makedirs(settings.METRICS_DIR, exist_ok=True)
+                store = MmapStore(
+                    os.path.join(settings.METRICS_DIR, f'{owner[0]}.db'),
+                )
+            except OSError:
+                logger.exception('Cannot open metrics store; not recording.')
+            # A store inherited through fork belongs to the parent and is
+            # left alone.
+            _state['store'] = store
+            _state['owner'] = owner
+    return _state['store']
+
+
+def _key(sample, labels):
+    """Return the encoded key of a sample and its label pairs."""
+    cache_key = (sample, labels)
+    key = _keys.get(cache_key)
+    if key is None:
+        key = _keys[cache_key] = json.dumps([sample, labels])
+    return key
+
+
+def inc(name, amount=1, **labels):
+    """Add amount to a counter."""
+    store = _store()
+    if store is not None:
+        store.inc(_key(name, tuple(sorted(labels.items()))), amount)
+
+
+def observe(name, value, **labels):
+    """Record one observation in a histogram."""
+    store = _store()
+    if store is None:
+        return
+    pairs = tuple(sorted(labels.items()))
+    for bound in METRICS[name][2]:
+        if value <= bound:
+            le = repr(bound)
+            break
+    else:
+        le = '+Inf'
+    store.inc(_key(f'{name}_bucket', pairs + (('le', le),)), 1)
+    store.inc(_key(f'{name}_sum', pairs), value)
+    store.inc(_key(f'{name}_count', pairs), 1)
+
+
+def observe_request(route, status, seconds, queries, db_seconds):
+    """Record a request's latency and database use."""
+    status_class = f'{status // 100}xx'
+    observe(
+        'http_request_duration_seconds', seconds,
+        route=route, status=status_class,
+    )
+    inc('db_queries_total', queries, route=route)
+    inc('db_query_duration_seconds_total', db_seconds, route=route)
+
+
+def collect(directory=None):
+    """Return values summed over every process's file.
+
+    Keys are (sample name, label pairs) tuples.
+    """
+    directory = directory or settings.METRICS_DIR
+    totals = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return totals
+    for name in names:
+        if not name.endswith('.db'):
+            continue
+        for key, value in read_file(os.path.join(directory, name)).items():
+            sample, labels = json.loads(key)
+            key = (sample, tuple(tuple(pair) for pair in labels))
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', '\\\\').replace('"', '\\"')
+        .replace('\n', '\\n')
+    )
+
+
+def _line(sample, labels, value):
+    if labels:
+        text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+        return f'{sample}{{{text}}} {float(value)!r}'
+    return f'{sample} {float(value)!r}'
+
+
+def _histogram_lines(name, buckets, totals):
+    label_sets = sorted({
+        labels for sample, labels in totals if sample == f'{name}_count'
+    })
+    for labels in label_sets:
+        cumulative = 0.0
+        for le in [repr(bound) for bound in buckets] + ['+Inf']:
+            le_labels = labels + (('le', le),)
+            cumulative += totals.get((f'{name}_bucket', le_labels), 0.0)
+            yield _line(f'{name}_bucket', le_labels, cumulative)
+        yield _line(f'{name}_sum', labels, totals[(f'{name}_sum', labels)])
+        yield _line(f'{name}_count', labels, totals[(f'{name}_count', labels)])
+
+
+def _cache_hit_ratios(totals):
+    events = {}
+    for (sample, labels), value in totals.items():
+        if sample == 'cache_events_total':
+            labels = dict(labels)
+            cache = events.setdefault(labels['cache'], {})
+            cache[labels['event']] = value
+    for cache, counts in sorted(events.items()):
+        hits = sum(counts.get(event, 0.0) for event in CACHE_HIT_EVENTS)
+        lookups = hits + sum(
+            counts.get(event, 0.0) for event in CACHE_MISS_EVENTS
+        )
+        if lookups:
+            yield _line('cache_hit_ratio', (('cache', cache),), hits / lookups)
+
+
+def render(directory=None):
+    """Return every metric in the Prometheus text format."""
+    totals = collect(directory)
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            lines.extend(_histogram_lines(name, buckets, totals))
+        else:
+            lines.extend(
+                _line(sample, labels, value)
+                for (sample, labels), value in sorted(totals.items())
+                if sample == name
+            )
+    lines.append('# HELP cache_hit_ratio Share of cache lookups that hit.')
+    lines.append('# TYPE cache_hit_ratio gauge')
+    lines.extend(_cache_hit_ratios(totals))
+    return '\n'.join(lines) + '\n'
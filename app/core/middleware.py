@@ -0,0 +1,186 @@
+"""
+Per-request timing and database instrumentation.
+
+Every request is timed and its queries on the default database are
+counted and timed through ``connection.execute_wrapper``, so the figures
+are there with DEBUG off. Totals go out in a ``Server-Timing`` header and
+into per-route latency histograms held in process. Requests slower than
+REQUEST_SLOW_MS are logged, sampled, with their SQL grouped by
+fingerprint.
+
+Streaming responses are measured up to the point the view returns, not
+while their body is sent.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets; a last bucket holds the
+# rest.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Statements kept per request for the slow log; counts and times cover all.
+MAX_RECORDED_QUERIES = 1000
+
+SLOW_LOG_TOP_QUERIES = 5
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+_routes = {}
+_routes_lock = threading.Lock()
+
+
+def fingerprint(sql):
+    """Return sql with literals and parameter lists normalized away."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class RouteStats:
+    """Latency histogram and database totals for one route."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.queries = 0
+        self.db_ms = 0.0
+
+    def add(self, total_ms, queries, db_ms):
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, total_ms)] += 1
+        self.count += 1
+        self.total_ms += total_ms
+        self.queries += queries
+        self.db_ms += db_ms
+
+    def as_dict(self):
+        return {
+            'buckets': dict(zip(
+                [str(bound) for bound in LATENCY_BUCKETS_MS] + ['+Inf'],
+                self.buckets,
+            )),
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'queries': self.queries,
+            'db_ms': round(self.db_ms, 3),
+        }
+
+
+def get_route_stats():
+    """Return a snapshot of the per-route statistics, keyed by route."""
+    with _routes_lock:
+        return {route: stats.as_dict() for route, stats in _routes.items()}
+
+
+def reset_route_stats():
+    """Forget the statistics gathered so far."""
+    with _routes_lock:
+        _routes.clear()
+
+
+class QueryRecorder:
+    """Count and time the queries run while installed as a wrapper."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if len(self.statements) < MAX_RECORDED_QUERIES:
+                self.statements.append((sql, elapsed))
+
+    def top_fingerprints(self, limit):
+        """Return (fingerprint, count, ms) for the costliest statements."""
+        grouped = defaultdict(lambda: [0, 0.0])
+        for sql, elapsed in self.statements:
+            entry = grouped[fingerprint(sql)]
+            entry[0] += 1
+            entry[1] += elapsed * 1000
+        ranked = sorted(grouped.items(), key=lambda item: -item[1][1])
+        return [(sql, n, ms) for sql, (n, ms) in ranked[:limit]]
+
+
+def route_name(request):
+    """Return the URL name a request resolved to."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.url_name:
+        return UNMATCHED_ROUTE
+    return match.view_name
+
+
+class RequestMetricsMiddleware:
+    """Record wall time and database use for every request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = recorder.duration * 1000
+
+        route = route_name(request)
+        with _routes_lock:
+            stats = _routes.get(route)
+            if stats is None:
+                stats = _routes[route] = RouteStats()
+            stats.add(total_ms, recorder.count, db_ms)
+        metrics.observe_request(
+            route, response.status_code, total_ms / 1000, recorder.count,
+            recorder.duration,
+        )
+
+        if settings.REQUEST_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={db_ms:.1f};desc="{recorder.count} queries", '
+                f'app;dur={total_ms - db_ms:.1f}, total;dur={total_ms:.1f}'
+            )
+        if (
+            total_ms >= settings.REQUEST_SLOW_MS
+            and random.random() < settings.REQUEST_SLOW_LOG_SAMPLE_RATE
+        ):
+            self._log_slow(request, response, route, total_ms, db_ms, recorder)
+        return response
+
+    def _log_slow(self, request, response, route, total_ms, db_ms, recorder):
+        lines = [
+            f'Slow request {request.method} {route} '
+            f'{response.status_code} in {total_ms:.1f}ms '
+            f'({recorder.count} queries, {db_ms:.1f}ms db)'
+        ]
+        lines.extend(
+            f'  {n}x {ms:.1f}ms {sql}'
+            for sql, n, ms in recorder.top_fingerprints(SLOW_LOG_TOP_QUERIES)
+        )
+        logger.warning('\n'.join(lines))
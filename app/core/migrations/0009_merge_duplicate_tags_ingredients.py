@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:29
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """Fold duplicate (user, name) tags and ingredients into one row."""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field).through
+        fk = f'{model_name.lower()}_id'
+        duplicates = model.objects.values('user', 'name').annotate(
+            keep=Min('id'), total=Count('id'),
+        ).filter(total__gt=1)
+        for dup in duplicates:
+            extra = model.objects.filter(
+                user=dup['user'], name=dup['name'],
+            ).exclude(id=dup['keep'])
+            linked = through.objects.filter(**{f'{fk}__in': extra})
+            through.objects.bulk_create(
+                [
+                    through(recipe_id=recipe_id, **{fk: dup['keep']})
+                    for recipe_id in linked.values_list(
+                        'recipe_id', flat=True,
+                    ).distinct()
+                ],
+                ignore_conflicts=True,
+            )
+            extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_user_id_desc_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:42
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def populate_search_vector(apps, schema_editor):
+    """Fill the search vector for recipes that already exist."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Recipe = apps.get_model('core', 'Recipe')
+
+    def names(model_name):
+        model = apps.get_model('core', model_name)
+        return Subquery(
+            model.objects.filter(recipe=OuterRef('pk'))
+            .values('recipe')
+            .annotate(names=StringAgg('name', ' '))
+            .values('names')
+        )
+
+    Recipe.objects.update(
+        search_vector=(
+            SearchVector('title', weight='A', config='english')
+            + SearchVector(
+                names('Tag'), names('Ingredient'),
+                weight='B', config='english',
+            )
+            + SearchVector('description', weight='C', config='english')
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_storedimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_recipe_search_gin_idx'),
+        ),
+        migrations.RunPython(
+            populate_search_vector, migrations.RunPython.noop,
+        ),
+    ]
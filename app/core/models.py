@@ -2,6 +2,8 @@ import uuid
 import os
 
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -11,8 +13,15 @@ from django.contrib.auth.models import (
 
 
 def recipe_image_file_path(instance, filename):
-    """Generate image path for new recipe image."""
+    """Generate image path for new recipe image.
+
+    Recipes carrying an ``image_digest`` get a content-addressed path so
+    identical uploads share one file.
+    """
     ext = os.path.splitext(filename)[1]
+    digest = getattr(instance, 'image_digest', None)
+    if digest:
+        return os.path.join('upload', 'recipe', digest[:2], f'{digest}{ext}')
     filename = f'{uuid.uuid4()}{ext}'
 
     return os.path.join('upload', 'recipe', filename)
@@ -73,6 +82,22 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField('Ingredient')
 
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image_variants = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    minhash = models.BinaryField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                name='core_recipe_user_id_desc_idx',
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='core_recipe_search_gin_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -85,6 +110,15 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='core_tag_user_name_uniq',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -98,6 +132,46 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='core_ingredient_user_name_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class StoredImage(models.Model):
+    """Number of recipes sharing a content-addressed image file."""
+    name = models.CharField(max_length=255, unique=True)
+    refs = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
+
+
+class RecipeBand(models.Model):
+    """LSH bucket of one band of a recipe's MinHash signature."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='bands',
+    )
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['band', 'bucket'],
+                name='core_recipeband_bucket_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}:{self.band}:{self.bucket}'
@@ -0,0 +1,221 @@
+"""
+On-demand profiling of single requests for staff users.
+
+A staff user adds ``?_profile=<mode>`` or an ``X-Profile: <mode>`` header
+and gets the profile of that request back instead of its response:
+
+* ``sample`` (or ``1``): a sampling profiler reading the request thread's
+  stack every REQUEST_PROFILING_INTERVAL seconds, as JSON with collapsed
+  stacks.
+* ``collapsed``: the same samples as plain text, one ``frame;frame count``
+  line per stack, ready for flamegraph.pl or speedscope.
+* ``cprofile``: deterministic cProfile statistics as JSON.
+
+Every JSON profile carries the request's SQL timeline. Requests without
+the flag only pay for two dictionary lookups.
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from user.authentication import CachedTokenAuthentication
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+MODE_SAMPLE = 'sample'
+MODE_COLLAPSED = 'collapsed'
+MODE_CPROFILE = 'cprofile'
+MODES = {
+    '1': MODE_SAMPLE,
+    MODE_SAMPLE: MODE_SAMPLE,
+    MODE_COLLAPSED: MODE_COLLAPSED,
+    MODE_CPROFILE: MODE_CPROFILE,
+}
+
+CPROFILE_TOP_FUNCTIONS = 50
+
+
+def _frame_name(code):
+    path = code.co_filename.split(os.sep)
+    return f'{code.co_name} ({"/".join(path[-2:])}:{code.co_firstlineno})'
+
+
+class Sampler:
+    """Count the stacks a thread is in, sampled from a helper thread."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = None
+
+    def start(self):
+        """Start sampling the calling thread."""
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Return the samples as collapsed stack lines."""
+        return ''.join(
+            f'{stack} {count}\n'
+            for stack, count in sorted(self.stacks.items())
+        )
+
+
+class SqlTimeline:
+    """Record when each query started and how long it ran."""
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            self.queries.append({
+                'start_ms': round((start - self.origin) * 1000, 3),
+                'duration_ms': round((end - start) * 1000, 3),
+                'sql': sql,
+                'many': many,
+            })
+
+
+def _cprofile_stats(profiler):
+    stats = pstats.Stats(profiler).stats
+    ranked = sorted(stats.items(), key=lambda item: -item[1][3])
+    return [
+        {
+            'function': f'{func} ({"/".join(path.split(os.sep)[-2:])}'
+                        f':{line})',
+            'calls': calls,
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3),
+        }
+        for (path, line, func), (_, calls, tottime, cumtime, _)
+        in ranked[:CPROFILE_TOP_FUNCTIONS]
+    ]
+
+
+def requested_mode(request):
+    """Return the profiling mode a request asks for, or None."""
+    value = request.GET.get(PROFILE_PARAM) or request.META.get(PROFILE_HEADER)
+    return MODES.get(value) if value else None
+
+
+def is_staff(request):
+    """Return whether the request comes from a staff user.
+
+    Token requests are authenticated here, since DRF only does so once
+    the view runs.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = CachedTokenAuthentication().authenticate(
+                Request(request),
+            )
+        except APIException:
+            return False
+        user = result[0] if result else None
+    return bool(user and user.is_active and user.is_staff)
+
+
+class RequestProfilerMiddleware:
+    """Return a profile in place of the response when staff ask for one."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (
+            PROFILE_PARAM not in request.GET
+            and PROFILE_HEADER not in request.META
+        ):
+            return self.get_response(request)
+        mode = requested_mode(request)
+        if (
+            mode is None
+            or not settings.REQUEST_PROFILING
+            or not is_staff(request)
+        ):
+            return self.get_response(request)
+        return self._profile(request, mode)
+
+    def _profile(self, request, mode):
+        if mode == MODE_CPROFILE:
+            profiler = cProfile.Profile()
+        else:
+            profiler = Sampler(settings.REQUEST_PROFILING_INTERVAL)
+        start = time.perf_counter()
+        timeline = SqlTimeline(start)
+        with connection.execute_wrapper(timeline):
+            if mode == MODE_CPROFILE:
+                profiler.enable()
+            else:
+                profiler.start()
+            try:
+                response = self.get_response(request)
+                # Streamed bodies do their work as they are read.
+                if response.streaming:
+                    size = sum(len(chunk) for chunk in response)
+                else:
+                    size = len(response.content)
+            finally:
+                if mode == MODE_CPROFILE:
+                    profiler.disable()
+                else:
+                    profiler.stop()
+        duration_ms = round((time.perf_counter() - start) * 1000, 3)
+
+        if mode == MODE_COLLAPSED:
+            return HttpResponse(
+                profiler.collapsed(), content_type='text/plain',
+            )
+        profile = {
+            'profiler': mode,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'bytes': size,
+            'duration_ms': duration_ms,
+            'sql': timeline.queries,
+            'sql_ms': round(
+                sum(query['duration_ms'] for query in timeline.queries), 3,
+            ),
+        }
+        if mode == MODE_CPROFILE:
+            profile['functions'] = _cprofile_stats(profiler)
+        else:
+            profile['interval_ms'] = profiler.interval * 1000
+            profile['samples'] = sum(profiler.stacks.values())
+            profile['collapsed'] = profiler.collapsed()
+        return JsonResponse(profile)
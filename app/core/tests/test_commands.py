@@ -1,29 +1,485 @@
 """
 Test custom Django management commands.
 """
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
 from unittest.mock import patch
 from psycopg2 import OperationalError as Psycopg2Error
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
 
+from core import health
+from core.models import Ingredient, Recipe, RecipeBand, Tag
+from recipe import export, importer, similar
 
-@patch('core.management.commands.wait_for_db.Command.check')
+
+@patch('core.health.connect_database')
 class CommandTests(SimpleTestCase):
     """Test Commands."""
 
-    def test_wait_for_db_ready(self, patched_check):
+    def test_wait_for_db_ready(self, patched_connect):
         """Testing waiting for db if db is ready"""
-        patched_check.return_value = True
-        call_command('wait_for_db')
-        patched_check.assert_called_once_with(databases=['default'])
+        call_command('wait_for_db', stdout=StringIO())
+        patched_connect.assert_called_once_with('default', 2.0)
 
     @patch('time.sleep')
-    def test_wait_for_db_delay(self, patched_sleep, patched_check):
+    def test_wait_for_db_delay(self, patched_sleep, patched_connect):
         """Testing for database when getting OperationalError."""
-        patched_check.side_effect = [Psycopg2Error] * 2 +\
-            [OperationalError]*3 + [True]
+        patched_connect.side_effect = [Psycopg2Error] * 2 +\
+            [OperationalError]*3 + [None]
+
+        call_command('wait_for_db', max_delay=0.2, stdout=StringIO())
+        self.assertEqual(patched_connect.call_count, 6)
+        delays = [call.args[0] for call in patched_sleep.call_args_list]
+        self.assertEqual(len(delays), 5)
+        self.assertTrue(0.025 <= delays[0] <= 0.05)
+        self.assertTrue(all(0.1 <= delay <= 0.2 for delay in delays[3:]))
+
+    @patch('time.sleep')
+    def test_wait_for_db_deadline(self, patched_sleep, patched_connect):
+        """Testing the command gives up once the deadline passes."""
+        patched_connect.side_effect = OperationalError
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', timeout=0, stdout=StringIO())
+        patched_sleep.assert_not_called()
+
+    @patch('core.health.check_cache')
+    def test_wait_for_several(self, patched_cache, patched_connect):
+        """Testing dependencies are each reported with time to ready."""
+        out = StringIO()
+
+        call_command('wait_for_db', wait_for='database,cache', stdout=out)
+
+        patched_cache.assert_called_once_with()
+        self.assertIn('database available after', out.getvalue())
+        self.assertIn('cache available after', out.getvalue())
+        self.assertIn('Ready in', out.getvalue())
+
+    def test_unknown_dependency(self, patched_connect):
+        """Testing unknown dependency names are rejected."""
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', wait_for='database,queue')
+
+
+class ConnectDatabaseTests(TestCase):
+    """Test the raw database probe used at startup."""
+
+    def test_connect_database(self):
+        """Test a raw connection with a connect timeout succeeds."""
+        health.connect_database('default', timeout=0.5)
+
+
+class BenchFiltersCommandTests(TestCase):
+    """Test the tag filter benchmark command."""
+
+    def test_bench_filters_seeds_and_reports(self):
+        """Test the benchmark seeds data and writes a JSON report."""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'report.json')
+            call_command(
+                'bench_filters',
+                recipes=20, tags=5, through_rows=60, filter_sizes='1,2',
+                repeat=1, output=output, stdout=StringIO(),
+            )
+            with open(output) as fh:
+                report = json.load(fh)
+
+        self.assertEqual(Recipe.tags.through.objects.count(), 60)
+        modes = {(r['mode'], r['filter_tags']) for r in report['results']}
+        self.assertIn(('all', 2), modes)
+        self.assertIn(('any', 2), modes)
+
+
+class BenchSearchCommandTests(TestCase):
+    """Test the recipe search benchmark command."""
+
+    def test_bench_search_seeds_and_reports(self):
+        """Test the benchmark indexes seeded recipes and reports."""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'report.json')
+            call_command(
+                'bench_search',
+                recipes=30, tags=5, ingredients=8, tag_links=60,
+                ingredient_links=90, repeat=1, output=output,
+                stdout=StringIO(),
+            )
+            with open(output) as fh:
+                report = json.load(fh)
+
+        self.assertFalse(
+            Recipe.objects.filter(search_vector__isnull=True).exists()
+        )
+        backends = {r['backend'] for r in report['results']}
+        self.assertEqual(backends, {'postgres', 'python'})
+
+    def test_bench_search_reseeds_with_exact_counts(self):
+        """Test seeded tags are counted, so reseeding can delete them."""
+        options = {
+            'recipes': 10, 'tags': 3, 'ingredients': 3, 'tag_links': 20,
+            'ingredient_links': 20, 'repeat': 1, 'stdout': StringIO(),
+        }
+        call_command('bench_search', **options)
+        call_command('bench_search', reseed=True, **options)
+
+        for tag in Tag.objects.all():
+            self.assertEqual(tag.recipe_count, tag.recipe_set.count())
+
+
+class BenchPantryCommandTests(TestCase):
+    """Test the pantry matching benchmark command."""
+
+    def test_bench_pantry_seeds_and_reports(self):
+        """Test the benchmark times the index and the naive scan."""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'report.json')
+            call_command(
+                'bench_pantry',
+                recipes=20, ingredients=10, ingredient_links=60,
+                pantry_sizes='2,4', repeat=1, baseline_repeat=1,
+                output=output, stdout=StringIO(),
+            )
+            with open(output) as fh:
+                report = json.load(fh)
+
+        self.assertEqual(Recipe.ingredients.through.objects.count(), 60)
+        modes = {(r['mode'], r['pantry_size']) for r in report['results']}
+        self.assertEqual(
+            modes, {('index', 2), ('naive', 2), ('index', 4), ('naive', 4)},
+        )
+
+
+class BenchBulkCommandTests(TestCase):
+    """Test the bulk recipe benchmark command."""
+
+    def test_bench_bulk_reports_both_paths(self):
+        """Test the benchmark times single and bulk writes and cleans up."""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'report.json')
+            call_command(
+                'bench_bulk',
+                sizes='6', batch_size=4, tags=5, ingredients=10,
+                single_limit=3, output=output, stdout=StringIO(),
+            )
+            with open(output) as fh:
+                report = json.load(fh)
+
+        rows = {(r['mode'], r['operation']) for r in report['results']}
+        self.assertEqual(len(rows), 6)
+        self.assertIn(('bulk', 'update'), rows)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class ApiBenchCommandTests(TestCase):
+    """Test the seed_bench and run_bench commands."""
+
+    def test_seed_bench_skews_recipes(self):
+        """Test recipes are spread over users heaviest first."""
+        call_command(
+            'seed_bench',
+            users=3, recipes=30, tags=4, ingredients=6, stdout=StringIO(),
+        )
+
+        per_user = [
+            Recipe.objects.filter(
+                user__email=f'bench-user-{i}@example.com',
+            ).count()
+            for i in range(3)
+        ]
+        self.assertEqual(sum(per_user), 30)
+        self.assertEqual(per_user, sorted(per_user, reverse=True))
+        self.assertEqual(Recipe.tags.through.objects.count(), 90)
+        self.assertFalse(Recipe.objects.filter(minhash__isnull=True).exists())
+        tag = Tag.objects.order_by('-recipe_count').first()
+        self.assertEqual(tag.recipe_count, tag.recipe_set.count())
+
+    def test_run_bench_reports_routes(self):
+        """Test every route is timed with query and size figures."""
+        call_command(
+            'seed_bench',
+            users=2, recipes=10, tags=3, ingredients=4, stdout=StringIO(),
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'report.json')
+            call_command(
+                'run_bench',
+                requests=3, warmup=1, label='test', output=output,
+                stdout=StringIO(),
+            )
+            with open(output) as fh:
+                report = json.load(fh)
+
+        self.assertEqual(report['label'], 'test')
+        self.assertEqual(report['recipes'], 10)
+        rows = {row['route']: row for row in report['results']}
+        self.assertEqual(
+            set(rows),
+            {
+                'recipe-list', 'recipe-list-tags', 'recipe-list-ingredients',
+                'recipe-list-search', 'recipe-detail', 'user-token',
+                'user-me',
+            },
+        )
+        self.assertEqual(rows['recipe-detail']['n'], 3)
+        self.assertGreater(rows['user-token']['queries_mean'], 0)
+        self.assertGreater(rows['recipe-list']['bytes_mean'], 0)
+
+    def test_run_bench_without_data(self):
+        """Test running before seeding fails clearly."""
+        with self.assertRaises(CommandError):
+            call_command('run_bench', stdout=StringIO())
+
+
+class RefreshSignaturesCommandTests(TestCase):
+    """Test computing MinHash signatures after migrating."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+
+    def _recipe(self, *tags):
+        recipe = Recipe.objects.create(
+            user=self.user, title='Sample', time_minutes=5, price=1,
+        )
+        recipe.tags.add(*tags)
+        return recipe
+
+    def test_fills_missing_signatures_only(self):
+        """Test only linked recipes without a signature are computed."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        missing = self._recipe(tag)
+        Recipe.objects.filter(pk=missing.pk).update(minhash=None)
+        RecipeBand.objects.filter(recipe=missing).delete()
+        self._recipe()
+        out = StringIO()
+
+        call_command('refresh_signatures', stdout=out)
+
+        missing.refresh_from_db()
+        self.assertIsNotNone(missing.minhash)
+        self.assertEqual(
+            RecipeBand.objects.filter(recipe=missing).count(), similar.BANDS,
+        )
+        self.assertIn('1 recipes', out.getvalue())
+
+    def test_all_recomputes_every_recipe(self):
+        """Test --all refreshes recipes that already have signatures."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self._recipe(tag)
+        self._recipe(tag)
+        out = StringIO()
+
+        call_command('refresh_signatures', all=True, stdout=out)
+
+        self.assertIn('2 recipes', out.getvalue())
+
+
+class ImportRecipesCommandTests(TestCase):
+    """Test the bulk recipe import command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        """Write content to a temporary file and return its path."""
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(content)
+        return path
+
+    def ndjson(self, rows):
+        return ''.join(json.dumps(row) + '\n' for row in rows)
+
+    def test_import_ndjson(self):
+        """Test recipes, names and derived state are written."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        path = self.write('recipes.ndjson', self.ndjson([
+            {'title': 'Soup', 'time_minutes': 20, 'price': '4.50',
+             'tags': ['Vegan', 'Quick'], 'ingredients': ['Salt']},
+            {'title': 'Stew', 'time_minutes': 90, 'price': 7,
+             'description': '', 'tags': [{'name': 'Quick'}]},
+        ]))
+
+        call_command(
+            'import_recipes', path, user='user@example.com', batch_size=1,
+            stdout=StringIO(),
+        )
+
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([r.title for r in recipes], ['Soup', 'Stew'])
+        self.assertEqual(recipes[1].price, Decimal('7.00'))
+        self.assertEqual(recipes[1].description, '')
+        self.assertEqual(
+            sorted(recipes[0].tags.values_list('name', flat=True)),
+            ['Quick', 'Vegan'],
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Tag.objects.get(name='Quick').recipe_count, 2)
+        self.assertEqual(Ingredient.objects.get(name='Salt').recipe_count, 1)
+        self.assertFalse(recipes.filter(search_vector__isnull=True).exists())
+        imported = {r.id: bytes(r.minhash) for r in recipes}
+        similar.refresh_signatures(list(imported))
+        self.assertEqual(
+            {r.id: bytes(r.minhash) for r in recipes.all()}, imported,
+        )
+        self.assertEqual(
+            RecipeBand.objects.filter(recipe__in=recipes).count(),
+            2 * similar.BANDS,
+        )
+
+        recipe = Recipe.objects.create(
+            user=self.user, title='After', time_minutes=1, price=1,
+        )
+        self.assertGreater(recipe.id, recipes[1].id)
+
+    def test_import_csv_export_round_trip(self):
+        """Test a CSV export imports into another user."""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Pie, "apple"', time_minutes=50,
+            price=Decimal('3.10'), description='Two\nlines',
+        )
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Sweet'))
+        response = export.export_response(
+            Recipe.objects.filter(user=self.user), export.FORMAT_CSV,
+        )
+        content = b''.join(response.streaming_content).decode()
+        path = self.write('recipes.csv', content)
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+        )
+        call_command(
+            'import_recipes', path, user='other@example.com',
+            stdout=StringIO(),
+        )
+
+        copy = Recipe.objects.get(user=other)
+        self.assertEqual(copy.title, 'Pie, "apple"')
+        self.assertEqual(copy.description, 'Two\nlines')
+        self.assertEqual(copy.price, Decimal('3.10'))
+        self.assertEqual(
+            list(copy.tags.values_list('name', flat=True)), ['Sweet'],
+        )
+
+    def test_invalid_rows_skipped(self):
+        """Test invalid rows are reported and the rest imported."""
+        path = self.write('recipes.ndjson', '\n'.join([
+            json.dumps({'title': 'Ok', 'time_minutes': 1, 'price': 1}),
+            '{not json',
+            json.dumps({'title': 'No time', 'price': 1}),
+            json.dumps({'title': 'Owner', 'time_minutes': 1, 'price': 1,
+                        'user': 'nobody@example.com'}),
+        ]))
+        err = StringIO()
+
+        call_command(
+            'import_recipes', path, user='user@example.com',
+            stdout=StringIO(), stderr=err,
+        )
+
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assertIn('recipes.ndjson:2:', err.getvalue())
+        self.assertIn('nobody@example.com', err.getvalue())
+
+    def test_mistyped_rows_skipped(self):
+        """Test rows with wrongly typed fields are reported, not raised."""
+        valid = {'title': 'Ok', 'time_minutes': 1, 'price': 1}
+        path = self.write('recipes.ndjson', self.ndjson([
+            valid,
+            {**valid, 'title': 42},
+            {**valid, 'link': 7},
+            {**valid, 'description': ['x']},
+            {**valid, 'price': 'NaN'},
+            {**valid, 'price': 'Infinity'},
+            {**valid, 'time_minutes': float('inf')},
+        ]))
+        err = StringIO()
+
+        call_command(
+            'import_recipes', path, user='user@example.com',
+            stdout=StringIO(), stderr=err,
+        )
+
+        self.assertEqual(Recipe.objects.count(), 1)
+        for line in range(2, 8):
+            self.assertIn(f'recipes.ndjson:{line}:', err.getvalue())
+
+    def test_too_many_errors(self):
+        """Test the import aborts past max_errors."""
+        path = self.write('recipes.ndjson', self.ndjson([{}, {}]))
+
+        with self.assertRaises(CommandError):
+            call_command(
+                'import_recipes', path, user='user@example.com',
+                max_errors=1, stdout=StringIO(), stderr=StringIO(),
+            )
+
+    def test_create_users(self):
+        """Test rows may name new owners when allowed."""
+        path = self.write('recipes.ndjson', self.ndjson([
+            {'title': 'New', 'time_minutes': 1, 'price': 1,
+             'user': 'new@example.com'},
+        ]))
+
+        call_command(
+            'import_recipes', path, create_users=True, stdout=StringIO(),
+        )
+
+        self.assertTrue(
+            Recipe.objects.filter(user__email='new@example.com').exists()
+        )
+
+    def test_resume_from_checkpoint(self):
+        """Test a rerun skips rows a checkpoint records as imported."""
+        rows = [
+            {'title': f'Recipe {i}', 'time_minutes': i, 'price': 1}
+            for i in range(5)
+        ]
+        path = self.write('recipes.ndjson', self.ndjson(rows))
+        checkpoint = os.path.join(self.tmp.name, 'checkpoint.json')
+        with open(checkpoint, 'w') as fh:
+            json.dump({'files': {os.path.abspath(path): 3}}, fh)
+
+        call_command(
+            'import_recipes', path, user='user@example.com', batch_size=1,
+            checkpoint=checkpoint, stdout=StringIO(),
+        )
+
+        self.assertEqual(
+            list(
+                Recipe.objects.order_by('id').values_list('title', flat=True)
+            ),
+            ['Recipe 3', 'Recipe 4'],
+        )
+        with open(checkpoint) as fh:
+            self.assertEqual(
+                json.load(fh)['files'][os.path.abspath(path)], 5,
+            )
+
+    def test_loader_without_copy(self):
+        """Test the bulk_create path used off Postgres."""
+        loader = importer.Loader(self.user)
+        loader.use_copy = False
+        rows = [
+            loader.prepare({'title': 'A', 'time_minutes': 1, 'price': 1,
+                            'tags': ['X', 'Y']}),
+            loader.prepare({'title': 'B', 'time_minutes': 1, 'price': 1,
+                            'tags': ['Y']}),
+        ]
+
+        ids = loader.load(rows)
 
-        call_command('wait_for_db')
-        self.assertEqual(patched_check.call_count, 6)
-        patched_check.assert_called_with(databases=['default'])
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(Tag.objects.get(name='Y').recipe_count, 2)
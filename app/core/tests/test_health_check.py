@@ -1,12 +1,19 @@
 """
 Test for the health check API.
 """
-from django.test import TestCase
+import tempfile
+import threading
+from unittest.mock import Mock, patch
+
+from django.db.utils import OperationalError
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core import health
+
 class HealthCheckTest(TestCase):
     """Test the health check API."""
 
@@ -15,4 +22,88 @@ class HealthCheckTest(TestCase):
         url = reverse('health-check')
         res = client.get(url)
 
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class ReadinessTests(TestCase):
+    """Test the readiness API and its probes."""
+
+    def setUp(self):
+        health.reset()
+        self.addCleanup(health.reset)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = APIClient()
+
+    def test_liveness(self):
+        """Test liveness does not depend on probes."""
+        with patch('core.health.readiness') as readiness:
+            res = self.client.get(reverse('health-live'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        readiness.assert_not_called()
+
+    def test_ready(self):
+        """Test every probe passes and reports its latency."""
+        res = self.client.get(reverse('health-ready'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.data['ready'])
+        self.assertEqual(
+            set(res.data['probes']), {'database', 'cache', 'media'},
+        )
+        for probe in res.data['probes'].values():
+            self.assertTrue(probe['ok'])
+            self.assertGreaterEqual(probe['latency_ms'], 0)
+
+    def test_media_not_writable(self):
+        """Test a missing media volume makes the worker unready."""
+        with override_settings(MEDIA_ROOT='/nonexistent/media/'):
+            res = self.client.get(reverse('health-ready'))
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(res.data['probes']['media']['ok'])
+        self.assertIn('error', res.data['probes']['media'])
+        self.assertTrue(res.data['probes']['database']['ok'])
+
+    def test_database_failure(self):
+        """Test database errors are reported."""
+        probes = health.default_probes()
+        probes['database'] = Mock(side_effect=OperationalError('gone'))
+
+        with patch('core.health.default_probes', return_value=probes):
+            res = self.client.get(reverse('health-ready'))
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(
+            res.data['probes']['database']['error'], 'OperationalError: gone',
+        )
+
+    def test_probe_timeout(self):
+        """Test a hung probe times out and is not queued again."""
+        release = threading.Event()
+        probes = {'slow': release.wait}
+
+        first = health.run_probes(probes, 0.05)
+        second = health.run_probes(probes, 0.05)
+        release.set()
+
+        self.assertIn('Timed out', first['slow']['error'])
+        self.assertIn('not finished', second['slow']['error'])
+
+    def test_results_cached(self):
+        """Test polls within the TTL reuse the last probe results."""
+        probe = Mock()
+
+        with patch(
+            'core.health.default_probes', return_value={'probe': probe},
+        ):
+            self.client.get(reverse('health-ready'))
+            self.client.get(reverse('health-ready'))
+            with override_settings(HEALTH_CHECK_TTL=0):
+                self.client.get(reverse('health-ready'))
+
+        self.assertEqual(probe.call_count, 2)
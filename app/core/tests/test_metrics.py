@@ -0,0 +1,169 @@
+"""
+Tests for the cross-worker Prometheus metrics.
+"""
+import multiprocessing
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import metrics
+
+
+def _child_inc(directory):
+    """Count from a forked worker process."""
+    with override_settings(METRICS_DIR=directory):
+        metrics.inc('db_queries_total', 5, route='worker')
+
+
+class MetricsTestCase(TestCase):
+    """Point the metrics store at a fresh directory per test."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        override = override_settings(METRICS_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class MmapStoreTests(MetricsTestCase):
+    """Test the per-process value files."""
+
+    def test_values_survive_reopen_and_growth(self):
+        """Test values are read back after the file grows past its size."""
+        path = os.path.join(self.directory, 'store.db')
+        store = metrics.MmapStore(path)
+        for i in range(2000):
+            store.inc(f'key-{i:04d}' * 4, i)
+        store.inc('key-0001' * 4, 0.5)
+        store.close()
+
+        values = metrics.read_file(path)
+        self.assertGreater(os.path.getsize(path), metrics.INITIAL_SIZE)
+        self.assertEqual(len(values), 2000)
+        self.assertEqual(values['key-0001' * 4], 1.5)
+        reopened = metrics.MmapStore(path)
+        reopened.inc('key-1999' * 4, 1)
+        reopened.close()
+        self.assertEqual(metrics.read_file(path)['key-1999' * 4], 2000)
+
+    def test_workers_are_summed(self):
+        """Test values written by another process are aggregated."""
+        metrics.inc('db_queries_total', 2, route='worker')
+        process = multiprocessing.get_context('fork').Process(
+            target=_child_inc, args=(self.directory,),
+        )
+        process.start()
+        process.join()
+
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        totals = metrics.collect()
+        self.assertEqual(
+            totals[('db_queries_total', (('route', 'worker'),))], 7,
+        )
+
+
+class RenderTests(MetricsTestCase):
+    """Test the Prometheus text output."""
+
+    def test_histogram_is_cumulative(self):
+        """Test buckets accumulate and carry sum and count."""
+        metrics.observe(
+            'image_processing_duration_seconds', 0.07, mode='inline',
+        )
+        metrics.observe(
+            'image_processing_duration_seconds', 40, mode='inline',
+        )
+
+        text = metrics.render()
+
+        prefix = 'image_processing_duration_seconds'
+        self.assertIn(f'{prefix}_bucket{{mode="inline",le="0.05"}} 0.0', text)
+        self.assertIn(f'{prefix}_bucket{{mode="inline",le="0.1"}} 1.0', text)
+        self.assertIn(f'{prefix}_bucket{{mode="inline",le="+Inf"}} 2.0', text)
+        self.assertIn(f'{prefix}_count{{mode="inline"}} 2.0', text)
+        self.assertIn(f'{prefix}_sum{{mode="inline"}} 40.07', text)
+
+    def test_label_values_escaped(self):
+        """Test quotes and backslashes in labels are escaped."""
+        metrics.inc('db_queries_total', route='a"b\\c')
+
+        self.assertIn(
+            'db_queries_total{route="a\\"b\\\\c"} 1.0', metrics.render(),
+        )
+
+    def test_cache_hit_ratio(self):
+        """Test the hit ratio counts shared hits and ignores invalidations."""
+        for event in ('hits', 'shared_hits', 'misses', 'invalidations'):
+            metrics.inc('cache_events_total', cache='token_auth', event=event)
+
+        self.assertIn(
+            'cache_hit_ratio{cache="token_auth"} 0.6666666666666666',
+            metrics.render(),
+        )
+
+
+class MetricsEndpointTests(MetricsTestCase):
+    """Test the metrics endpoint."""
+
+    def test_requests_recorded(self):
+        """Test request latency and queries appear per route."""
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        client.get(reverse('recipe:recipe-list'))
+        client.get(reverse('recipe:recipe-list'))
+
+        res = client.get(reverse('metrics'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        text = res.content.decode()
+        self.assertIn(
+            'http_request_duration_seconds_count'
+            '{route="recipe:recipe-list",status="2xx"} 2.0',
+            text,
+        )
+        self.assertIn('db_queries_total{route="recipe:recipe-list"}', text)
+        self.assertIn(
+            'cache_events_total{cache="recipe_api",event="hits"} 1.0', text,
+        )
+        self.assertIn('cache_hit_ratio{cache="recipe_api"} 0.5', text)
+
+    def test_scrape_outside_allowed_networks_forbidden(self):
+        """Test addresses outside METRICS_ALLOWED_NETWORKS are refused."""
+        res = self.client.get(reverse('metrics'), REMOTE_ADDR='172.17.0.5')
+
+        self.assertEqual(res.status_code, 403)
+
+    @override_settings(
+        METRICS_ALLOWED_NETWORKS=['10.1.0.0/24'], METRICS_TOKEN='s3cret',
+    )
+    def test_scrape_requires_token(self):
+        """Test a configured token must be sent as a bearer token."""
+        url = reverse('metrics')
+
+        missing = self.client.get(url, REMOTE_ADDR='10.1.0.9')
+        wrong = self.client.get(
+            url, REMOTE_ADDR='10.1.0.9', HTTP_AUTHORIZATION='Bearer nope',
+        )
+        elsewhere = self.client.get(
+            url, REMOTE_ADDR='10.2.0.9', HTTP_AUTHORIZATION='Bearer s3cret',
+        )
+        ok = self.client.get(
+            url, REMOTE_ADDR='10.1.0.9', HTTP_AUTHORIZATION='Bearer s3cret',
+        )
+
+        self.assertEqual(missing.status_code, 403)
+        self.assertEqual(wrong.status_code, 403)
+        self.assertEqual(elsewhere.status_code, 403)
+        self.assertEqual(ok.status_code, 200)
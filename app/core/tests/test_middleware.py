@@ -0,0 +1,88 @@
+"""
+Tests for the request instrumentation middleware.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import middleware
+
+
+class FingerprintTests(TestCase):
+    """Test SQL normalization."""
+
+    def test_fingerprint_normalizes_literals(self):
+        """Test literals, numbers and IN lists collapse."""
+        sql = (
+            "SELECT *  FROM t WHERE name = 'O''Brien' AND id IN (%s, %s, %s)"
+            ' LIMIT 21'
+        )
+
+        self.assertEqual(
+            middleware.fingerprint(sql),
+            'SELECT * FROM t WHERE name = ? AND id IN (...) LIMIT ?',
+        )
+
+
+class RequestMetricsMiddlewareTests(TestCase):
+    """Test timing, query counting and the slow request log."""
+
+    def setUp(self):
+        middleware.reset_route_stats()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_header(self):
+        """Test responses carry database and total time."""
+        res = self.client.get(reverse('recipe:recipe-list'))
+
+        timing = res['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    @override_settings(REQUEST_SERVER_TIMING=False)
+    def test_server_timing_disabled(self):
+        """Test the header can be turned off."""
+        res = self.client.get(reverse('recipe:recipe-list'))
+
+        self.assertNotIn('Server-Timing', res)
+
+    def test_route_stats(self):
+        """Test requests are counted under their route name."""
+        self.client.get(reverse('recipe:recipe-list'))
+        self.client.get(reverse('recipe:recipe-list'), {'tags': '1'})
+        self.client.get('/api/missing/')
+
+        stats = middleware.get_route_stats()
+        recipe_list = stats['recipe:recipe-list']
+        self.assertEqual(recipe_list['count'], 2)
+        self.assertEqual(sum(recipe_list['buckets'].values()), 2)
+        self.assertGreater(recipe_list['queries'], 0)
+        self.assertEqual(stats[middleware.UNMATCHED_ROUTE]['count'], 1)
+
+    @override_settings(REQUEST_SLOW_MS=0, REQUEST_SLOW_LOG_SAMPLE_RATE=1.0)
+    def test_slow_request_logged(self):
+        """Test slow requests are logged with SQL fingerprints."""
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(reverse('recipe:recipe-list'), {'tags': '1,2'})
+
+        message = logs.output[0]
+        self.assertIn('GET recipe:recipe-list 200', message)
+        self.assertIn('SELECT', message)
+        self.assertNotIn('%s', message)
+
+    @override_settings(REQUEST_SLOW_MS=0, REQUEST_SLOW_LOG_SAMPLE_RATE=0.0)
+    def test_slow_log_sampled_out(self):
+        """Test a zero sample rate logs nothing."""
+        with patch('core.middleware.logger') as logger:
+            self.client.get(reverse('recipe:recipe-list'))
+
+        logger.warning.assert_not_called()
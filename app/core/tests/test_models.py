@@ -102,3 +102,14 @@ class ModelTests(TestCase):
         file_path = models.recipe_image_file_path(None, 'exmple.jpg')
 
         self.assertEqual(file_path, f'upload/recipe/{uuid}.jpg')
+
+    def test_recipe_file_name_content_hash(self):
+        """Test images with a digest get a content-addressed path."""
+        recipe = models.Recipe()
+        recipe.image_digest = 'ab' + 'c' * 62
+
+        file_path = models.recipe_image_file_path(recipe, 'example.png')
+
+        self.assertEqual(
+            file_path, f'upload/recipe/ab/{recipe.image_digest}.png',
+        )
@@ -0,0 +1,138 @@
+"""
+Tests for on-demand request profiling.
+"""
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import profiling
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class SamplerTests(TestCase):
+    """Test the sampling profiler."""
+
+    def test_samples_calling_thread(self):
+        """Test busy frames of the sampled thread show up in stacks."""
+        sampler = profiling.Sampler(0.001)
+        sampler.start()
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        sampler.stop()
+
+        lines = sampler.collapsed().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(
+            any('test_samples_calling_thread' in line for line in lines)
+        )
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+
+
+class RequestProfilerTests(TestCase):
+    """Test the profiling middleware."""
+
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user(
+            email='staff@example.com',
+            password='testpass123',
+            is_staff=True,
+        )
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        Recipe.objects.create(
+            user=self.staff, title='Soup', time_minutes=5, price='1.00',
+        )
+        self.client = APIClient()
+
+    def test_cprofile_with_sql_timeline(self):
+        """Test staff get function statistics and their queries."""
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self._token(self.staff)}',
+        )
+
+        res = self.client.get(RECIPES_URL, {'_profile': 'cprofile'})
+
+        self.assertEqual(res.status_code, 200)
+        profile = res.json()
+        self.assertEqual(profile['profiler'], 'cprofile')
+        self.assertEqual(profile['status'], 200)
+        self.assertGreater(profile['bytes'], 0)
+        self.assertTrue(profile['functions'])
+        self.assertTrue(
+            any('core_recipe' in query['sql'] for query in profile['sql'])
+        )
+        starts = [query['start_ms'] for query in profile['sql']]
+        self.assertEqual(starts, sorted(starts))
+
+    def test_token_header_collapsed(self):
+        """Test token users can ask with a header for collapsed stacks."""
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self._token(self.staff)}',
+            HTTP_X_PROFILE='collapsed',
+        )
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+
+    def test_sample_profile(self):
+        """Test the default mode reports samples."""
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self._token(self.staff)}',
+        )
+
+        res = self.client.get(RECIPES_URL, {'_profile': '1'})
+
+        profile = res.json()
+        self.assertEqual(profile['profiler'], 'sample')
+        self.assertIn('collapsed', profile)
+        self.assertIn('samples', profile)
+
+    def test_non_staff_get_normal_response(self):
+        """Test the flag is ignored for other users."""
+        self.client.force_authenticate(self.user)
+
+        with patch('core.profiling.cProfile.Profile') as profile:
+            res = self.client.get(RECIPES_URL, {'_profile': 'cprofile'})
+
+        profile.assert_not_called()
+        self.assertIn('results', res.data)
+
+    @override_settings(REQUEST_PROFILING=False)
+    def test_disabled(self):
+        """Test profiling can be switched off."""
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self._token(self.staff)}',
+        )
+
+        res = self.client.get(RECIPES_URL, {'_profile': 'cprofile'})
+
+        self.assertIn('results', res.data)
+
+    def test_unflagged_requests_untouched(self):
+        """Test requests without the flag skip the staff check."""
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self._token(self.staff)}',
+        )
+
+        with patch('core.profiling.is_staff') as check:
+            res = self.client.get(RECIPES_URL)
+
+        check.assert_not_called()
+        self.assertIn('results', res.data)
+
+    def _token(self, user):
+        return Token.objects.create(user=user).key
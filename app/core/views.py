@@ -1,12 +1,57 @@
 """
 Core views for app.
 """
+import hmac
+import ipaddress
 
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from core import health, metrics
+
 
 @api_view(['GET'])
 def health_check(request):
     """Return successful response."""
     return Response({'healthy':True})
+
+
+@api_view(['GET'])
+def readiness(request):
+    """Return dependency probe results, with 503 until all pass."""
+    ready, probes = health.readiness()
+    return Response(
+        {'ready': ready, 'probes': probes},
+        status=status.HTTP_200_OK if ready
+        else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+def _metrics_allowed(request):
+    """Return whether the request may scrape metrics."""
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    if not any(
+        address in ipaddress.ip_network(network)
+        for network in settings.METRICS_ALLOWED_NETWORKS
+    ):
+        return False
+    if not settings.METRICS_TOKEN:
+        return True
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    return hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', '').encode(),
+        expected.encode(),
+    )
+
+
+def prometheus_metrics(request):
+    """Return metrics of every worker in the Prometheus text format."""
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,180 @@
+"""
+Per-user versioned response cache for the recipe APIs.
+
+Every user has a version number that signal handlers bump whenever one of
+their recipes, tags or ingredients changes. Cached responses are keyed on
+that version, so a write makes all of the user's entries unreachable
+without deleting any keys.
+
+Inside a transaction the version is bumped at the write and again once
+the transaction commits. A concurrent request that reads the old rows
+after the first bump caches them under a version the second bump leaves
+behind, so nothing built before the commit outlives it.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from core import metrics
+
+VERSION_KEY = 'recipe-api:version:{user_id}'
+RESPONSE_KEY = 'recipe-api:response:{user_id}:{version}:{digest}'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[settings.RECIPE_API_CACHE['ALIAS']]
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+    metrics.inc('cache_events_total', cache='recipe_api', event=name)
+
+
+def get_stats():
+    """Return a snapshot of the response cache hit/miss counters."""
+    with _stats_lock:
+        return {name: _stats[name] for name in ('hits', 'misses')}
+
+
+def get_version(user_id):
+    """Return the current data version for a user."""
+    cache = _cache()
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter never restarts at a
+        # value that older cached responses were stored under.
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _incr_version(user_id, on_incr=None, committed=True):
+    try:
+        version = _cache().incr(VERSION_KEY.format(user_id=user_id))
+    except ValueError:
+        get_version(user_id)
+        return
+    if on_incr is not None:
+        on_incr(version, committed)
+
+
+def bump_version(user_id, on_incr=None):
+    """Invalidate every cached response for a user, again on commit.
+
+    on_incr, when given, is called with each version the bump moves to
+    and whether the write has committed by then.
+    """
+    if transaction.get_connection().in_atomic_block:
+        _incr_version(user_id, on_incr, committed=False)
+    transaction.on_commit(partial(_incr_version, user_id, on_incr))
+
+
+def response_key(request):
+    """Return the cache key for a request by the authenticated user."""
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+        if value != ''
+    )
+    raw = f'{request.path}?{params!r}'
+    user_id = request.user.pk
+    return RESPONSE_KEY.format(
+        user_id=user_id,
+        version=get_version(user_id),
+        digest=hashlib.sha256(raw.encode()).hexdigest(),
+    )
+
+
+class CachedListMixin:
+    """Serve list responses from the per-user versioned cache."""
+
+    def list(self, request, *args, **kwargs):
+        """Return the cached list response, computing it on a miss."""
+        cache = _cache()
+        key = response_key(request)
+        data = cache.get(key)
+        if data is not None:
+            _count('hits')
+            return Response(data)
+
+        _count('misses')
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = settings.RECIPE_API_CACHE['TIMEOUT']
+            cache.set(key, response.data, timeout)
+        return response
+
+
+class LocalIndexCache:
+    """In-process LRU of per-user structures tied to the data version.
+
+    An entry is served while the user's version matches the one it was
+    built at and, when ``ttl_setting`` names a setting, while it is younger
+    than that many seconds. Sizes and TTLs are read from settings on use.
+    """
+
+    def __init__(self, max_size_setting, ttl_setting=None):
+        self.max_size_setting = max_size_setting
+        self.ttl_setting = ttl_setting
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fresh(self, entry, version):
+        if entry is None or entry[0] != version:
+            return False
+        if self.ttl_setting is None:
+            return True
+        ttl = getattr(settings, self.ttl_setting)
+        return time.monotonic() - entry[1] < ttl
+
+    def get(self, user_id, build):
+        """Return the user's structure, calling build(user_id) if stale."""
+        version = get_version(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if self._fresh(entry, version):
+                self._entries.move_to_end(user_id)
+                return entry[2]
+
+        value = build(user_id)
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic(), value)
+            self._entries.move_to_end(user_id)
+            max_size = getattr(settings, self.max_size_setting)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def advance(self, user_id, version, update=None):
+        """Carry the user's entry over one increment to version.
+
+        Only an entry built at the version just before moves, after
+        update(value) patches it when given; any other entry missed a
+        write and is left for get() to rebuild. The entry keeps its build
+        time, so the TTL still bounds how long patches pile up.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version - 1:
+                return
+            if update is not None:
+                update(entry[2])
+            self._entries[user_id] = (version, entry[1], entry[2])
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,134 @@
+"""
+Autocomplete over a user's tag and ingredient names.
+
+On Postgres prefixes use an index on ``(user_id, UPPER(name::text))`` and
+fuzzy queries use ``pg_trgm`` similarity when the extension is installed,
+falling back to substring matches when it is not. Whether it is installed
+is checked again every RECIPE_AUTOCOMPLETE_TRIGRAM_TTL seconds, so
+workers started before the migration pick it up without a restart. With
+``RECIPE_AUTOCOMPLETE_BACKEND = 'python'`` (or another database) each
+user's names are held in process as a sorted array and prefixes are
+answered by binary search.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Upper
+
+from recipe import cache, search
+
+_trigram = {}
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def has_trigram(using='default'):
+    """Return whether pg_trgm is installed in a database."""
+    checked = _trigram.get(using)
+    now = time.monotonic()
+    if (
+        checked is None
+        or now - checked[1] >= settings.RECIPE_AUTOCOMPLETE_TRIGRAM_TTL
+    ):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )
+            checked = _trigram[using] = (cursor.fetchone() is not None, now)
+    return checked[0]
+
+
+class NameIndex:
+    """One user's names sorted case-insensitively."""
+
+    def __init__(self, rows):
+        entries = sorted((name.casefold(), pk, name) for pk, name in rows)
+        self.keys = [key for key, _, _ in entries]
+        self.items = [(pk, name) for _, pk, name in entries]
+
+    def prefix(self, text, limit):
+        """Return up to limit (id, name) pairs starting with text."""
+        key = text.casefold()
+        found = []
+        i = bisect.bisect_left(self.keys, key)
+        while i < len(self.keys) and len(found) < limit:
+            if not self.keys[i].startswith(key):
+                break
+            found.append(self.items[i])
+            i += 1
+        return found
+
+    def fuzzy(self, text, limit):
+        """Return prefix matches for text, then other substring matches."""
+        found = self.prefix(text, limit)
+        key = text.casefold()
+        for i, name in enumerate(self.keys):
+            if len(found) >= limit:
+                break
+            if key in name and not name.startswith(key):
+                found.append(self.items[i])
+        return found
+
+
+def get_index(model, user_id):
+    """Return the user's name index for a model at their data version."""
+    label = model._meta.label
+    index_cache = _indexes.get(label)
+    if index_cache is None:
+        with _indexes_lock:
+            index_cache = _indexes.setdefault(
+                label,
+                cache.LocalIndexCache('RECIPE_AUTOCOMPLETE_INDEX_MAX_USERS'),
+            )
+    return index_cache.get(user_id, lambda user_id: NameIndex(
+        model.objects.filter(user_id=user_id).values_list('id', 'name')
+    ))
+
+
+def clear_indexes():
+    """Drop every in-process name index and the pg_trgm check."""
+    with _indexes_lock:
+        _indexes.clear()
+    _trigram.clear()
+
+
+def _database_matches(model, user_id, prefix, q, limit):
+    queryset = model.objects.filter(user_id=user_id)
+    if not q:
+        return queryset.filter(
+            name__istartswith=prefix,
+        ).order_by(Upper('name'), 'id')[:limit]
+
+    starts = Case(
+        When(name__istartswith=q, then=Value(0)),
+        default=Value(1),
+        output_field=IntegerField(),
+    )
+    if has_trigram(queryset.db):
+        return queryset.filter(
+            Q(name__trigram_similar=q) | Q(name__istartswith=q)
+        ).annotate(
+            starts=starts, similarity=TrigramSimilarity('name', q),
+        ).order_by('starts', '-similarity', Upper('name'))[:limit]
+    return queryset.filter(name__icontains=q).annotate(
+        starts=starts,
+    ).order_by('starts', Upper('name'), 'id')[:limit]
+
+
+def complete(model, user_id, prefix='', q='', limit=10):
+    """Return up to limit of the user's objects matching prefix or q.
+
+    q is matched fuzzily and takes precedence over prefix.
+    """
+    backend = search.get_backend('RECIPE_AUTOCOMPLETE_BACKEND')
+    if backend == search.BACKEND_POSTGRES:
+        return list(_database_matches(model, user_id, prefix, q, limit))
+
+    index = get_index(model, user_id)
+    pairs = index.fuzzy(q, limit) if q else index.prefix(prefix, limit)
+    return [model(id=pk, name=name, user_id=user_id) for pk, name in pairs]
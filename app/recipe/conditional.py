@@ -0,0 +1,85 @@
+"""
+Conditional GET support for the recipe APIs.
+
+List validators come from the per-user data version in :mod:`recipe.cache`
+and detail validators from ``Recipe.updated_at``, so a 304 is answered
+without serializing or loading related rows. Because the version moves
+again when a write commits, a list ETag handed out while the write was in
+flight stops matching once it is visible.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from recipe import cache
+
+
+def make_etag(*parts):
+    """Return a strong, quoted ETag for the given parts."""
+    raw = '|'.join(str(part) for part in parts)
+    return '"%s"' % hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+class ConditionalGetMixin:
+    """Answer If-None-Match / If-Modified-Since with 304 when possible."""
+
+    def _representation_parts(self, request):
+        """Return request details that change the response bytes."""
+        return (request.get_host(), request.accepted_media_type)
+
+    def _conditional(self, request, handler, etag, last_modified=None):
+        """Return a 304 for a matching request, else run handler."""
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified,
+        )
+        response = not_modified or handler()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ConditionalListMixin(ConditionalGetMixin):
+    """Validate list responses against the user's data version."""
+
+    def list(self, request, *args, **kwargs):
+        """Return the list, or 304 if the user's data is unchanged."""
+        etag = make_etag(
+            cache.response_key(request),
+            *self._representation_parts(request),
+        )
+        return self._conditional(
+            request,
+            lambda: super(ConditionalListMixin, self).list(
+                request, *args, **kwargs
+            ),
+            etag,
+        )
+
+
+class ConditionalRetrieveMixin(ConditionalGetMixin):
+    """Validate detail responses against the object's updated_at."""
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return the object, or 304 if it is unchanged."""
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or 'pk']}
+        updated_at = self.get_queryset().prefetch_related(None).filter(
+            **lookup
+        ).values_list('updated_at', flat=True).first()
+
+        def handler():
+            return super(ConditionalRetrieveMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+
+        if updated_at is None:
+            return handler()
+        etag = make_etag(
+            self.basename, lookup, updated_at.isoformat(),
+            *self._representation_parts(request),
+        )
+        return self._conditional(
+            request, handler, etag, int(updated_at.timestamp()),
+        )
@@ -0,0 +1,69 @@
+"""
+Denormalized recipe counts on tags and ingredients.
+
+``recipe_count`` is moved by deltas from the m2m_changed and Recipe delete
+handlers in :mod:`recipe.signals`, so list requests read a column instead
+of aggregating the through tables. Code that writes through rows in bulk,
+bypassing signals, calls :func:`recount` afterwards, and bulk deletes run
+under :func:`deferred` so per-recipe deltas are skipped in favour of one
+recount.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipe.filters import recipe_link
+
+_state = threading.local()
+
+
+@contextmanager
+def deferred():
+    """Skip signal driven count updates until the block exits."""
+    _state.deferred = getattr(_state, 'deferred', 0) + 1
+    try:
+        yield
+    finally:
+        _state.deferred -= 1
+
+
+def is_deferred():
+    """Return whether count updates are currently deferred."""
+    return getattr(_state, 'deferred', 0) > 0
+
+
+def add(model, ids, delta):
+    """Move the recipe_count of each of ids by delta."""
+    if ids and delta:
+        model.objects.filter(pk__in=ids).update(
+            recipe_count=F('recipe_count') + delta,
+        )
+
+
+def add_counts(model, deltas):
+    """Move recipe_counts by a mapping of id to delta, one update per delta.
+
+    Callers that know exactly which links they wrote use this instead of
+    :func:`recount`; skewed data shares few distinct deltas.
+    """
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        by_delta[delta].append(pk)
+    for delta, ids in by_delta.items():
+        add(model, ids, delta)
+
+
+def recount(model, queryset=None):
+    """Recompute recipe_count from the through table for queryset rows."""
+    through, field = recipe_link(model)
+    linked = through.objects.filter(
+        **{field: OuterRef('pk')}
+    ).values(field).annotate(total=Count('pk')).values('total')
+    if queryset is None:
+        queryset = model.objects.all()
+    return queryset.update(
+        recipe_count=Coalesce(Subquery(linked), Value(0)),
+    )
@@ -0,0 +1,64 @@
+"""
+Query filters for the recipe APIs.
+
+Tag and ingredient filters are written as semi-joins against the M2M
+through tables so the recipe rows never fan out and no DISTINCT is needed.
+"""
+from django.db.models import Count, Exists, OuterRef
+
+from core.models import Recipe
+
+TAGS_MODE_ANY = 'any'
+TAGS_MODE_ALL = 'all'
+TAGS_MODES = (TAGS_MODE_ANY, TAGS_MODE_ALL)
+
+
+def recipe_link(model):
+    """Return the through model and its field pointing at model."""
+    for field in Recipe._meta.many_to_many:
+        if field.related_model is model:
+            return field.remote_field.through, field.m2m_reverse_field_name()
+    raise LookupError(f'Recipe has no relation to {model.__name__}.')
+
+
+def _related_exists(through, field, ids):
+    """Return an EXISTS expression matching recipes linked to any id."""
+    return Exists(through.objects.filter(
+        recipe_id=OuterRef('pk'),
+        **{f'{field}__in': ids},
+    ))
+
+
+def filter_by_tags(queryset, tag_ids, mode=TAGS_MODE_ANY):
+    """Filter recipes having any (or all) of the given tags."""
+    tag_ids = set(tag_ids)
+    through = Recipe.tags.through
+    if mode == TAGS_MODE_ALL and len(tag_ids) > 1:
+        # Correlated GROUP BY/HAVING: each candidate recipe probes the
+        # (recipe_id, tag_id) unique index, so the newest-first scan can
+        # stop as soon as a page is filled.
+        matching = through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=tag_ids,
+        ).values('recipe_id').annotate(
+            matched=Count('tag_id'),
+        ).filter(matched=len(tag_ids))
+        return queryset.filter(Exists(matching))
+
+    return queryset.filter(_related_exists(through, 'tag_id', tag_ids))
+
+
+def filter_by_ingredients(queryset, ingredient_ids):
+    """Filter recipes having any of the given ingredients."""
+    through = Recipe.ingredients.through
+    return queryset.filter(
+        _related_exists(through, 'ingredient_id', set(ingredient_ids))
+    )
+
+
+def filter_assigned(queryset):
+    """Filter tags or ingredients linked to at least one recipe."""
+    through, field = recipe_link(queryset.model)
+    return queryset.filter(
+        Exists(through.objects.filter(**{field: OuterRef('pk')}))
+    )
@@ -0,0 +1,310 @@
+"""
+Storage and resized variants for recipe images.
+
+Uploaded images are stored once per content hash and reference counted
+through :class:`core.models.StoredImage`. Variants are rendered in a
+process pool so request workers only pay for queueing the job.
+:func:`render_variants` runs in the child process and must only depend
+on Pillow and the filesystem. Children are spawned with a real Python
+interpreter, since under uWSGI ``sys.executable`` is the uwsgi binary,
+and a pool that breaks anyway is dropped and the image rendered inline.
+"""
+import hashlib
+import logging
+import mimetypes
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import FileResponse, HttpResponse
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core import metrics
+
+EXTENSIONS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'GIF': '.gif',
+    'WEBP': '.webp',
+}
+
+FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp'),
+}
+
+logger = logging.getLogger(__name__)
+
+_pool = {'executor': None}
+_pool_lock = threading.Lock()
+
+
+def variant_name(name, size, fmt):
+    """Return the storage name of one variant of an image."""
+    stem = os.path.splitext(name)[0]
+    return f'{stem}_{size}{FORMATS[fmt][1]}'
+
+
+def render_variants(root, name, sizes, formats, quality):
+    """Write resized copies of an image and return their storage names.
+
+    Sizes at or above the original's longest side are skipped, since the
+    original is already the best fit for them.
+    """
+    variants = {}
+    with Image.open(os.path.join(root, name)) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    for size in sorted(sizes):
+        if size >= max(image.size):
+            break
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        for fmt in formats:
+            target = variant_name(name, size, fmt)
+            resized.save(
+                os.path.join(root, target),
+                FORMATS[fmt][0],
+                quality=quality,
+            )
+            variants.setdefault(str(size), {})[fmt] = target
+    return variants
+
+
+def python_executable():
+    """Return the interpreter pool children are spawned with.
+
+    ``RECIPE_IMAGE_PYTHON`` wins when set. Otherwise sys.executable is
+    used if it is a Python binary, and the interpreter installed next to
+    the running one if it is not, as under uWSGI.
+    """
+    if settings.RECIPE_IMAGE_PYTHON:
+        return settings.RECIPE_IMAGE_PYTHON
+    if os.path.basename(sys.executable).startswith('python'):
+        return sys.executable
+    return os.path.join(sys.exec_prefix, 'bin', 'python3')
+
+
+def get_pool():
+    """Return this worker's image processing pool."""
+    with _pool_lock:
+        if _pool['executor'] is None:
+            context = multiprocessing.get_context('spawn')
+            context.set_executable(python_executable())
+            _pool['executor'] = ProcessPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                mp_context=context,
+            )
+        return _pool['executor']
+
+
+def discard_pool(executor=None):
+    """Drop the pool so the next use starts a fresh one.
+
+    Given an executor, the pool is only dropped while it is still that
+    one, so callers racing over the same broken pool drop it once.
+    """
+    with _pool_lock:
+        current = _pool['executor']
+        if current is None or executor not in (None, current):
+            return
+        _pool['executor'] = None
+    current.shutdown(wait=False)
+
+
+def _render_inline(recipe, args):
+    """Render variants in this process and save them on the recipe."""
+    start = time.perf_counter()
+    recipe.image_variants = render_variants(*args)
+    metrics.observe(
+        'image_processing_duration_seconds',
+        time.perf_counter() - start, mode='inline',
+    )
+    recipe.save(update_fields=['image_variants'])
+
+
+def _store_variants(recipe, args, executor, submitter, submitted, future):
+    """Save rendered variant names once the pool finishes."""
+    from core.models import Recipe
+    from recipe import pantry
+
+    metrics.observe(
+        'image_processing_duration_seconds',
+        time.perf_counter() - submitted, mode='pool',
+    )
+    name = args[1]
+    try:
+        try:
+            variants = future.result()
+        except BrokenProcessPool:
+            logger.exception('Image pool broke; rendering %s inline.', name)
+            discard_pool(executor)
+            variants = render_variants(*args)
+        updated = Recipe.objects.filter(pk=recipe.pk, image=name).update(
+            image_variants=variants,
+            updated_at=timezone.now(),
+        )
+        if updated:
+            pantry.bump_version(recipe.user_id)
+    except Exception:
+        logger.exception('Rendering variants of %s failed.', name)
+    finally:
+        # Callbacks usually run on the pool's thread, which owns its own
+        # connection and must not leak it.
+        if threading.get_ident() != submitter:
+            connection.close()
+
+
+def generate_variants(recipe):
+    """Render variants for a recipe's image, in the pool when enabled."""
+    args = (
+        settings.MEDIA_ROOT,
+        recipe.image.name,
+        settings.RECIPE_IMAGE_VARIANT_SIZES,
+        settings.RECIPE_IMAGE_VARIANT_FORMATS,
+        settings.RECIPE_IMAGE_VARIANT_QUALITY,
+    )
+    if settings.RECIPE_IMAGE_WORKERS == 0:
+        _render_inline(recipe, args)
+        return None
+
+    executor = get_pool()
+    try:
+        future = executor.submit(render_variants, *args)
+    except BrokenProcessPool:
+        logger.exception(
+            'Image pool broke; rendering %s inline.', recipe.image.name,
+        )
+        discard_pool(executor)
+        _render_inline(recipe, args)
+        return None
+    future.add_done_callback(partial(
+        _store_variants, recipe, args, executor, threading.get_ident(),
+        time.perf_counter(),
+    ))
+    return future
+
+
+def acquire(name):
+    """Record one more recipe using the stored image name.
+
+    The StoredImage row stays locked until the caller's transaction ends,
+    so call this before deciding whether the file already exists: files
+    are only deleted under the same lock once no reference is left.
+    """
+    from core.models import StoredImage
+
+    with transaction.atomic():
+        while True:
+            StoredImage.objects.get_or_create(name=name)
+            # A row deleted by a concurrent cleanup is gone once the lock
+            # is granted; create it again.
+            stored = StoredImage.objects.select_for_update().filter(
+                name=name,
+            ).first()
+            if stored is not None:
+                break
+        stored.refs = F('refs') + 1
+        stored.save(update_fields=['refs'])
+
+
+def release(name, storage):
+    """Drop one reference, deleting the files once nothing uses them.
+
+    Images stored before reference counting have no row and belong to a
+    single recipe, so they are removed straight away.
+    """
+    from core.models import StoredImage
+
+    with transaction.atomic():
+        stored = StoredImage.objects.select_for_update().filter(
+            name=name,
+        ).first()
+        if stored is None:
+            transaction.on_commit(lambda: delete_files(name, storage))
+            return
+        if stored.refs > 1:
+            stored.refs = F('refs') - 1
+            stored.save(update_fields=['refs'])
+            return
+        stored.refs = 0
+        stored.save(update_fields=['refs'])
+        transaction.on_commit(lambda: delete_unused(name, storage))
+
+
+def delete_unused(name, storage):
+    """Delete an image's files and row if it still has no references.
+
+    Runs after the releasing transaction commits; an upload that
+    acquired the name since then keeps its files.
+    """
+    from core.models import StoredImage
+
+    with transaction.atomic():
+        stored = StoredImage.objects.select_for_update().filter(
+            name=name,
+        ).first()
+        if stored is None or stored.refs > 0:
+            return
+        delete_files(name, storage)
+        stored.delete()
+
+
+def delete_files(name, storage):
+    """Delete an image and any variants rendered from it."""
+    storage.delete(name)
+    for size in settings.RECIPE_IMAGE_VARIANT_SIZES:
+        for fmt in FORMATS:
+            storage.delete(variant_name(name, size, fmt))
+
+
+def shared_variants(name, exclude_id):
+    """Return variants already rendered for name by another recipe."""
+    from core.models import Recipe
+
+    return Recipe.objects.filter(image=name).exclude(
+        id=exclude_id,
+    ).exclude(image_variants={}).values_list(
+        'image_variants', flat=True,
+    ).first() or {}
+
+
+def image_version(name):
+    """Return a short tag that changes whenever a recipe's image does.
+
+    Stored names are never reused for different content, so the tag is
+    derived from the name alone.
+    """
+    return hashlib.sha256(name.encode()).hexdigest()[:16]
+
+
+def image_response(name, storage, immutable=False):
+    """Return a response delivering a stored image.
+
+    With ``MEDIA_ACCEL_REDIRECT`` enabled the body is left empty and nginx
+    sends the file named in ``X-Accel-Redirect``, so Python workers never
+    stream image bytes. Responses to URLs pinned to one version of the
+    image are cached as immutable; others must be revalidated.
+    """
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if settings.MEDIA_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + name
+    else:
+        response = FileResponse(
+            storage.open(name, 'rb'), content_type=content_type,
+        )
+
+    if immutable:
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,327 @@
+"""
+Bulk loading of recipes from NDJSON or CSV files.
+
+Files use the layout written by :mod:`recipe.export`. Rows are loaded in
+batches, one transaction each: tag and ingredient names are resolved
+through in-memory name to id maps, and recipes and their through rows are
+written with ``COPY`` on Postgres (recipe ids are drawn from the table's
+sequence up front) or ``bulk_create`` elsewhere. Signals do not fire for
+these writes, so each batch maintains recipe counts, MinHash signatures
+and search vectors itself, from the links it already holds in memory
+where it can.
+"""
+import csv
+import io
+import json
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Ingredient, Recipe, RecipeBand, Tag
+from recipe import cache, counts, export, search, similar
+
+EXTENSIONS = {
+    '.csv': export.FORMAT_CSV,
+    '.ndjson': export.FORMAT_NDJSON,
+    '.jsonl': export.FORMAT_NDJSON,
+}
+
+RECIPE_COLUMNS = (
+    'id', 'user', 'title', 'description', 'time_minutes', 'price', 'link',
+    'image_variants', 'updated_at', 'minhash',
+)
+
+MAX_NAME_LENGTH = 255
+MAX_PRICE = Decimal('999.99')
+
+
+class RowError(ValueError):
+    """A row that cannot be imported."""
+
+
+def guess_format(path):
+    """Return the format a file name implies, or None."""
+    for extension, export_format in EXTENSIONS.items():
+        if path.lower().endswith(extension):
+            return export_format
+    return None
+
+
+def read_rows(fh, export_format):
+    """Yield (line number, raw row) pairs from an open text file."""
+    if export_format == export.FORMAT_CSV:
+        reader = csv.DictReader(fh)
+        for row in reader:
+            for field in export.RELATIONS:
+                names = row.get(field) or ''
+                row[field] = (
+                    names.split(export.CSV_NAME_SEPARATOR) if names else []
+                )
+            yield reader.line_num, row
+        return
+    for line_num, line in enumerate(fh, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            row = RowError(f'Invalid JSON: {exc}')
+        yield line_num, row
+
+
+def _names(value):
+    """Return distinct stripped names from a list of names or objects."""
+    if not isinstance(value, list):
+        raise RowError('Expected a list of names.')
+    names = []
+    for item in value:
+        name = item.get('name') if isinstance(item, dict) else item
+        if not isinstance(name, str) or not name.strip():
+            raise RowError('Names must be non-empty strings.')
+        name = name.strip()
+        if len(name) > MAX_NAME_LENGTH:
+            raise RowError(f'Name longer than {MAX_NAME_LENGTH}: {name!r}')
+        names.append(name)
+    return list(dict.fromkeys(names))
+
+
+def _text(row, field):
+    """Return a string field of a row, empty when missing."""
+    value = row.get(field)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise RowError(f'{field} must be a string.')
+    return value
+
+
+def clean_row(row):
+    """Return the recipe fields of a raw row, or raise RowError."""
+    if isinstance(row, RowError):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError('Expected an object.')
+    title = _text(row, 'title').strip()
+    if not title or len(title) > MAX_NAME_LENGTH:
+        raise RowError('title is required and at most 255 characters.')
+    try:
+        time_minutes = int(row.get('time_minutes'))
+    except (TypeError, ValueError, OverflowError):
+        raise RowError('time_minutes must be an integer.')
+    try:
+        price = Decimal(str(row.get('price')))
+        if not price.is_finite():
+            raise InvalidOperation
+        price = price.quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise RowError('price must be a decimal number.')
+    if abs(price) > MAX_PRICE:
+        raise RowError(f'price must be at most {MAX_PRICE}.')
+    link = _text(row, 'link')
+    if len(link) > MAX_NAME_LENGTH:
+        raise RowError('link is at most 255 characters.')
+    return {
+        'user': row.get('user') or None,
+        'title': title,
+        'description': _text(row, 'description'),
+        'time_minutes': time_minutes,
+        'price': price,
+        'link': link,
+        'tags': _names(row.get('tags') or []),
+        'ingredients': _names(row.get('ingredients') or []),
+    }
+
+
+def _copy(cursor, model, columns, rows):
+    """COPY rows into the table of model."""
+    buffer = io.StringIO()
+    # Quoting every string keeps empty strings apart from NULL.
+    csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+    buffer.seek(0)
+    opts = model._meta
+    names = ', '.join(
+        connection.ops.quote_name(opts.get_field(c).column) for c in columns
+    )
+    cursor.copy_expert(
+        f'COPY {connection.ops.quote_name(opts.db_table)} ({names}) '
+        'FROM STDIN WITH (FORMAT csv)',
+        buffer,
+    )
+
+
+class Loader:
+    """Write batches of cleaned rows, remembering users and names."""
+
+    def __init__(self, default_user=None, create_users=False):
+        self.default_user = default_user
+        self.create_users = create_users
+        self.user_ids = {}
+        self.name_ids = {Tag: {}, Ingredient: {}}
+        self.use_copy = connection.vendor == 'postgresql'
+
+    def prepare(self, row):
+        """Return a raw row cleaned and owned, or raise RowError."""
+        recipe = clean_row(row)
+        recipe['user_id'] = self.user_id(recipe.pop('user'))
+        return recipe
+
+    def user_id(self, email):
+        """Return the id of the row's owner, or raise RowError."""
+        if not email:
+            if self.default_user is None:
+                raise RowError('No user given and no default user set.')
+            return self.default_user.pk
+        if email not in self.user_ids:
+            user_model = get_user_model()
+            user = user_model.objects.filter(email=email).first()
+            if user is None:
+                if not self.create_users:
+                    raise RowError(f'Unknown user {email!r}.')
+                user = user_model.objects.create_user(email=email)
+            self.user_ids[email] = user.pk
+        return self.user_ids[email]
+
+    def _name_map(self, model, user_id):
+        """Return the user's name to id map for model, loading it once."""
+        names = self.name_ids[model].get(user_id)
+        if names is None:
+            names = self.name_ids[model][user_id] = dict(
+                model.objects.filter(user_id=user_id)
+                .values_list('name', 'id')
+            )
+        return names
+
+    def _resolve(self, model, field, rows):
+        """Create missing names of model; return each row's linked ids."""
+        missing = {}
+        for row in rows:
+            names = self._name_map(model, row['user_id'])
+            for name in row[field]:
+                if name not in names:
+                    missing.setdefault(row['user_id'], set()).add(name)
+        if missing:
+            model.objects.bulk_create(
+                [
+                    model(user_id=user_id, name=name)
+                    for user_id, names in missing.items() for name in names
+                ],
+                ignore_conflicts=True,
+            )
+            for user_id, names in missing.items():
+                self._name_map(model, user_id).update(
+                    model.objects.filter(user_id=user_id, name__in=names)
+                    .values_list('name', 'id')
+                )
+        return [
+            [
+                self._name_map(model, row['user_id'])[name]
+                for name in row[field]
+            ]
+            for row in rows
+        ]
+
+    def _insert_recipes(self, rows, minhashes):
+        """Insert recipes and return their ids in row order."""
+        now = timezone.now()
+        if self.use_copy:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                    'FROM generate_series(1, %s)',
+                    [Recipe._meta.db_table, 'id', len(rows)],
+                )
+                ids = [row[0] for row in cursor.fetchall()]
+                _copy(cursor, Recipe, RECIPE_COLUMNS, (
+                    (
+                        recipe_id, r['user_id'], r['title'],
+                        r['description'], r['time_minutes'], r['price'],
+                        r['link'], '{}', now,
+                        None if minhash is None else '\\x' + minhash.hex(),
+                    )
+                    for recipe_id, r, minhash in zip(ids, rows, minhashes)
+                ))
+            return ids
+
+        objs = [
+            Recipe(
+                user_id=r['user_id'], title=r['title'],
+                description=r['description'],
+                time_minutes=r['time_minutes'], price=r['price'],
+                link=r['link'], minhash=minhash,
+            )
+            for r, minhash in zip(rows, minhashes)
+        ]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(objs)
+        else:
+            for obj in objs:
+                obj.save()
+        return [obj.id for obj in objs]
+
+    def _insert(self, model, columns, rows):
+        """Insert tuples of column values into the table of model."""
+        if not rows:
+            return
+        if self.use_copy:
+            with connection.cursor() as cursor:
+                _copy(cursor, model, columns, rows)
+        else:
+            model.objects.bulk_create(
+                model(**{
+                    model._meta.get_field(c).attname: v
+                    for c, v in zip(columns, row)
+                })
+                for row in rows
+            )
+
+    def load(self, rows):
+        """Write one batch of cleaned rows and return the new recipe ids."""
+        if not rows:
+            return []
+        try:
+            with transaction.atomic():
+                return self._load(rows)
+        except Exception:
+            # Names created by the rolled back batch no longer exist.
+            self.name_ids = {Tag: {}, Ingredient: {}}
+            raise
+
+    def _load(self, rows):
+        links = {
+            field: self._resolve(model, field, rows)
+            for field, model in (('tags', Tag), ('ingredients', Ingredient))
+        }
+        signatures = [
+            similar.stored_signature(similar.features(tag_ids, ingredient_ids))
+            for tag_ids, ingredient_ids in zip(
+                links['tags'], links['ingredients'],
+            )
+        ]
+        recipe_ids = self._insert_recipes(
+            rows, [minhash for minhash, _ in signatures],
+        )
+
+        for field, model in (('tags', Tag), ('ingredients', Ingredient)):
+            through = getattr(Recipe, field).through
+            self._insert(through, ('recipe', field[:-1]), [
+                (recipe_id, target_id)
+                for recipe_id, target_ids in zip(recipe_ids, links[field])
+                for target_id in target_ids
+            ])
+            # Fresh recipes only add links, so counts move by known deltas.
+            counts.add_counts(model, Counter(
+                target_id for target_ids in links[field]
+                for target_id in target_ids
+            ))
+        self._insert(RecipeBand, ('recipe', 'band', 'bucket'), [
+            (recipe_id, band, bucket)
+            for recipe_id, (_, buckets) in zip(recipe_ids, signatures)
+            for band, bucket in buckets
+        ])
+        search.refresh_search_vectors(recipe_ids)
+        for user_id in {r['user_id'] for r in rows}:
+            cache.bump_version(user_id)
+        return recipe_ids
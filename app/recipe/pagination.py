@@ -0,0 +1,51 @@
+"""
+Pagination classes for the recipe APIs.
+"""
+import math
+
+from django.conf import settings
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination over recipes ordered by newest first.
+
+    Cursors encode the last seen id, so every page is an index range scan
+    on ``(user_id, id)`` rather than an ever growing OFFSET.
+    """
+    ordering = '-id'
+    page_size = settings.RECIPE_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.RECIPE_MAX_PAGE_SIZE
+
+
+class RecipeSearchPagination(RecipeCursorPagination):
+    """Keyset pagination over search results, best ranked first.
+
+    Cursors hold the last rank seen and how many results on that rank
+    were already returned, so ties are resumed without skipping or
+    repeating recipes. Search querysets are ordered by ``(-rank, -id)``.
+    """
+    ordering = ('-rank', '-id')
+
+    def get_window(self, request):
+        """Return the page a request asks for as search_recipes kwargs."""
+        cursor = self.decode_cursor(request)
+        limit = self.get_page_size(request) + 1
+        if cursor is None:
+            return {'position': None, 'reverse': False, 'limit': limit}
+        position = cursor.position
+        if position is not None:
+            try:
+                position = float(position)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            if not math.isfinite(position):
+                raise NotFound(self.invalid_cursor_message)
+        return {
+            'position': position,
+            'reverse': cursor.reverse,
+            'limit': limit + cursor.offset,
+        }
@@ -0,0 +1,272 @@
+"""
+"Cook with what I have" matching over a user's recipes.
+
+Each user gets an in-process index where every recipe owns a bit position
+and every ingredient a bitmap (a Python int) of the recipes using it. A
+pantry lookup adds the bitmaps of the ingredients on hand into bit-sliced
+counters, then walks (matched, total) classes from the best coverage down,
+so its cost follows the size of the pantry and the page rather than the
+number of matching recipes.
+
+Indexes are keyed on the user's data version from :mod:`recipe.cache`.
+Writes bump it through :func:`bump_version` here with the links, unlinks
+and deletes they made, which are applied to the cached index once they
+commit. An index is only rebuilt when cold, or when the version moved for
+a write it was not told about, such as a bulk import or a write by
+another process.
+"""
+from collections import defaultdict
+from functools import partial
+
+from core.models import Ingredient, Recipe
+from recipe import cache
+
+_indexes = cache.LocalIndexCache(
+    'RECIPE_PANTRY_INDEX_MAX_USERS', 'RECIPE_PANTRY_INDEX_TTL',
+)
+
+
+def _top_bits(bitmap, limit):
+    """Yield up to limit set bit positions, highest first."""
+    while bitmap and limit:
+        bit = bitmap.bit_length() - 1
+        yield bit
+        bitmap ^= 1 << bit
+        limit -= 1
+
+
+class PantryIndex:
+    """Ingredient bitmaps over one user's recipes.
+
+    Patches replace link and name sets rather than change them, so a
+    match running meanwhile never iterates one mid-update.
+    """
+
+    def __init__(self, ingredients, links):
+        self.names = {}
+        self.ids_by_name = {}
+        self.recipes = {}
+        self.slots = {}
+        self.slot_recipes = []
+        self.bitmaps = defaultdict(int)
+        self.sizes = defaultdict(int)
+        self.add_ingredients(ingredients)
+        linked = defaultdict(set)
+        for recipe_id, ingredient_id in links:
+            linked[recipe_id].add(ingredient_id)
+        # Slots follow recipe ids, so higher bits are newer recipes. Recipes
+        # first linked by a patch take the next slot up.
+        for recipe_id in sorted(linked):
+            self.set_recipe(recipe_id, linked[recipe_id])
+
+    @classmethod
+    def for_user(cls, user_id):
+        """Load an index over every recipe owned by a user."""
+        return cls(
+            Ingredient.objects.filter(user_id=user_id)
+            .values_list('id', 'name'),
+            Recipe.ingredients.through.objects.filter(
+                recipe__user_id=user_id,
+            ).values_list('recipe_id', 'ingredient_id'),
+        )
+
+    def _slot(self, recipe_id):
+        slot = self.slots.get(recipe_id)
+        if slot is None:
+            slot = self.slots[recipe_id] = len(self.slot_recipes)
+            self.slot_recipes.append(recipe_id)
+        return slot
+
+    def _link(self, recipe_id, ingredient_ids):
+        """Toggle the recipe's bit for its ingredients and size."""
+        if not ingredient_ids:
+            return
+        bit = 1 << self._slot(recipe_id)
+        for ingredient_id in ingredient_ids:
+            self.bitmaps[ingredient_id] ^= bit
+        self.sizes[len(ingredient_ids)] ^= bit
+
+    def set_recipe(self, recipe_id, ingredient_ids):
+        """Index a recipe under exactly the named ingredient_ids."""
+        ingredient_ids = frozenset(
+            i for i in ingredient_ids if i in self.names
+        )
+        self._link(recipe_id, self.recipes.pop(recipe_id, frozenset()))
+        self._link(recipe_id, ingredient_ids)
+        if ingredient_ids:
+            self.recipes[recipe_id] = ingredient_ids
+
+    def link(self, recipe_id, ingredient_ids):
+        """Add ingredients to those a recipe is indexed under."""
+        linked = self.recipes.get(recipe_id, frozenset())
+        self.set_recipe(recipe_id, linked.union(ingredient_ids))
+
+    def unlink(self, recipe_id, ingredient_ids):
+        """Remove ingredients from those a recipe is indexed under."""
+        linked = self.recipes.get(recipe_id, frozenset())
+        self.set_recipe(recipe_id, linked.difference(ingredient_ids))
+
+    def drop_recipe(self, recipe_id):
+        """Stop matching a deleted recipe."""
+        self.set_recipe(recipe_id, ())
+
+    def name_ingredient(self, ingredient_id, name):
+        """Resolve and show an ingredient by name, replacing an old one."""
+        key = name.casefold()
+        old = self.names.get(ingredient_id)
+        if old is not None and old.casefold() != key:
+            self._forget_name(ingredient_id, old)
+        self.names[ingredient_id] = name
+        self.ids_by_name[key] = (
+            self.ids_by_name.get(key, frozenset()) | {ingredient_id}
+        )
+
+    def _forget_name(self, ingredient_id, name):
+        key = name.casefold()
+        self.ids_by_name[key] = self.ids_by_name[key] - {ingredient_id}
+
+    def drop_ingredient(self, ingredient_id):
+        """Unlink a deleted ingredient from every recipe and its name.
+
+        Its display name is kept until the next rebuild, for matches
+        already under way.
+        """
+        bitmap = self.bitmaps.get(ingredient_id, 0)
+        for slot in _top_bits(bitmap, len(self.slot_recipes)):
+            self.unlink(self.slot_recipes[slot], {ingredient_id})
+        self.bitmaps.pop(ingredient_id, None)
+        name = self.names.get(ingredient_id)
+        if name is not None:
+            self._forget_name(ingredient_id, name)
+
+    def add_ingredients(self, ingredients):
+        """Register (id, name) pairs so they can be resolved and shown."""
+        for ingredient_id, name in ingredients:
+            self.name_ingredient(ingredient_id, name)
+
+    def resolve(self, ingredient_ids=(), names=()):
+        """Return the ids of known ingredients given by id or name."""
+        found = {i for i in ingredient_ids if i in self.names}
+        for name in names:
+            found.update(self.ids_by_name.get(name.casefold(), ()))
+        return found
+
+    def _count_planes(self, available):
+        """Return bit planes counting the available ingredients per recipe.
+
+        Bit j of a recipe's count is its bit in planes[j].
+        """
+        planes = []
+        for ingredient_id in available:
+            carry = self.bitmaps.get(ingredient_id, 0)
+            for j, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[j], carry = plane ^ carry, plane & carry
+            if carry:
+                planes.append(carry)
+        return planes
+
+    def match(self, available, limit, min_coverage=0.0):
+        """Return (recipe_id, coverage, missing_ids) best covered first.
+
+        Only recipes sharing at least one ingredient with the pantry are
+        considered, ranked by coverage, then matched count, then newest.
+        """
+        planes = self._count_planes(available)
+        if not planes:
+            return []
+        sizes = dict(self.sizes)
+        most = min(len(available), (1 << len(planes)) - 1)
+        classes = sorted(
+            (
+                (count / size, count, size)
+                for size in sizes
+                for count in range(1, min(size, most) + 1)
+                if count >= min_coverage * size
+            ),
+            reverse=True,
+        )
+        results = []
+        for coverage, count, size in classes:
+            bitmap = sizes[size]
+            for j, plane in enumerate(planes):
+                bitmap &= plane if count >> j & 1 else ~plane
+            for slot in _top_bits(bitmap, limit - len(results)):
+                recipe_id = self.slot_recipes[slot]
+                linked = self.recipes.get(recipe_id, frozenset())
+                missing = sorted(linked - available)
+                results.append((recipe_id, coverage, missing))
+            if len(results) == limit:
+                break
+        return results
+
+
+def _apply(changes, index):
+    """Patch index with (method name, *args) changes from a commit.
+
+    Ingredients the changes link are named first; ones deleted since the
+    write are not found and so are left unlinked.
+    """
+    linked = set()
+    for name, *args in changes:
+        if name in ('set_recipe', 'link'):
+            linked.update(args[1])
+    unnamed = linked - index.names.keys()
+    if unnamed:
+        index.add_ingredients(
+            Ingredient.objects.filter(id__in=unnamed)
+            .values_list('id', 'name')
+        )
+    for name, *args in changes:
+        getattr(index, name)(*args)
+
+
+def _advance(user_id, changes, version, committed):
+    update = partial(_apply, changes) if committed and changes else None
+    _indexes.advance(user_id, version, update)
+
+
+def bump_version(user_id, *changes):
+    """Bump the user's data version for a write that made changes.
+
+    Each change names a :class:`PantryIndex` method and its arguments. An
+    index cached just before one of the bump's increments is carried over
+    it, and patched with the changes once the write has committed.
+    """
+    cache.bump_version(user_id, partial(_advance, user_id, changes))
+
+
+def get_index(user_id):
+    """Return the user's pantry index for their current data version."""
+    return _indexes.get(user_id, PantryIndex.for_user)
+
+
+def clear_indexes():
+    """Drop every in-process pantry index."""
+    _indexes.clear()
+
+
+def find_matches(user_id, ingredient_ids=(), names=(), limit=50,
+                 min_coverage=0.0):
+    """Return the user's recipes ranked by how much of each is on hand."""
+    index = get_index(user_id)
+    available = index.resolve(ingredient_ids, names)
+    matches = index.match(available, limit, min_coverage)
+    titles = dict(
+        Recipe.objects.filter(
+            id__in=[recipe_id for recipe_id, _, _ in matches],
+        ).values_list('id', 'title')
+    )
+    return [
+        {
+            'id': recipe_id,
+            'title': titles[recipe_id],
+            'coverage': round(coverage, 4),
+            'missing': [
+                {'id': i, 'name': index.names[i]} for i in missing
+            ],
+        }
+        for recipe_id, coverage, missing in matches
+        if recipe_id in titles
+    ]
@@ -0,0 +1,248 @@
+"""
+Ranked full-text search over recipes.
+
+Recipes are matched on their title, description, tag names and ingredient
+names. On Postgres the text is kept in ``Recipe.search_vector`` (a GIN
+indexed ``tsvector``) and ranked with ``ts_rank``. Other databases, and
+deployments that set ``RECIPE_SEARCH_BACKEND = 'python'``, use a per-user
+inverted index held in process and rebuilt when the user's data version
+moves on.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection
+from django.db.models import (
+    Case,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast
+
+from core.models import Ingredient, Recipe, Tag
+from recipe import cache
+
+BACKEND_AUTO = 'auto'
+BACKEND_POSTGRES = 'postgres'
+BACKEND_PYTHON = 'python'
+
+# Same relative weights Postgres applies to labels A, B and C in ts_rank.
+TITLE_WEIGHT = 1.0
+RELATION_WEIGHT = 0.4
+DESCRIPTION_WEIGHT = 0.2
+
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for from in into is it of on or the '
+    'to was with'.split()
+)
+TOKEN_RE = re.compile(r'\w+')
+
+# Most recipe ids the Python backend checks against a queryset at once.
+MAX_CANDIDATES_PER_QUERY = 500
+
+_indexes = cache.LocalIndexCache('RECIPE_SEARCH_INDEX_MAX_USERS')
+
+
+def get_backend(setting='RECIPE_SEARCH_BACKEND'):
+    """Return the backend a setting selects for the default database."""
+    backend = getattr(settings, setting)
+    if backend == BACKEND_AUTO:
+        if connection.vendor == 'postgresql':
+            return BACKEND_POSTGRES
+        return BACKEND_PYTHON
+    return backend
+
+
+def tokenize(text):
+    """Split text into lower cased, lightly stemmed search terms."""
+    terms = []
+    for word in TOKEN_RE.findall(text.lower()):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def _names(model):
+    """Return a subquery joining the names linked to the outer recipe."""
+    return Subquery(
+        model.objects.filter(recipe=OuterRef('pk'))
+        .values('recipe')
+        .annotate(names=StringAgg('name', ' '))
+        .values('names')
+    )
+
+
+def refresh_search_vectors(recipe_ids):
+    """Recompute the stored search vector for the given recipes."""
+    if connection.vendor != 'postgresql' or not recipe_ids:
+        return
+    config = settings.RECIPE_SEARCH_CONFIG
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        search_vector=(
+            SearchVector('title', weight='A', config=config)
+            + SearchVector(
+                _names(Tag), _names(Ingredient), weight='B', config=config,
+            )
+            + SearchVector('description', weight='C', config=config)
+        ),
+    )
+
+
+class InvertedIndex:
+    """Term to posting list index over one user's recipes."""
+
+    def __init__(self, recipes, tag_links, ingredient_links):
+        self.postings = defaultdict(dict)
+        relations = defaultdict(list)
+        for recipe_id, name in tag_links:
+            relations[recipe_id].append(name)
+        for recipe_id, name in ingredient_links:
+            relations[recipe_id].append(name)
+
+        self.size = 0
+        for recipe_id, title, description in recipes:
+            self.size += 1
+            scores = Counter()
+            for weight, text in (
+                (TITLE_WEIGHT, title),
+                (RELATION_WEIGHT, ' '.join(relations[recipe_id])),
+                (DESCRIPTION_WEIGHT, description or ''),
+            ):
+                for term in tokenize(text):
+                    scores[term] += weight
+            for term, score in scores.items():
+                self.postings[term][recipe_id] = score
+
+    @classmethod
+    def for_user(cls, user_id):
+        """Load an index over every recipe owned by a user."""
+        through_filter = {'recipe__user_id': user_id}
+        return cls(
+            Recipe.objects.filter(user_id=user_id)
+            .values_list('id', 'title', 'description'),
+            Recipe.tags.through.objects.filter(**through_filter)
+            .values_list('recipe_id', 'tag__name'),
+            Recipe.ingredients.through.objects.filter(**through_filter)
+            .values_list('recipe_id', 'ingredient__name'),
+        )
+
+    def search(self, text, limit=None):
+        """Return ids of recipes matching every term, best first."""
+        terms = set(tokenize(text))
+        postings = [self.postings.get(term, {}) for term in terms]
+        if not postings:
+            return []
+        postings.sort(key=len)
+        matches = set(postings[0]).intersection(*postings[1:])
+        if not matches:
+            return []
+        ranked = Counter()
+        for posting in postings:
+            idf = math.log(1 + self.size / len(posting))
+            for recipe_id in matches:
+                ranked[recipe_id] += posting[recipe_id] * idf
+        return [
+            recipe_id for recipe_id, _ in sorted(
+                ranked.items(), key=lambda item: (-item[1], -item[0]),
+            )[:limit]
+        ]
+
+
+def get_index(user_id):
+    """Return the user's inverted index for their current data version."""
+    return _indexes.get(user_id, InvertedIndex.for_user)
+
+
+def clear_indexes():
+    """Drop every in-process search index."""
+    _indexes.clear()
+
+
+def _admitted(queryset, candidates, limit):
+    """Return up to limit of candidates that queryset admits, in order.
+
+    Candidates are checked in chunks that double up to
+    MAX_CANDIDATES_PER_QUERY, so each statement stays bounded however
+    many recipes matched.
+    """
+    admitted = []
+    chunk = min(limit, MAX_CANDIDATES_PER_QUERY)
+    start = 0
+    while start < len(candidates) and len(admitted) < limit:
+        ids = candidates[start:start + chunk]
+        found = set(
+            queryset.filter(id__in=ids).values_list('id', flat=True)
+        )
+        admitted.extend(i for i in ids if i in found)
+        start += len(ids)
+        chunk = min(chunk * 2, MAX_CANDIDATES_PER_QUERY)
+    return admitted[:limit]
+
+
+def search_recipes(queryset, user_id, text, backend=None, position=None,
+                   reverse=False, limit=None):
+    """Filter queryset to recipes matching text, ordered by rank.
+
+    Results carry a ``rank`` annotation and are ordered by
+    ``(-rank, -id)``, which search pagination resumes from.
+
+    The Python backend ranks in process and only fetches the page being
+    served: the ``limit`` best matches ranked below the cursor
+    ``position`` (above it when ``reverse``). Without a limit every match
+    is fetched.
+    """
+    backend = backend or get_backend()
+    if backend == BACKEND_POSTGRES:
+        query = SearchQuery(
+            text, config=settings.RECIPE_SEARCH_CONFIG,
+            search_type='websearch',
+        )
+        # ts_rank returns a real; as a double it survives the round trip
+        # through a cursor exactly.
+        return queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+        ).order_by('-rank', '-id')
+
+    # The index ranks in Python, so minus each match's position stands in
+    # for its score; positions do not depend on the page fetched.
+    ranks = {
+        recipe_id: -i
+        for i, recipe_id in enumerate(get_index(user_id).search(text))
+    }
+    candidates = list(ranks)
+    if limit is not None:
+        if position is not None:
+            cursor = max(-int(position), -1)
+            if reverse:
+                candidates = candidates[:max(cursor, 0)][::-1]
+            else:
+                candidates = candidates[cursor + 1:]
+        elif reverse:
+            candidates.reverse()
+        candidates = _admitted(queryset, candidates, limit)
+    queryset = queryset.filter(id__in=candidates)
+    if not candidates:
+        return queryset.annotate(
+            rank=Value(0, output_field=IntegerField()),
+        )
+    return queryset.annotate(rank=Case(
+        *(When(id=recipe_id, then=Value(ranks[recipe_id]))
+          for recipe_id in candidates),
+        output_field=IntegerField(),
+    )).order_by('-rank', '-id')
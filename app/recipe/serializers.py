@@ -1,5 +1,14 @@
 """Serializers for recipe API"""
 
+import hashlib
+from collections import defaultdict
+
+from django import forms
+from django.db import transaction
+from django.urls import reverse
+from django.utils.http import urlencode
+from drf_spectacular.utils import extend_schema_field
+from drf_spectacular.types import OpenApiTypes
 from rest_framework import serializers
 
 from core.models import (
@@ -7,9 +16,47 @@ from core.models import (
     Tag,
     Ingredient
     )
+from recipe import counts, images, pantry
+from recipe.filters import recipe_link
+from recipe.signals import relations_changed
+
+
+def recipe_image_url(recipe, request, **params):
+    """Return the authenticated download URL of a recipe's image.
+
+    The URL carries the image version, so it changes with the image and
+    its responses can be cached indefinitely.
+    """
+    params['v'] = images.image_version(recipe.image.name)
+    url = '{}?{}'.format(
+        reverse('recipe:recipe-image-file', args=[recipe.id]),
+        urlencode(params),
+    )
+    if request is not None:
+        url = request.build_absolute_uri(url)
+    return url
+
+
+class BaseRecipeAttrSerializer(serializers.ModelSerializer):
+    """Base serializer for recipe attributes."""
+
+    def validate_name(self, value):
+        """Reject renaming onto a name the user already has."""
+        if self.instance is None or self.parent is not None:
+            return value
+        model = self.Meta.model
+        clash = model.objects.filter(
+            user=self.instance.user,
+            name=value,
+        ).exclude(id=self.instance.id)
+        if clash.exists():
+            raise serializers.ValidationError(
+                f'{model.__name__} with this name already exists.'
+            )
+        return value
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(BaseRecipeAttrSerializer):
     """Serializer for ingredients."""
 
     class Meta:
@@ -18,7 +65,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(BaseRecipeAttrSerializer):
     """Serializer for tags."""
 
     class Meta:
@@ -27,6 +74,132 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class IngredientCountSerializer(IngredientSerializer):
+    """Serializer for ingredients with the number of recipes using them."""
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['recipe_count']
+        read_only_fields = ['id', 'recipe_count']
+
+
+class TagCountSerializer(TagSerializer):
+    """Serializer for tags with the number of recipes using them."""
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+        read_only_fields = ['id', 'recipe_count']
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Write many recipes with set-based queries in one transaction.
+
+    Bulk inserts and through table writes skip model signals, so the
+    derived state they would maintain is refreshed once for the batch.
+    """
+    relations = (('tags', Tag), ('ingredients', Ingredient))
+
+    def _resolve(self, validated_data, field, model):
+        """Return the batch's objects for field by name, creating any."""
+        items = [
+            item for data in validated_data for item in data.get(field) or []
+        ]
+        return {
+            obj.name: obj
+            for obj in self.child._get_or_create_all(model, items)
+        }
+
+    def _link(self, recipes, validated_data, field, model, created):
+        """Diff and write the links of recipes whose data carries field.
+
+        Returns the target ids wanted by each of those recipes and the ids
+        of tags or ingredients that gained or lost links.
+        """
+        by_name = self._resolve(validated_data, field, model)
+        wanted = {
+            recipe.id: {by_name[item['name']].id for item in data[field]}
+            for recipe, data in zip(recipes, validated_data)
+            if data.get(field) is not None
+        }
+        if not wanted:
+            return wanted, set()
+        through, target = recipe_link(model)
+        column = f'{target}_id'
+        existing = defaultdict(dict)
+        if not created:
+            for pk, recipe_id, target_id in through.objects.filter(
+                recipe_id__in=wanted,
+            ).values_list('pk', 'recipe_id', column):
+                existing[recipe_id][target_id] = pk
+
+        stale = {}
+        new = []
+        for recipe_id, target_ids in wanted.items():
+            for target_id, pk in existing[recipe_id].items():
+                if target_id not in target_ids:
+                    stale[pk] = target_id
+            new.extend(
+                through(recipe_id=recipe_id, **{column: target_id})
+                for target_id in target_ids - existing[recipe_id].keys()
+            )
+        if stale:
+            through.objects.filter(pk__in=stale).delete()
+        through.objects.bulk_create(new)
+        changed = set(stale.values()) | {getattr(row, column) for row in new}
+        return wanted, changed
+
+    def _write_relations(self, recipes, validated_data, created=False):
+        """Link the batch and refresh the state that signals would keep."""
+        wanted = {}
+        for field, model in self.relations:
+            wanted[field], changed = self._link(
+                recipes, validated_data, field, model, created,
+            )
+            if changed:
+                counts.recount(model, model.objects.filter(id__in=changed))
+        if recipes:
+            relations_changed.send(
+                sender=Recipe, recipe_ids=[recipe.id for recipe in recipes],
+            )
+            changes = {recipe.user_id: [] for recipe in recipes}
+            for recipe in recipes:
+                ingredient_ids = wanted['ingredients'].get(recipe.id)
+                if ingredient_ids is not None:
+                    changes[recipe.user_id].append(
+                        ('set_recipe', recipe.id, ingredient_ids),
+                    )
+            for user_id, user_changes in changes.items():
+                pantry.bump_version(user_id, *user_changes)
+
+    @staticmethod
+    def _fields(data):
+        return {
+            attr: value for attr, value in data.items()
+            if attr not in ('tags', 'ingredients')
+        }
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """Create every recipe with one insert per table."""
+        recipes = Recipe.objects.bulk_create(
+            Recipe(**self._fields(data)) for data in validated_data
+        )
+        self._write_relations(recipes, validated_data, created=True)
+        return recipes
+
+    @transaction.atomic
+    def update(self, instances, validated_data):
+        """Update recipes given in the same order as validated_data."""
+        fields = set()
+        for recipe, data in zip(instances, validated_data):
+            for attr, value in self._fields(data).items():
+                setattr(recipe, attr, value)
+                fields.add(attr)
+        if fields:
+            Recipe.objects.bulk_update(instances, fields)
+        self._write_relations(instances, validated_data)
+        return instances
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for recipes."""
     tags = TagSerializer(many=True, required=False)
@@ -37,28 +210,44 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'time_minutes', 'price', 'link', 'tags',
                   'ingredients']
         read_only_fields = ['id']
+        list_serializer_class = RecipeListSerializer
 
-    def _get_or_create_tags(self, tags, recipe):
-        """Handle getting or creating tags."""
+    def _get_or_create_all(self, model, items):
+        """Return objects for the named items, bulk creating missing ones."""
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, create = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
-
+        names = list(dict.fromkeys(item['name'] for item in items))
+        if not names:
+            return []
+        found = {
+            obj.name: obj
+            for obj in model.objects.filter(user=auth_user, name__in=names)
+        }
+        missing = [name for name in names if name not in found]
+        if missing:
+            model.objects.bulk_create(
+                [model(user=auth_user, name=name) for name in missing],
+                ignore_conflicts=True,
             )
-            recipe.tags.add(tag_obj)
+            found.update(
+                (obj.name, obj)
+                for obj in model.objects.filter(
+                    user=auth_user,
+                    name__in=missing,
+                )
+            )
+        return [found[name] for name in names]
+
+    def _get_or_create_tags(self, tags, recipe):
+        """Handle getting or creating tags."""
+        recipe.tags.add(*self._get_or_create_all(Tag, tags))
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Handle getting or creating ingredient when needed."""
-        auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, create = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
-            )
-            recipe.ingredients.add(ingredient_obj)
+        objs = self._get_or_create_all(Ingredient, ingredients)
+        recipe.ingredients.add(*objs)
+        return objs
 
+    @transaction.atomic
     def create(self, validate_data):
         """Create a recipe"""
         tags = validate_data.pop('tags', [])
@@ -69,18 +258,20 @@ class RecipeSerializer(serializers.ModelSerializer):
         self._get_or_create_ingredients(ingredients, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validate_data):
         """Update Recipe."""
         tags = validate_data.pop('tags', None)
         ingredients = validate_data.pop('ingredients', None)
 
+        # set() diffs against the current links, so only removed and new
+        # through rows are written.
         if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
+            instance.tags.set(self._get_or_create_all(Tag, tags))
 
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
+            ingredients = self._get_or_create_all(Ingredient, ingredients)
+            instance.ingredients.set(ingredients)
 
         for attr, value in validate_data.items():
             setattr(instance, attr, value)
@@ -89,11 +280,57 @@ class RecipeSerializer(serializers.ModelSerializer):
         return instance
 
 
+class PantryMatchSerializer(serializers.Serializer):
+    """Serializer for a recipe matched against the user's pantry."""
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    coverage = serializers.FloatField()
+    missing = IngredientSerializer(many=True)
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    """Serializer for a recipe found similar to another."""
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['similarity']
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializer for recipe detail view"""
+    image = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        fields = RecipeSerializer.Meta.fields + [
+            'description', 'image', 'image_variants',
+        ]
+
+    @extend_schema_field(OpenApiTypes.URI)
+    def get_image(self, recipe):
+        """Return the URL of the image download endpoint."""
+        if not recipe.image:
+            return None
+        return recipe_image_url(recipe, self.context.get('request'))
+
+    @extend_schema_field(OpenApiTypes.OBJECT)
+    def get_image_variants(self, recipe):
+        """Return variant URLs keyed by size and then format."""
+        request = self.context.get('request')
+        return {
+            size: {
+                fmt: recipe_image_url(
+                    recipe, request, size=size, variant_format=fmt,
+                )
+                for fmt in formats
+            }
+            for size, formats in recipe.image_variants.items()
+        }
+
+
+class AnyNameImageField(forms.ImageField):
+    """Image form field accepting any file name Pillow can read."""
+    default_validators = []
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
@@ -103,4 +340,59 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ['id', 'image']
         read_only_fields = ['id']
-        extra_kwargs = {'image': {'required': 'True'}}
+        # Files are named after the format Pillow detects, so the client's
+        # file name, and its extension, are not checked.
+        extra_kwargs = {'image': {
+            'required': 'True',
+            'validators': [],
+            '_DjangoImageField': AnyNameImageField,
+        }}
+
+    def to_representation(self, instance):
+        """Point image at the authenticated download endpoint."""
+        data = super().to_representation(instance)
+        if instance.image:
+            data['image'] = recipe_image_url(
+                instance, self.context.get('request'),
+            )
+        return data
+
+    def _content_hash(self, image):
+        """Return the upload's SHA-256, hashing it if no handler did."""
+        digest = getattr(image, 'content_hash', None)
+        if digest is None:
+            hasher = hashlib.sha256()
+            for chunk in image.chunks():
+                hasher.update(chunk)
+            digest = hasher.hexdigest()
+        return digest
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        """Store the image by content hash, sharing identical files."""
+        image = validated_data['image']
+        old_name = instance.image.name
+        storage = instance.image.storage
+        ext = images.EXTENSIONS.get(image.image.format, '.img')
+
+        instance.image_digest = self._content_hash(image)
+        name = instance.image.field.generate_filename(instance, f'image{ext}')
+        # Holding the reference first keeps a concurrent release from
+        # deleting the file between the check and the commit.
+        images.acquire(name)
+        if storage.exists(name):
+            validated_data['image'] = name
+            if name != old_name:
+                instance.image_variants = images.shared_variants(
+                    name, instance.id,
+                )
+        else:
+            # Store under the name the reference is counted on, not one
+            # derived from the client's file name.
+            validated_data['image'] = storage.save(name, image)
+            instance.image_variants = {}
+
+        instance = super().update(instance, validated_data)
+        if old_name:
+            images.release(old_name, storage)
+        return instance
@@ -0,0 +1,177 @@
+"""
+Signal handlers for the recipe app.
+"""
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from core.models import Ingredient, Recipe, Tag
+from recipe import counts, images, pantry, search, similar
+
+# Sent with ``recipe_ids`` whenever the tags or ingredients linked to those
+# recipes change, including renames and deletes of a tag or ingredient.
+relations_changed = Signal()
+
+
+SEARCHED_FIELDS = frozenset(('title', 'description'))
+
+
+def _linked_recipe_ids(instance):
+    """Return ids of recipes linked to a tag or ingredient."""
+    return list(instance.recipe_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def bump_owner_version(sender, instance, signal, **kwargs):
+    """Invalidate the owner's cached responses after a write."""
+    changes = []
+    if sender is Recipe and signal is post_delete:
+        changes.append(('drop_recipe', instance.pk))
+    elif sender is Ingredient and signal is post_delete:
+        changes.append(('drop_ingredient', instance.pk))
+    elif sender is Ingredient:
+        changes.append(('name_ingredient', instance.pk, instance.name))
+    pantry.bump_version(instance.user_id, *changes)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image(sender, instance, **kwargs):
+    """Drop the deleted recipe's reference to its image file."""
+    if instance.image:
+        images.release(instance.image.name, instance.image.storage)
+
+
+def _pantry_changes(instance, action, reverse, pk_set, recipe_ids):
+    """Return the pantry index changes of an ingredient link change."""
+    if not reverse:
+        if action == 'post_clear':
+            return [('set_recipe', instance.pk, ())]
+        method = 'link' if action == 'post_add' else 'unlink'
+        return [(method, instance.pk, frozenset(pk_set))]
+    method = 'link' if action == 'post_add' else 'unlink'
+    return [(method, recipe_id, {instance.pk}) for recipe_id in recipe_ids]
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def relink(sender, instance, action, reverse, pk_set, **kwargs):
+    """Report recipes whose links changed through either side of the M2M."""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_recipe_ids = _linked_recipe_ids(instance)
+    if not action.startswith('post_'):
+        return
+
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'post_clear':
+        recipe_ids = instance.__dict__.pop('_cleared_recipe_ids', [])
+    else:
+        recipe_ids = list(pk_set)
+    changes = []
+    if sender is Recipe.ingredients.through:
+        changes = _pantry_changes(instance, action, reverse, pk_set,
+                                  recipe_ids)
+    pantry.bump_version(instance.user_id, *changes)
+    if recipe_ids:
+        relations_changed.send(sender=Recipe, recipe_ids=recipe_ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_links(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Move recipe_count on tags and ingredients as links come and go."""
+    if counts.is_deferred():
+        return
+    counted = type(instance) if reverse else model
+    field = sender._meta.get_field(counted._meta.model_name).attname
+    own, other = (field, 'recipe_id') if reverse else ('recipe_id', field)
+    if action in ('pre_remove', 'pre_clear'):
+        # Only links that really exist lower the counts.
+        rows = sender.objects.filter(**{own: instance.pk})
+        if pk_set is not None:
+            rows = rows.filter(**{f'{other}__in': pk_set})
+        instance._unlinked_ids = list(rows.values_list(other, flat=True))
+        return
+    if action == 'post_add':
+        ids, delta = pk_set, 1
+    elif action in ('post_remove', 'post_clear'):
+        ids, delta = instance.__dict__.pop('_unlinked_ids', []), -1
+    else:
+        return
+    if reverse:
+        counts.add(counted, [instance.pk], delta * len(ids))
+    else:
+        counts.add(counted, ids, delta)
+
+
+@receiver(pre_delete, sender=Recipe)
+def uncount_recipe(sender, instance, **kwargs):
+    """Lower the counts of the tags and ingredients a recipe used."""
+    if counts.is_deferred():
+        return
+    for model in (Tag, Ingredient):
+        model.objects.filter(recipe=instance).update(
+            recipe_count=F('recipe_count') - 1,
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def rename_attr(sender, instance, created, **kwargs):
+    """Report recipes showing a tag or ingredient that was renamed."""
+    if not created:
+        recipe_ids = _linked_recipe_ids(instance)
+        if recipe_ids:
+            relations_changed.send(sender=Recipe, recipe_ids=recipe_ids)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_unlinked_recipes(sender, instance, **kwargs):
+    """Capture linked recipes before the through rows cascade away."""
+    instance._deleted_recipe_ids = _linked_recipe_ids(instance)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def unlink_deleted_attr(sender, instance, **kwargs):
+    """Report recipes that lost a deleted tag or ingredient."""
+    recipe_ids = instance.__dict__.pop('_deleted_recipe_ids', [])
+    if recipe_ids:
+        relations_changed.send(sender=Recipe, recipe_ids=recipe_ids)
+
+
+@receiver(relations_changed)
+def touch_recipes(sender, recipe_ids, **kwargs):
+    """Move updated_at forward for recipes whose relations changed."""
+    Recipe.objects.filter(id__in=recipe_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, update_fields, **kwargs):
+    """Refresh the search vector when a recipe's text may have changed."""
+    if update_fields is None or SEARCHED_FIELDS.intersection(update_fields):
+        search.refresh_search_vectors([instance.pk])
+
+
+@receiver(relations_changed)
+def reindex_recipes(sender, recipe_ids, **kwargs):
+    """Refresh search vectors for recipes whose tag or ingredient changed."""
+    search.refresh_search_vectors(recipe_ids)
+
+
+@receiver(relations_changed)
+def refresh_signatures(sender, recipe_ids, **kwargs):
+    """Recompute MinHash signatures for recipes whose relations changed."""
+    similar.refresh_signatures(recipe_ids)
@@ -0,0 +1,150 @@
+"""
+Similar recipes by Jaccard similarity of their tag and ingredient sets.
+
+Every recipe stores a MinHash signature of its tags and ingredients and
+one LSH bucket per band of that signature in ``RecipeBand``. Recipes that
+share a bucket in any band become candidates; candidates are re-ranked by
+their estimated Jaccard similarity with NumPy and the shortlist is scored
+exactly from the through tables. Lookups therefore touch a handful of
+buckets instead of every pair of recipes.
+"""
+import hashlib
+
+import numpy as np
+from django.db.models import Q
+
+from core.models import Recipe, RecipeBand
+
+# 16 bands of 4 rows put the LSH threshold near a Jaccard similarity of
+# (1 / 16) ** (1 / 4) = 0.5. Changing these invalidates stored signatures.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+PRIME = (1 << 31) - 1
+SEED = 1801
+
+_rng = np.random.default_rng(SEED)
+_A = _rng.integers(1, PRIME, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, PRIME, size=NUM_PERM, dtype=np.uint64)
+
+# Candidates re-ranked per lookup and shortlist scored exactly, per result.
+MAX_CANDIDATES = 5000
+SHORTLIST_FACTOR = 4
+
+
+def features(tag_ids, ingredient_ids):
+    """Return the feature ids of a recipe's tag and ingredient sets."""
+    return {2 * i for i in tag_ids} | {2 * i + 1 for i in ingredient_ids}
+
+
+def compute_signature(feature_ids):
+    """Return the MinHash signature of a set of feature ids, or None."""
+    if not feature_ids:
+        return None
+    x = np.fromiter(feature_ids, dtype=np.uint64) % PRIME
+    hashes = (_A[:, None] * x[None, :] + _B[:, None]) % PRIME
+    return hashes.min(axis=1).astype(np.uint32)
+
+
+def band_buckets(signature):
+    """Return the (band, bucket) pairs of a signature."""
+    return [
+        (
+            band,
+            int.from_bytes(
+                hashlib.blake2b(
+                    signature[band * ROWS:(band + 1) * ROWS].tobytes(),
+                    digest_size=8,
+                ).digest(),
+                'big',
+                signed=True,
+            ),
+        )
+        for band in range(BANDS)
+    ]
+
+
+def stored_signature(feature_ids):
+    """Return the stored minhash and (band, bucket) pairs of a feature set.
+
+    A recipe without tags or ingredients has no minhash and no buckets.
+    """
+    signature = compute_signature(feature_ids)
+    if signature is None:
+        return None, []
+    return signature.tobytes(), band_buckets(signature)
+
+
+def _load_features(recipe_ids):
+    """Return feature id sets for recipes, keyed by recipe id."""
+    linked = {}
+    for field in ('tags', 'ingredients'):
+        linked[field] = {recipe_id: [] for recipe_id in recipe_ids}
+        through = getattr(Recipe, field).through
+        for recipe_id, target_id in through.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).values_list('recipe_id', f'{field[:-1]}_id'):
+            linked[field][recipe_id].append(target_id)
+    return {
+        recipe_id: features(
+            linked['tags'][recipe_id], linked['ingredients'][recipe_id],
+        )
+        for recipe_id in recipe_ids
+    }
+
+
+def refresh_signatures(recipe_ids):
+    """Recompute the signature and LSH buckets of the given recipes."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    recipes = []
+    bands = []
+    for recipe_id, feature_ids in _load_features(recipe_ids).items():
+        minhash, buckets = stored_signature(feature_ids)
+        bands.extend(
+            RecipeBand(recipe_id=recipe_id, band=band, bucket=bucket)
+            for band, bucket in buckets
+        )
+        recipes.append(Recipe(id=recipe_id, minhash=minhash))
+
+    Recipe.objects.bulk_update(recipes, ['minhash'])
+    RecipeBand.objects.filter(recipe_id__in=recipe_ids).delete()
+    RecipeBand.objects.bulk_create(bands)
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+
+def similar_recipes(recipe, limit):
+    """Return up to limit (recipe_id, similarity) pairs, best first."""
+    if recipe.minhash is None:
+        return []
+    signature = np.frombuffer(bytes(recipe.minhash), dtype=np.uint32)
+    shared = Q()
+    for band, bucket in band_buckets(signature):
+        shared |= Q(band=band, bucket=bucket)
+    buckets = RecipeBand.objects.filter(shared).values('recipe_id')
+    rows = Recipe.objects.filter(
+        user_id=recipe.user_id, id__in=buckets,
+    ).exclude(id=recipe.id).order_by('-id').values_list('id', 'minhash')
+    rows = list(rows[:MAX_CANDIDATES])
+    if not rows:
+        return []
+
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64)
+    matrix = np.frombuffer(
+        b''.join(bytes(row[1]) for row in rows), dtype=np.uint32,
+    ).reshape(len(rows), NUM_PERM)
+    estimates = (matrix == signature).mean(axis=1)
+    shortlist = ids[np.argsort(-estimates, kind='stable')]
+    shortlist = shortlist[:limit * SHORTLIST_FACTOR].tolist()
+
+    sets = _load_features([recipe.id, *shortlist])
+    target = sets.pop(recipe.id)
+    scored = sorted(
+        ((_jaccard(target, sets[i]), i) for i in shortlist if sets[i]),
+        reverse=True,
+    )
+    return [(recipe_id, score) for score, recipe_id in scored[:limit]]
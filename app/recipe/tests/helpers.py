@@ -0,0 +1,41 @@
+"""
+Factories and fixtures shared by the recipe API tests.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Create and return a new user."""
+    return get_user_model().objects.create_user(
+        email=email, password=password,
+    )
+
+
+def create_recipe(user, tags=(), ingredients=(), **params):
+    """Create and return a sample recipe linked to tags and ingredients."""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    recipe = Recipe.objects.create(user=user, **defaults)
+    recipe.tags.add(*tags)
+    recipe.ingredients.add(*ingredients)
+    return recipe
+
+
+class AuthenticatedClientMixin:
+    """Set up self.user and an API client authenticated as them."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
@@ -0,0 +1,155 @@
+"""
+Tests for the tag and ingredient autocomplete APIs.
+"""
+import time
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Tag
+from recipe import completion
+
+INGREDIENTS_URL = reverse('recipe:ingredient-autocomplete')
+TAGS_URL = reverse('recipe:tag-autocomplete')
+
+
+class NameIndexTests(TestCase):
+    """Test the in-process sorted name index."""
+
+    def setUp(self):
+        self.index = completion.NameIndex(
+            [(1, 'Garlic'), (2, 'garam masala'), (3, 'Ginger'),
+             (4, 'Black garlic'), (5, 'Gar')],
+        )
+
+    def test_prefix_by_binary_search(self):
+        """Test prefixes match case-insensitively in name order."""
+        self.assertEqual(
+            self.index.prefix('GAR', 10),
+            [(5, 'Gar'), (2, 'garam masala'), (1, 'Garlic')],
+        )
+        self.assertEqual(self.index.prefix('gar', 2),
+                         [(5, 'Gar'), (2, 'garam masala')])
+        self.assertEqual(self.index.prefix('z', 10), [])
+
+    def test_fuzzy_puts_prefixes_first(self):
+        """Test substring matches follow prefix matches."""
+        self.assertEqual(
+            [pk for pk, _ in self.index.fuzzy('garlic', 10)], [1, 4],
+        )
+
+
+class AutocompleteTestsMixin:
+    """Autocomplete behaviour shared by every backend."""
+
+    def setUp(self):
+        completion.clear_indexes()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for name in ('Garlic', 'garam masala', 'Ginger', 'Black garlic'):
+            Ingredient.objects.create(user=self.user, name=name)
+
+    def _names(self, url, **params):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in res.data]
+
+    def test_prefix_is_case_insensitive(self):
+        """Test prefix matches ignore case and are ordered by name."""
+        self.assertEqual(
+            self._names(INGREDIENTS_URL, prefix='GAR'),
+            ['garam masala', 'Garlic'],
+        )
+
+    def test_limit(self):
+        """Test limit caps the number of matches."""
+        self.assertEqual(
+            self._names(INGREDIENTS_URL, prefix='g', limit=1),
+            ['garam masala'],
+        )
+
+    def test_q_ranks_prefix_matches_first(self):
+        """Test q finds names containing the text, prefixes first."""
+        self.assertEqual(
+            self._names(INGREDIENTS_URL, q='garlic')[:2],
+            ['Garlic', 'Black garlic'],
+        )
+
+    def test_limited_to_user(self):
+        """Test other users' names are never suggested."""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        Ingredient.objects.create(user=other, name='Garden peas')
+
+        self.assertNotIn(
+            'Garden peas', self._names(INGREDIENTS_URL, prefix='gar'),
+        )
+
+    def test_tags_autocomplete(self):
+        """Test tags are completed from the tag table."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TAGS_URL, {'prefix': 've'})
+
+        self.assertEqual(res.data, [{'id': tag.id, 'name': 'Vegan'}])
+
+    def test_new_names_are_suggested(self):
+        """Test names created after a lookup are found."""
+        self._names(INGREDIENTS_URL, prefix='gi')
+        Ingredient.objects.create(user=self.user, name='Gin')
+
+        self.assertEqual(
+            self._names(INGREDIENTS_URL, prefix='gi'), ['Gin', 'Ginger'],
+        )
+
+    def test_requires_prefix_or_q(self):
+        """Test a request without prefix or q is rejected."""
+        res = self.client.get(INGREDIENTS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(RECIPE_AUTOCOMPLETE_BACKEND='postgres')
+class PostgresAutocompleteTests(AutocompleteTestsMixin, TestCase):
+    """Test autocomplete against the database indexes."""
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requires Postgres')
+    def test_q_tolerates_typos(self):
+        """Test trigram similarity finds misspelled names."""
+        if not completion.has_trigram():
+            self.skipTest('pg_trgm is not installed')
+        self.assertIn('Ginger', self._names(INGREDIENTS_URL, q='gnger'))
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requires Postgres')
+    def test_trigram_check_repeated_after_ttl(self):
+        """Test a pg_trgm installed after startup is found again."""
+        completion._trigram['default'] = (False, time.monotonic())
+        with self.assertNumQueries(0):
+            self.assertFalse(completion.has_trigram())
+
+        with override_settings(RECIPE_AUTOCOMPLETE_TRIGRAM_TTL=0):
+            with self.assertNumQueries(1):
+                found = completion.has_trigram()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )
+            self.assertEqual(found, cursor.fetchone() is not None)
+
+
+@override_settings(RECIPE_AUTOCOMPLETE_BACKEND='python')
+class PythonAutocompleteTests(AutocompleteTestsMixin, TestCase):
+    """Test autocomplete against the in-process sorted arrays."""
@@ -0,0 +1,187 @@
+"""
+Tests for the bulk recipe API.
+"""
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+
+from core.models import Ingredient, Recipe, RecipeBand, Tag
+from recipe import counts
+from recipe.tests.helpers import (
+    AuthenticatedClientMixin, create_recipe, create_user,
+)
+
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def recipe_payload(i, **params):
+    """Return a recipe payload numbered i."""
+    payload = {
+        'title': f'Recipe {i}',
+        'time_minutes': 10 + i,
+        'price': '2.50',
+    }
+    payload.update(params)
+    return payload
+
+
+class BulkRecipeApiTests(AuthenticatedClientMixin, TestCase):
+    """Test bulk create, update and delete."""
+
+    def assertCountsExact(self, model):
+        """Assert stored recipe counts match a full recount."""
+        stored = dict(model.objects.values_list('id', 'recipe_count'))
+        counts.recount(model)
+        self.assertEqual(
+            dict(model.objects.values_list('id', 'recipe_count')), stored,
+        )
+
+    def test_bulk_create(self):
+        """Test creating recipes with shared tags and ingredients."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        payload = [
+            recipe_payload(0, tags=[{'name': 'Vegan'}, {'name': 'Quick'}]),
+            recipe_payload(1, tags=[{'name': 'Quick'}], ingredients=[
+                {'name': 'Salt'}, {'name': 'Rice'},
+            ]),
+            recipe_payload(2),
+        ]
+
+        with self.assertNumQueries(23):
+            res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [item['title'] for item in res.data],
+            ['Recipe 0', 'Recipe 1', 'Recipe 2'],
+        )
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(
+            [sorted(r.tags.values_list('name', flat=True)) for r in recipes],
+            [['Quick', 'Vegan'], ['Quick'], []],
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            Tag.objects.get(name='Quick').recipe_count, 2,
+        )
+        self.assertCountsExact(Tag)
+        self.assertCountsExact(Ingredient)
+        self.assertEqual(
+            RecipeBand.objects.filter(recipe__in=recipes).count(), 32,
+        )
+
+    def test_bulk_create_reports_item_errors(self):
+        """Test invalid items are reported in order and nothing is saved."""
+        payload = [
+            recipe_payload(0),
+            {'title': 'No time'},
+            recipe_payload(2, price='abc'),
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data), 3)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('time_minutes', res.data[1])
+        self.assertIn('price', res.data[2])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_requires_list(self):
+        """Test a single object is rejected."""
+        res = self.client.post(BULK_URL, recipe_payload(0), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_BULK_MAX_ITEMS=2)
+    def test_bulk_limit(self):
+        """Test arrays over the limit are rejected."""
+        payload = [recipe_payload(i) for i in range(3)]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update(self):
+        """Test partially updating recipes and replacing their tags."""
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        first = create_recipe(self.user)
+        first.tags.add(quick)
+        second = create_recipe(self.user)
+        payload = [
+            {'id': second.id, 'title': 'Second', 'tags': [{'name': 'New'}]},
+            {'id': first.id, 'tags': []},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['id'] for item in res.data], [second.id, first.id],
+        )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.title, 'Sample recipe title')
+        self.assertEqual(second.title, 'Second')
+        self.assertFalse(first.tags.exists())
+        self.assertEqual(
+            list(second.tags.values_list('name', flat=True)), ['New'],
+        )
+        quick.refresh_from_db()
+        self.assertEqual(quick.recipe_count, 0)
+        self.assertCountsExact(Tag)
+
+    def test_bulk_update_other_users_recipe(self):
+        """Test ids of missing or other users' recipes are item errors."""
+        other = create_user(email='other@example.com')
+        mine = create_recipe(self.user)
+        theirs = create_recipe(other)
+        payload = [
+            {'id': mine.id, 'title': 'Mine'},
+            {'id': theirs.id, 'title': 'Stolen'},
+            {'title': 'No id'},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('id', res.data[1])
+        self.assertIn('id', res.data[2])
+        theirs.refresh_from_db()
+        self.assertEqual(theirs.title, 'Sample recipe title')
+        mine.refresh_from_db()
+        self.assertEqual(mine.title, 'Sample recipe title')
+
+    def test_bulk_delete(self):
+        """Test deleting recipes recounts their tags once."""
+        tag = Tag.objects.create(user=self.user, name='Quick')
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        for recipe in recipes:
+            recipe.tags.add(tag)
+
+        res = self.client.delete(
+            BULK_URL, [recipes[0].id, recipes[2].id], format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            list(Recipe.objects.values_list('id', flat=True)),
+            [recipes[1].id],
+        )
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+        self.assertFalse(counts.is_deferred())
+
+    def test_bulk_delete_unknown_id(self):
+        """Test deleting stops when any id is unknown."""
+        recipe = create_recipe(self.user)
+
+        res = self.client.delete(
+            BULK_URL, [recipe.id, recipe.id + 100], format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
@@ -0,0 +1,85 @@
+"""
+Tests for the recipe API response cache.
+"""
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+
+from core.models import Ingredient, Tag
+from recipe import cache
+from recipe.tests.helpers import (
+    AuthenticatedClientMixin, create_recipe, create_user,
+)
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+class ResponseCacheTests(AuthenticatedClientMixin, TestCase):
+    """Test list responses are cached per user and version."""
+
+    def test_repeat_list_served_from_cache(self):
+        """Test a repeated GET does not touch the database."""
+        create_recipe(user=self.user)
+        first = self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data, second.data)
+
+    def test_write_invalidates_cached_list(self):
+        """Test creating a recipe makes the next GET fresh."""
+        self.client.get(RECIPES_URL)
+
+        recipe = create_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual([r['id'] for r in res.data['results']], [recipe.id])
+
+    def test_relinking_invalidates_tag_list(self):
+        """Test M2M changes invalidate the assigned_only tag list."""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(res.data, [])
+
+        recipe.tags.add(tag)
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual([t['id'] for t in res.data], [tag.id])
+
+    def test_delete_invalidates_ingredient_list(self):
+        """Test deleting an ingredient invalidates the cached list."""
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        self.client.get(INGREDIENTS_URL)
+
+        ingredient.delete()
+        res = self.client.get(INGREDIENTS_URL)
+
+        self.assertEqual(res.data, [])
+
+    def test_cache_keyed_per_user(self):
+        """Test one user's cached list is never served to another."""
+        create_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+        other = create_user(email='other@example.com')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_query_params_normalized(self):
+        """Test parameter order does not change the cache entry."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        params = f'tags={tag.id}&tags_mode=any'
+        self.client.get(f'{RECIPES_URL}?{params}')
+        hits = cache.get_stats()['hits']
+
+        self.client.get(f'{RECIPES_URL}?tags_mode=any&tags={tag.id}')
+
+        self.assertEqual(cache.get_stats()['hits'], hits + 1)
@@ -0,0 +1,152 @@
+"""
+Tests for conditional GET on the recipe APIs.
+"""
+import threading
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+
+from core.models import Tag
+from recipe.tests.helpers import (
+    AuthenticatedClientMixin, create_recipe, create_user,
+)
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ConditionalGetTests(AuthenticatedClientMixin, TestCase):
+    """Test ETag and Last-Modified handling."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = create_recipe(user=self.user)
+
+    def test_detail_not_modified(self):
+        """Test a matching If-None-Match returns 304 with one query."""
+        res = self.client.get(detail_url(self.recipe.id))
+        etag = res['ETag']
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(
+                detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag,
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_detail_if_modified_since(self):
+        """Test If-Modified-Since with the last modified date gives 304."""
+        res = self.client.get(detail_url(self.recipe.id))
+
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            HTTP_IF_MODIFIED_SINCE=res['Last-Modified'],
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_etag_changes_with_tags(self):
+        """Test linking and renaming tags change the recipe ETag."""
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        self.recipe.tags.add(tag)
+        res = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res2 = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=res['ETag'],
+        )
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(res2.data['tags'][0]['name'], 'Vegetarian')
+
+    def test_detail_etag_changes_when_tag_deleted(self):
+        """Test deleting a linked tag changes the recipe ETag."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+
+        tag.delete()
+        res = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'], [])
+
+    def test_list_not_modified_without_queries(self):
+        """Test an unchanged list is answered 304 without the database."""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_tag_list_etag_changes_after_write(self):
+        """Test the tag list ETag changes when a tag is added."""
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        Tag.objects.create(user=self.user, name='Vegan')
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_other_users_recipe_not_found(self):
+        """Test validators never leak another user's recipe."""
+        other = create_user(email='other@example.com')
+        recipe = create_recipe(user=other)
+
+        res = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH='*')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConcurrentWriteTests(AuthenticatedClientMixin, TransactionTestCase):
+    """Test reads racing an uncommitted write are not kept."""
+
+    def setUp(self):
+        super().setUp()
+        create_recipe(user=self.user)
+
+    def test_list_read_during_write_revalidates_after_commit(self):
+        """Test a list read before a commit is neither cached nor 304."""
+        written = threading.Event()
+        commit = threading.Event()
+
+        def write():
+            try:
+                with transaction.atomic():
+                    create_recipe(user=self.user, title='Concurrent')
+                    written.set()
+                    commit.wait(5)
+            finally:
+                connection.close()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        self.assertTrue(written.wait(5))
+        during = self.client.get(RECIPES_URL)
+        commit.set()
+        writer.join()
+        after = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=during['ETag'])
+
+        self.assertEqual(len(during.data['results']), 1)
+        self.assertEqual(after.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(after.data['results']), 2)
+        self.assertNotEqual(after['ETag'], during['ETag'])
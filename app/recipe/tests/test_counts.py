@@ -0,0 +1,86 @@
+"""
+Tests for the denormalized recipe counts on tags and ingredients.
+"""
+from django.test import TestCase
+
+from core.models import Ingredient, Recipe, Tag
+from recipe import counts
+from recipe.tests.helpers import create_recipe, create_user
+
+
+class RecipeCountTests(TestCase):
+    """Test recipe_count follows the through tables."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(3)
+        ]
+        self.recipes = [create_recipe(self.user) for _ in range(3)]
+
+    def assertCounts(self, model, expected):
+        """Assert counts match expected and a full recount."""
+        objs = model.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([o.recipe_count for o in objs], expected)
+        counts.recount(model)
+        self.assertEqual(
+            [o.recipe_count for o in objs.all()], expected,
+        )
+
+    def test_forward_add_remove_clear(self):
+        """Test edits through Recipe.tags move the counts."""
+        recipe = self.recipes[0]
+        recipe.tags.add(self.tags[0], self.tags[1])
+        recipe.tags.add(self.tags[0])
+        self.assertCounts(Tag, [1, 1, 0])
+
+        recipe.tags.remove(self.tags[1], self.tags[2])
+        self.assertCounts(Tag, [1, 0, 0])
+
+        recipe.tags.set([self.tags[1], self.tags[2]])
+        self.assertCounts(Tag, [0, 1, 1])
+
+        recipe.tags.clear()
+        self.assertCounts(Tag, [0, 0, 0])
+
+    def test_reverse_add_remove_clear(self):
+        """Test edits through tag.recipe_set move the counts."""
+        tag = self.tags[0]
+        tag.recipe_set.add(*self.recipes)
+        self.assertCounts(Tag, [3, 0, 0])
+
+        tag.recipe_set.remove(self.recipes[0])
+        tag.recipe_set.remove(self.recipes[0])
+        self.assertCounts(Tag, [2, 0, 0])
+
+        tag.recipe_set.clear()
+        self.assertCounts(Tag, [0, 0, 0])
+
+    def test_recipe_delete(self):
+        """Test deleting recipes lowers the counts of what they used."""
+        ingredient = Ingredient.objects.create(user=self.user, name='Egg')
+        for recipe in self.recipes:
+            recipe.tags.add(self.tags[0])
+            recipe.ingredients.add(ingredient)
+
+        self.recipes[0].delete()
+        Recipe.objects.filter(id=self.recipes[1].id).delete()
+
+        self.assertCounts(Tag, [1, 0, 0])
+        self.assertCounts(Ingredient, [1])
+
+    def test_recount_after_bulk_insert(self):
+        """Test recount repairs counts after signal-less inserts."""
+        through = Recipe.tags.through
+        through.objects.bulk_create(
+            through(recipe_id=r.id, tag_id=self.tags[2].id)
+            for r in self.recipes
+        )
+
+        updated = counts.recount(Tag, Tag.objects.filter(user=self.user))
+
+        self.assertEqual(updated, 3)
+        self.assertEqual(
+            Tag.objects.get(id=self.tags[2].id).recipe_count, 3,
+        )
@@ -0,0 +1,117 @@
+"""
+Tests for the streaming recipe export.
+"""
+import csv
+import io
+import json
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.tests.helpers import (
+    AuthenticatedClientMixin, create_recipe, create_user,
+)
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+class PublicExportTests(TestCase):
+    """Test unauthenticated export requests."""
+
+    def test_auth_required(self):
+        """Test auth is required to export recipes."""
+        res = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ExportTests(AuthenticatedClientMixin, TestCase):
+    """Test exporting the user's recipes."""
+
+    def setUp(self):
+        super().setUp()
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.first = create_recipe(self.user, title='First, "quoted"')
+        self.first.tags.add(self.vegan, self.quick)
+        self.first.ingredients.add(self.salt)
+        self.second = create_recipe(
+            self.user, title='Second', description='Line one\nline two',
+        )
+
+    def test_export_ndjson(self):
+        """Test one JSON object per recipe, oldest first."""
+        other = create_user(email='other@example.com')
+        create_recipe(other, title='Not mine')
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        self.assertIn('recipes.ndjson', res['Content-Disposition'])
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [row['id'] for row in rows], [self.first.id, self.second.id],
+        )
+        self.assertEqual(rows[0]['tags'], ['Quick', 'Vegan'])
+        self.assertEqual(rows[0]['ingredients'], ['Salt'])
+        self.assertEqual(rows[0]['price'], '5.25')
+        self.assertEqual(rows[1]['tags'], [])
+        self.assertEqual(rows[1]['description'], 'Line one\nline two')
+
+    def test_export_csv(self):
+        """Test a header row and one quoted row per recipe."""
+        res = self.client.get(EXPORT_URL, {'export_format': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/csv'))
+        content = b''.join(res.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['title'], 'First, "quoted"')
+        self.assertEqual(rows[0]['tags'], 'Quick|Vegan')
+        self.assertEqual(rows[1]['description'], 'Line one\nline two')
+
+    def test_export_csv_empty(self):
+        """Test an empty export still carries the header row."""
+        Recipe.objects.all().delete()
+
+        res = self.client.get(EXPORT_URL, {'export_format': 'csv'})
+
+        content = b''.join(res.streaming_content).decode()
+        self.assertTrue(content.startswith('id,title,'))
+
+    def test_export_filters(self):
+        """Test the list filters narrow the export."""
+        res = self.client.get(EXPORT_URL, {'tags': f'{self.vegan.id}'})
+
+        lines = b''.join(res.streaming_content).splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['id'], self.first.id)
+
+    def test_invalid_format(self):
+        """Test unknown formats are rejected."""
+        res = self.client.get(EXPORT_URL, {'export_format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_relations_loaded_per_chunk(self):
+        """Test relation queries grow with chunks rather than recipes."""
+        for i in range(3):
+            recipe = create_recipe(self.user, title=f'Extra {i}')
+            recipe.tags.add(self.quick)
+        res = self.client.get(EXPORT_URL)
+
+        # One cursor plus two relation queries for each of 3 chunks.
+        with self.assertNumQueries(7):
+            lines = b''.join(res.streaming_content).splitlines()
+
+        self.assertEqual(len(lines), 5)
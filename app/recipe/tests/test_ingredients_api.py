@@ -135,3 +135,20 @@ class PrivateIngredientApiTest(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
         self.assertEqual(len(res.data), 1)
+
+    def test_list_with_counts(self):
+        """Test with_counts adds the number of recipes using each one."""
+        ing = Ingredient.objects.create(user=self.user, name='Eggs')
+        recipe = Recipe.objects.create(
+            title='Egg Benedict',
+            time_minutes=30,
+            price=Decimal('7.99'),
+            user=self.user,
+        )
+        recipe.ingredients.add(ing)
+
+        res = self.client.get(INGREDIENTS_URL, {'with_counts': 1})
+
+        self.assertEqual(
+            res.data, [{'id': ing.id, 'name': 'Eggs', 'recipe_count': 1}],
+        )
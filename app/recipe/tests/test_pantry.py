@@ -0,0 +1,318 @@
+"""
+Tests for the pantry matching API.
+"""
+import random
+import threading
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+
+from core.models import Ingredient, Recipe
+from recipe import cache, pantry
+from recipe.tests.helpers import (
+    AuthenticatedClientMixin, create_recipe, create_user,
+)
+
+RECIPES_URL = reverse('recipe:recipe-list')
+PANTRY_URL = reverse('recipe:recipe-pantry')
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+class PantryIndexTests(TestCase):
+    """Test the posting list index on its own."""
+
+    def test_match_ranks_by_coverage_then_count(self):
+        """Test full coverage wins and ties go to more matches."""
+        index = pantry.PantryIndex(
+            [(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd')],
+            [(10, 1), (10, 2), (11, 1), (12, 1), (12, 3), (13, 4)],
+        )
+
+        ranked = [r for r, _, _ in index.match({1, 2, 3}, 10)]
+
+        self.assertEqual(ranked, [12, 10, 11])
+
+    def test_match_agrees_with_brute_force(self):
+        """Test bitmap ranking matches scoring every recipe directly."""
+        rng = random.Random(7)
+        links = {
+            recipe_id: set(rng.sample(range(12), rng.randint(1, 6)))
+            for recipe_id in range(1, 200)
+        }
+        index = pantry.PantryIndex(
+            [(i, f'i{i}') for i in range(12)],
+            [(r, i) for r, ids in links.items() for i in ids],
+        )
+        for _ in range(20):
+            available = set(rng.sample(range(12), rng.randint(1, 8)))
+            expected = sorted(
+                (
+                    (len(ids & available) / len(ids), len(ids & available), r)
+                    for r, ids in links.items() if ids & available
+                ),
+                reverse=True,
+            )[:15]
+
+            ranked = index.match(available, 15)
+
+            self.assertEqual(
+                [(c, r) for c, _, r in expected],
+                [(c, r) for r, c, _ in ranked],
+            )
+
+    def test_patches_agree_with_rebuild(self):
+        """Test a patched index matches like one built from scratch."""
+        rng = random.Random(11)
+        names = [(i, f'i{i}') for i in range(10)]
+        links = {
+            recipe_id: set(rng.sample(range(10), rng.randint(1, 5)))
+            for recipe_id in range(1, 60)
+        }
+        index = pantry.PantryIndex(
+            names, [(r, i) for r, ids in links.items() for i in ids],
+        )
+        for recipe_id in rng.sample(sorted(links), 20):
+            ids = set(rng.sample(range(10), rng.randint(0, 3)))
+            if rng.random() < 0.5:
+                index.link(recipe_id, ids)
+                links[recipe_id] |= ids
+            else:
+                index.unlink(recipe_id, ids)
+                links[recipe_id] -= ids
+        for recipe_id in range(60, 70):
+            links[recipe_id] = set(rng.sample(range(10), 3))
+            index.set_recipe(recipe_id, links[recipe_id])
+        index.drop_recipe(5)
+        index.drop_ingredient(0)
+        del links[5]
+        fresh = pantry.PantryIndex(
+            names[1:], [(r, i) for r, ids in links.items() for i in ids - {0}],
+        )
+
+        for _ in range(20):
+            available = set(rng.sample(range(10), rng.randint(1, 6)))
+
+            self.assertEqual(
+                sorted(index.match(available, 100)),
+                sorted(fresh.match(available, 100)),
+            )
+
+
+class PantryApiTests(AuthenticatedClientMixin, TestCase):
+    """Test the pantry endpoint."""
+
+    def setUp(self):
+        super().setUp()
+        pantry.clear_indexes()
+        self.egg, self.flour, self.milk, self.sugar = (
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Egg', 'Flour', 'Milk', 'Sugar')
+        )
+
+    def test_pantry_ranks_by_coverage(self):
+        """Test recipes are ranked by the share of ingredients on hand."""
+        pancakes = create_recipe(
+            self.user, ingredients=[self.egg, self.flour, self.milk],
+            title='Pancakes',
+        )
+        omelette = create_recipe(
+            self.user, ingredients=[self.egg], title='Omelette',
+        )
+        create_recipe(self.user, ingredients=[self.sugar], title='Caramel')
+
+        res = self.client.get(PANTRY_URL, {
+            'ingredients': f'{self.egg.id},{self.milk.id}',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data],
+                         [omelette.id, pancakes.id])
+        self.assertEqual(res.data[0]['coverage'], 1.0)
+        self.assertEqual(res.data[1]['coverage'], round(2 / 3, 4))
+        self.assertEqual(
+            res.data[1]['missing'], [{'id': self.flour.id, 'name': 'Flour'}],
+        )
+
+    def test_pantry_by_name(self):
+        """Test ingredients can be given by name, ignoring case."""
+        recipe = create_recipe(self.user, ingredients=[self.sugar, self.milk])
+
+        res = self.client.get(PANTRY_URL, {'names': 'sugar, MILK'})
+
+        self.assertEqual([r['id'] for r in res.data], [recipe.id])
+        self.assertEqual(res.data[0]['coverage'], 1.0)
+
+    def test_pantry_min_coverage_and_limit(self):
+        """Test min_coverage drops partial matches and limit caps them."""
+        full = create_recipe(self.user, ingredients=[self.egg])
+        create_recipe(self.user, ingredients=[self.egg, self.flour])
+        create_recipe(self.user, ingredients=[self.egg, self.sugar])
+        params = {'ingredients': str(self.egg.id)}
+
+        res = self.client.get(PANTRY_URL, {**params, 'min_coverage': 1})
+        self.assertEqual([r['id'] for r in res.data], [full.id])
+
+        res = self.client.get(PANTRY_URL, {**params, 'limit': 2})
+        self.assertEqual(len(res.data), 2)
+
+    def test_pantry_limited_to_user(self):
+        """Test other users' recipes and ingredients are ignored."""
+        other = create_user(email='other@example.com')
+        other_egg = Ingredient.objects.create(user=other, name='Egg')
+        create_recipe(other, ingredients=[other_egg])
+
+        res = self.client.get(PANTRY_URL, {
+            'ingredients': str(other_egg.id), 'names': 'egg',
+        })
+
+        self.assertEqual(res.data, [])
+
+    def test_pantry_invalid_params(self):
+        """Test malformed parameters are rejected."""
+        res = self.client.get(PANTRY_URL, {
+            'ingredients': 'x', 'min_coverage': '2', 'limit': '0',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            set(res.data), {'ingredients', 'min_coverage', 'limit'},
+        )
+
+    def test_index_patched_after_api_writes(self):
+        """Test API writes patch the cached index on commit."""
+        create_recipe(self.user, ingredients=[self.egg])
+        index = pantry.get_index(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(RECIPES_URL, {
+                'title': 'Toast', 'time_minutes': 5, 'price': '1.00',
+                'ingredients': [{'name': 'Bread'}],
+            }, format='json')
+        recipe_id = res.data['id']
+        self.assertIs(pantry.get_index(self.user.id), index)
+        res = self.client.get(PANTRY_URL, {'names': 'bread'})
+        self.assertEqual(res.data[0]['id'], recipe_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('recipe:recipe-detail', args=[recipe_id]),
+                {'ingredients': [{'name': 'Bread'}, {'name': 'Butter'}]},
+                format='json',
+            )
+        self.assertIs(pantry.get_index(self.user.id), index)
+        res = self.client.get(PANTRY_URL, {'names': 'bread'})
+        self.assertEqual(res.data[0]['id'], recipe_id)
+        self.assertEqual(res.data[0]['missing'][0]['name'], 'Butter')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                reverse('recipe:recipe-detail', args=[recipe_id]),
+            )
+        self.assertIs(pantry.get_index(self.user.id), index)
+        res = self.client.get(PANTRY_URL, {'names': 'bread'})
+        self.assertEqual(res.data, [])
+
+    def test_index_patched_after_bulk_writes(self):
+        """Test bulk created and relinked recipes patch the index."""
+        index = pantry.get_index(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(BULK_URL, [
+                {'title': 'Crepes', 'time_minutes': 9, 'price': '2.00',
+                 'ingredients': [{'name': 'Egg'}, {'name': 'Flour'}]},
+                {'title': 'Jam', 'time_minutes': 30, 'price': '3.00',
+                 'ingredients': [{'name': 'Plum'}]},
+            ], format='json')
+        crepes, jam = (recipe['id'] for recipe in res.data)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(BULK_URL, [
+                {'id': jam, 'ingredients': [{'name': 'Sugar'}]},
+            ], format='json')
+
+        self.assertIs(pantry.get_index(self.user.id), index)
+        res = self.client.get(PANTRY_URL, {'names': 'egg,plum,sugar'})
+        self.assertEqual([r['id'] for r in res.data], [jam, crepes])
+        self.assertEqual(res.data[1]['missing'][0]['name'], 'Flour')
+
+    def test_index_patched_after_ingredient_writes(self):
+        """Test renamed and deleted ingredients patch the index."""
+        recipe = create_recipe(self.user, ingredients=[self.egg, self.flour])
+        index = pantry.get_index(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.egg.name = 'Duck egg'
+            self.egg.save()
+            self.flour.delete()
+            self.milk.recipe_set.add(recipe)
+
+        self.assertIs(pantry.get_index(self.user.id), index)
+        self.assertEqual(pantry.find_matches(self.user.id, names=['egg']), [])
+        matches = pantry.find_matches(self.user.id, names=['duck egg'])
+        self.assertEqual(matches[0]['id'], recipe.id)
+        self.assertEqual(matches[0]['coverage'], 0.5)
+        self.assertEqual(
+            matches[0]['missing'], [{'id': self.milk.id, 'name': 'Milk'}],
+        )
+
+    def test_index_rebuilt_after_unreported_write(self):
+        """Test a version bump without pantry changes rebuilds the index."""
+        recipe = create_recipe(self.user, ingredients=[self.egg])
+        index = pantry.get_index(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.ingredients.through.objects.filter(
+                recipe=recipe,
+            ).update(ingredient=self.milk)
+            cache.bump_version(self.user.id)
+
+        self.assertIsNot(pantry.get_index(self.user.id), index)
+        matches = pantry.find_matches(self.user.id, [self.milk.id])
+        self.assertEqual([m['id'] for m in matches], [recipe.id])
+
+    def test_patch_skipped_after_version_gap(self):
+        """Test a write after another process's is left to a rebuild."""
+        index = pantry.get_index(self.user.id)
+        cache._incr_version(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(self.user, ingredients=[self.egg])
+
+        self.assertIsNot(pantry.get_index(self.user.id), index)
+
+
+class PantryConcurrentWriteTests(TransactionTestCase):
+    """Test an index built during another write catches up on commit."""
+
+    def test_index_built_before_commit_catches_up(self):
+        """Test a recipe committed after an index build is matched."""
+        user = create_user()
+        egg = Ingredient.objects.create(user=user, name='Egg')
+        create_recipe(user, ingredients=[egg], title='Boiled egg')
+        pantry.clear_indexes()
+        written = threading.Event()
+        commit = threading.Event()
+
+        def write():
+            try:
+                with transaction.atomic():
+                    create_recipe(user, ingredients=[egg], title='Omelette')
+                    written.set()
+                    commit.wait(5)
+            finally:
+                connection.close()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        self.assertTrue(written.wait(5))
+        during = pantry.find_matches(user.id, [egg.id])
+        commit.set()
+        writer.join()
+        after = pantry.find_matches(user.id, [egg.id])
+
+        self.assertEqual([m['title'] for m in during], ['Boiled egg'])
+        self.assertEqual(
+            [m['title'] for m in after], ['Omelette', 'Boiled egg'],
+        )
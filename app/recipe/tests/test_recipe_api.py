@@ -1,13 +1,21 @@
 """Test recipe API."""
 
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
 from decimal import Decimal
+from unittest.mock import Mock, patch
+import multiprocessing.spawn
+import re
 import tempfile
 import os
 
 from PIL import Image
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -15,10 +23,12 @@ from rest_framework.test import APIClient
 
 from core.models import (
     Recipe,
+    StoredImage,
     Tag,
     Ingredient
     )
 
+from recipe import images, search
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
@@ -33,6 +43,11 @@ def detail_url(recipe_id):
     return reverse('recipe:recipe-detail', args=[recipe_id])
 
 
+def image_url(recipe_id):
+    """Create and return a recipe image download URL."""
+    return reverse('recipe:recipe-image-file', args=[recipe_id])
+
+
 def image_upload_url(recipe_id):
     """Create and return an image upload IRL."""
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
@@ -87,7 +102,7 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_recipe_list_limited_to_user(self):
         """Test list of recipes limited to authenticated user."""
@@ -100,7 +115,7 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipe_detail(self):
         """Test get recipe detail."""
@@ -292,6 +307,55 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(recipe.tags.count(), 0)
 
+    def test_update_recipe_tags_keeps_unchanged_links(self):
+        """Test swapping one tag only rewrites that through row."""
+        recipe = create_recipe(user=self.user)
+        tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(5)
+        ]
+        recipe.tags.add(*tags)
+        through = Recipe.tags.through
+        kept = set(
+            through.objects.filter(
+                recipe=recipe, tag__in=tags[1:],
+            ).values_list('id', flat=True)
+        )
+
+        payload = {
+            'tags': [{'name': t.name} for t in tags[1:]] + [{'name': 'New'}],
+        }
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        links = set(
+            through.objects.filter(recipe=recipe).values_list('id', flat=True)
+        )
+        self.assertEqual(len(links), 5)
+        self.assertTrue(kept < links)
+        self.assertNotIn(tags[0], recipe.tags.all())
+
+    def test_update_recipe_query_count_is_constant(self):
+        """Test updating relations costs the same for few or many tags."""
+        def patch(recipe, count):
+            names = [f'{recipe.id}-{i}' for i in range(1, count + 1)]
+            payload = {'tags': [{'name': name} for name in names]}
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.patch(
+                    detail_url(recipe.id), payload, format='json',
+                )
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            return len(ctx.captured_queries)
+
+        small, large = create_recipe(user=self.user), create_recipe(self.user)
+        for recipe, count in ((small, 2), (large, 20)):
+            recipe.tags.add(*(
+                Tag.objects.create(user=self.user, name=f'{recipe.id}-{i}')
+                for i in range(count)
+            ))
+
+        self.assertEqual(patch(small, 2), patch(large, 20))
+
     def test_create_recipe_with_new_ingredients(self):
         """Test creating recipe with new ingredients."""
 
@@ -387,6 +451,53 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(recipe.ingredients.count(), 0)
 
+    def _create_payload(self, count):
+        """Return a recipe payload with count tags and ingredients."""
+        return {
+            'title': 'Big recipe',
+            'time_minutes': 30,
+            'price': Decimal('5.00'),
+            'tags': [{'name': f'Tag {i}'} for i in range(count)],
+            'ingredients': [{'name': f'Ing {i}'} for i in range(count)],
+        }
+
+    def test_create_recipe_query_count_is_constant(self):
+        """Test creating a recipe costs the same for few or many tags."""
+        Tag.objects.create(user=self.user, name='Tag 0')
+        with CaptureQueriesContext(connection) as small:
+            res = self.client.post(
+                RECIPES_URL, self._create_payload(2), format='json',
+            )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        Tag.objects.create(user=self.user, name='Tag 5')
+        Ingredient.objects.create(user=self.user, name='Ing 5')
+        with CaptureQueriesContext(connection) as large:
+            res = self.client.post(
+                RECIPES_URL, self._create_payload(30), format='json',
+            )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(len(small), len(large))
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 30)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 30)
+
+    def test_create_recipe_with_repeated_tag_names(self):
+        """Test repeated names in a payload create a single tag."""
+        payload = {
+            'title': 'Toast',
+            'time_minutes': 5,
+            'price': Decimal('1.00'),
+            'tags': [{'name': 'Quick'}, {'name': 'Quick'}],
+        }
+
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(len(res.data['tags']), 1)
+
     def test_filter_by_tags(self):
         """Test filtering recipe by tags."""
         r1 = create_recipe(user=self.user, title='Thai Vegetable Curry.')
@@ -403,9 +514,9 @@ class PrivateRecipeAPITests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredients(self):
         """Test filter recipe by ingredients."""
@@ -424,11 +535,298 @@ class PrivateRecipeAPITests(TestCase):
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
 
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
+
+    def test_filter_by_tags_returns_unique_recipes(self):
+        """Test a recipe matching several filter tags is listed once."""
+        recipe = create_recipe(user=self.user)
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Quick')
+        recipe.tags.add(tag1, tag2)
+
+        params = {'tags': f'{tag1.id},{tag2.id}'}
+        res = self.client.get(RECIPES_URL, params)
+
+        ids = [r['id'] for r in res.data['results']]
+        self.assertEqual(ids, [recipe.id])
+
+    def test_filter_by_all_tags(self):
+        """Test tags_mode=all only returns recipes with every tag."""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Quick')
+        r1 = create_recipe(user=self.user, title='Salad')
+        r1.tags.add(tag1, tag2)
+        r2 = create_recipe(user=self.user, title='Stew')
+        r2.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id},{tag1.id}', 'tags_mode': 'all'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [r['id'] for r in res.data['results']]
+        self.assertEqual(ids, [r1.id])
+
+    def test_filter_invalid_tags_mode(self):
+        """Test an unknown tags_mode is rejected."""
+        res = self.client.get(RECIPES_URL, {'tags': '1', 'tags_mode': 'x'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_paginated_by_cursor(self):
+        """Test recipe list pages are walked with opaque cursors."""
+        recipes = [create_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['previous'])
+        seen = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            self.assertLessEqual(len(res.data['results']), 2)
+            seen.extend(r['id'] for r in res.data['results'])
+
+        self.assertEqual(seen, sorted((r.id for r in recipes), reverse=True))
+        self.assertIsNotNone(res.data['previous'])
+
+    def _create_related_recipes(self, count):
+        """Create recipes that each have a tag and an ingredient."""
+        start = Recipe.objects.count()
+        for i in range(start, start + count):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}')
+            )
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'Ing {i}')
+            )
+
+    def _count_queries(self, url):
+        """Return the number of queries used to GET url."""
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        """Test listing recipes does not issue queries per recipe."""
+        self._create_related_recipes(2)
+        small = self._count_queries(RECIPES_URL)
+
+        self._create_related_recipes(10)
+        large = self._count_queries(RECIPES_URL)
+
+        self.assertEqual(small, large)
+
+    def test_detail_query_count_is_constant(self):
+        """Test recipe detail fetches relations in fixed queries."""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Tag'))
+        small = self._count_queries(detail_url(recipe.id))
+
+        for i in range(10):
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'T{i}'))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'I{i}')
+            )
+        large = self._count_queries(detail_url(recipe.id))
+
+        self.assertEqual(small, large)
+
+
+class RecipeSearchTestsMixin:
+    """Search behaviour shared by every search backend."""
+
+    def setUp(self):
+        search.clear_indexes()
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='pass123')
+        self.client.force_authenticate(self.user)
+
+    def _search(self, text, **params):
+        """Return the ids of recipes found for text."""
+        res = self.client.get(RECIPES_URL, {'search': text, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [r['id'] for r in res.data['results']]
+
+    def test_search_matches_every_field(self):
+        """Test search covers title, description, tags and ingredients."""
+        r1 = create_recipe(user=self.user, title='Lemon cake')
+        r2 = create_recipe(user=self.user, description='Tangy lemon curd')
+        r3 = create_recipe(user=self.user)
+        r3.tags.add(Tag.objects.create(user=self.user, name='Lemon'))
+        r4 = create_recipe(user=self.user)
+        r4.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Lemons')
+        )
+        create_recipe(user=self.user, title='Chocolate cake')
+
+        self.assertCountEqual(self._search('lemon'), [r1.id, r2.id, r3.id,
+                                                      r4.id])
+
+    def test_search_ranks_title_matches_first(self):
+        """Test a title match outranks a description match."""
+        r1 = create_recipe(user=self.user, description='Made with basil')
+        r2 = create_recipe(user=self.user, title='Basil pesto')
+
+        self.assertEqual(self._search('basil'), [r2.id, r1.id])
+
+    def test_search_requires_every_term(self):
+        """Test recipes must match all of the search terms."""
+        r1 = create_recipe(user=self.user, title='Spicy noodle soup')
+        create_recipe(user=self.user, title='Noodle salad')
+
+        self.assertEqual(self._search('spicy noodles'), [r1.id])
+
+    def test_search_limited_to_user(self):
+        """Test search only returns the authenticated user's recipes."""
+        other = create_user(email='other@example.com', password='pass123')
+        create_recipe(user=other, title='Banana bread')
+        r1 = create_recipe(user=self.user, title='Banana bread')
+
+        self.assertEqual(self._search('banana'), [r1.id])
+
+    def test_search_combines_with_filters(self):
+        """Test search results respect the tag filter."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        r1 = create_recipe(user=self.user, title='Tofu curry')
+        r1.tags.add(tag)
+        create_recipe(user=self.user, title='Chicken curry')
 
+        self.assertEqual(self._search('curry', tags=str(tag.id)), [r1.id])
 
+    def test_search_follows_tag_rename(self):
+        """Test renaming a tag updates the recipes found through it."""
+        tag = Tag.objects.create(user=self.user, name='Dessert')
+        r1 = create_recipe(user=self.user)
+        r1.tags.add(tag)
+        self.assertEqual(self._search('dessert'), [r1.id])
+
+        tag.name = 'Breakfast'
+        tag.save()
+
+        self.assertEqual(self._search('dessert'), [])
+        self.assertEqual(self._search('breakfast'), [r1.id])
+
+    def test_search_follows_recipe_update(self):
+        """Test editing a recipe through the API updates search results."""
+        r1 = create_recipe(user=self.user, title='Plain rice')
+
+        self.client.patch(detail_url(r1.id), {
+            'title': 'Fried rice',
+            'ingredients': [{'name': 'Garlic'}],
+        }, format='json')
+
+        self.assertEqual(self._search('plain'), [])
+        self.assertEqual(self._search('fried garlic'), [r1.id])
+
+    def test_search_pages_through_every_result(self):
+        """Test next links reach every ranked result exactly once."""
+        best = create_recipe(user=self.user, title='Soup', description='soup')
+        tied = [
+            create_recipe(user=self.user, title=f'Soup {i}').id
+            for i in range(5)
+        ]
+        create_recipe(user=self.user, title='Stew')
+
+        found = []
+        res = self.client.get(RECIPES_URL, {'search': 'soup', 'page_size': 2})
+        while True:
+            self.assertLessEqual(len(res.data['results']), 2)
+            found.extend(r['id'] for r in res.data['results'])
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(found[0], best.id)
+        self.assertEqual(found[1:], sorted(tied, reverse=True))
+
+    def test_search_pages_through_filtered_results(self):
+        """Test pages stay full when filters reject ranked matches."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        tagged = []
+        for i in range(9):
+            recipe = create_recipe(user=self.user, title=f'Curry {i}')
+            if i % 3 == 0:
+                recipe.tags.add(tag)
+                tagged.append(recipe.id)
+
+        found = []
+        res = self.client.get(RECIPES_URL, {
+            'search': 'curry', 'tags': str(tag.id), 'page_size': 1,
+        })
+        while True:
+            self.assertEqual(len(res.data['results']), 1)
+            found.extend(r['id'] for r in res.data['results'])
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(found, sorted(tagged, reverse=True))
+
+
+@override_settings(RECIPE_SEARCH_BACKEND='postgres')
+class PostgresRecipeSearchTests(RecipeSearchTestsMixin, TestCase):
+    """Test recipe search against the tsvector column."""
+
+
+@override_settings(RECIPE_SEARCH_BACKEND='python')
+class PythonRecipeSearchTests(RecipeSearchTestsMixin, TestCase):
+    """Test recipe search against the in-process inverted index."""
+
+    def test_index_reused_until_data_changes(self):
+        """Test the index is only rebuilt after the user's data changes."""
+        create_recipe(user=self.user, title='Apple pie')
+        self._search('apple')
+        index = search.get_index(self.user.id)
+        self.assertIs(search.get_index(self.user.id), index)
+
+        create_recipe(user=self.user, title='Apple crumble')
+
+        self.assertIsNot(search.get_index(self.user.id), index)
+        self.assertEqual(len(self._search('apple')), 2)
+
+    def test_search_pages_back_through_every_result(self):
+        """Test previous links reach every ranked result exactly once."""
+        for i in range(5):
+            create_recipe(user=self.user, title=f'Soup {i}')
+        params = {'search': 'soup', 'page_size': 2}
+        res = self.client.get(RECIPES_URL, params)
+        forward = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            forward.extend(r['id'] for r in res.data['results'])
+
+        backward = [r['id'] for r in res.data['results']]
+        while res.data['previous']:
+            res = self.client.get(res.data['previous'])
+            backward[:0] = [r['id'] for r in res.data['results']]
+
+        self.assertEqual(backward, forward)
+
+    def test_search_statement_bounded_by_page(self):
+        """Test only the page's matches are sent to the database."""
+        for i in range(30):
+            create_recipe(user=self.user, title=f'Soup {i}')
+        params = {'search': 'soup', 'page_size': 2}
+
+        with CaptureQueriesContext(connection) as first:
+            res = self.client.get(RECIPES_URL, params)
+        with CaptureQueriesContext(connection) as second:
+            self.client.get(res.data['next'])
+
+        for queries in (first, second):
+            id_lists = [
+                ids.split(', ') for q in queries
+                for ids in re.findall(r'"id" IN \(([^)]*)\)', q['sql'])
+            ]
+            self.assertTrue(id_lists)
+            self.assertLessEqual(max(len(ids) for ids in id_lists), 3)
+
+
+@override_settings(RECIPE_IMAGE_WORKERS=0)
 class ImageUploadTest(TestCase):
     """Test for the image upload API."""
 
@@ -442,6 +840,11 @@ class ImageUploadTest(TestCase):
         self.recipe = create_recipe(user=self.user)
 
     def tearDown(self):
+        self.recipe.refresh_from_db()
+        storage = self.recipe.image.storage
+        for formats in self.recipe.image_variants.values():
+            for name in formats.values():
+                storage.delete(name)
         self.recipe.image.delete()
 
     def test_upload_image(self):
@@ -466,3 +869,299 @@ class ImageUploadTest(TestCase):
         res = self.client.post(url, payload, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_image_creates_variants(self):
+        """Test uploading generates smaller JPEG and WebP variants."""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (600, 300)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            res = self.client.post(url, {'image': image_file})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        variants = self.recipe.image_variants
+        self.assertEqual(set(variants), {'128', '512'})
+        self.assertEqual(set(variants['128']), {'jpeg', 'webp'})
+        with Image.open(self.recipe.image.storage.path(
+            variants['128']['webp']
+        )) as thumb:
+            self.assertEqual(thumb.size, (128, 64))
+            self.assertEqual(thumb.format, 'WEBP')
+
+        res = self.client.get(detail_url(self.recipe.id))
+        url = res.data['image_variants']['512']['jpeg']
+        self.assertTrue(url.startswith(
+            f'http://testserver{image_url(self.recipe.id)}?',
+        ))
+        with override_settings(MEDIA_ACCEL_REDIRECT=True):
+            res = self.client.get(url)
+        self.assertTrue(res['X-Accel-Redirect'].endswith('_512.jpg'))
+
+    @override_settings(RECIPE_IMAGE_WORKERS=1)
+    def test_render_variants_in_pool(self):
+        """Test variants render in the process pool."""
+        with tempfile.TemporaryDirectory() as root:
+            Image.new('RGB', (300, 300)).save(os.path.join(root, 'a.png'))
+
+            future = images.get_pool().submit(
+                images.render_variants, root, 'a.png', (128,), ('jpeg',), 80,
+            )
+
+            self.assertEqual(future.result(), {'128': {'jpeg': 'a_128.jpg'}})
+            self.assertTrue(os.path.exists(os.path.join(root, 'a_128.jpg')))
+
+    @override_settings(RECIPE_IMAGE_WORKERS=1)
+    def test_pool_spawns_python_under_uwsgi(self):
+        """Test pool children start when sys.executable is not Python."""
+        uwsgi = '/usr/local/bin/uwsgi'
+        images.discard_pool()
+        with patch('sys.executable', uwsgi), \
+                patch.object(multiprocessing.spawn, '_python_exe'), \
+                tempfile.TemporaryDirectory() as root:
+            multiprocessing.set_executable(uwsgi)
+            Image.new('RGB', (300, 300)).save(os.path.join(root, 'a.png'))
+            try:
+                future = images.get_pool().submit(
+                    images.render_variants, root, 'a.png', (128,),
+                    ('jpeg',), 80,
+                )
+                variants = future.result(timeout=60)
+            finally:
+                images.discard_pool()
+
+        self.assertEqual(variants, {'128': {'jpeg': 'a_128.jpg'}})
+
+    @override_settings(RECIPE_IMAGE_WORKERS=1)
+    def test_broken_pool_on_submit_renders_inline(self):
+        """Test an upload still gets variants when the pool is broken."""
+        pool = Mock()
+        pool.submit.side_effect = BrokenProcessPool('worker died')
+        with patch('recipe.images.get_pool', return_value=pool), \
+                patch('recipe.images.logger'):
+            self._upload_sample(size=(300, 300))
+
+        self.assertEqual(set(self.recipe.image_variants), {'128'})
+
+    @override_settings(RECIPE_IMAGE_WORKERS=1)
+    def test_pool_breaking_mid_job_renders_inline(self):
+        """Test a job lost to a dying pool is rendered inline."""
+        future = Future()
+        future.set_exception(BrokenProcessPool('worker died'))
+        pool = Mock()
+        pool.submit.return_value = future
+        with patch('recipe.images.get_pool', return_value=pool), \
+                patch('recipe.images.logger'):
+            self._upload_sample(size=(300, 300))
+
+        self.assertEqual(set(self.recipe.image_variants), {'128'})
+
+    def _upload(self, recipe, image_file):
+        """Upload an open image file to a recipe."""
+        image_file.seek(0)
+        return self.client.post(
+            image_upload_url(recipe.id), {'image': image_file},
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        """Test identical images are stored once and reference counted."""
+        other = create_recipe(user=self.user)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (20, 20), 'red').save(image_file, format='JPEG')
+            self.assertEqual(self._upload(self.recipe, image_file).status_code,
+                             status.HTTP_200_OK)
+            self.assertEqual(self._upload(other, image_file).status_code,
+                             status.HTTP_200_OK)
+
+        self.recipe.refresh_from_db()
+        other.refresh_from_db()
+        name = self.recipe.image.name
+        self.assertEqual(name, other.image.name)
+        self.assertRegex(name, r'^upload/recipe/\w{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(StoredImage.objects.get(name=name).refs, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+        self.assertEqual(StoredImage.objects.get(name=name).refs, 1)
+
+    def test_stored_name_ignores_client_file_name(self):
+        """Test files are stored under the counted name, whatever the
+        client called them."""
+        recipes = [create_recipe(user=self.user) for _ in range(3)]
+        names = []
+        for recipe, suffix, color in (
+            (recipes[0], '.jpeg', 'red'),
+            (recipes[1], '', 'blue'),
+            (recipes[2], '', 'red'),
+        ):
+            with tempfile.NamedTemporaryFile(suffix=suffix) as image_file:
+                Image.new('RGB', (20, 20), color).save(
+                    image_file, format='JPEG',
+                )
+                res = self._upload(recipe, image_file)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            recipe.refresh_from_db()
+            names.append(recipe.image.name)
+
+        storage = recipes[0].image.storage
+        for name in names:
+            self.assertRegex(name, r'^upload/recipe/\w{2}/[0-9a-f]{64}\.jpg$')
+            self.assertTrue(storage.exists(name))
+        self.assertEqual(names[0], names[2])
+        self.assertEqual(StoredImage.objects.get(name=names[0]).refs, 2)
+        self.assertEqual(StoredImage.objects.get(name=names[1]).refs, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes[0].delete()
+        self.assertTrue(storage.exists(names[0]))
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes[1].delete()
+            recipes[2].delete()
+        self.assertFalse(storage.exists(names[0]))
+        self.assertFalse(storage.exists(names[1]))
+
+    def test_replacing_image_releases_previous_file(self):
+        """Test the old file is removed once no recipe uses it."""
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            Image.new('RGB', (20, 20), 'blue').save(image_file, format='PNG')
+            self._upload(self.recipe, image_file)
+        self.recipe.refresh_from_db()
+        old_path = self.recipe.image.path
+
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            Image.new('RGB', (20, 20), 'green').save(image_file, format='PNG')
+            with self.captureOnCommitCallbacks(execute=True):
+                self._upload(self.recipe, image_file)
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertFalse(StoredImage.objects.filter(
+            name__endswith=os.path.basename(old_path),
+        ).exists())
+
+    def test_reacquired_image_survives_pending_cleanup(self):
+        """Test a release's cleanup keeps files acquired again meanwhile."""
+        self._upload_sample()
+        name = self.recipe.image.name
+        storage = self.recipe.image.storage
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            images.release(name, storage)
+        images.acquire(name)
+        for callback in callbacks:
+            callback()
+
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(StoredImage.objects.get(name=name).refs, 1)
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_upload_too_large_rejected(self):
+        """Test uploads over the size limit are refused."""
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            Image.effect_noise((64, 64), 64).save(image_file, format='PNG')
+            res = self._upload(self.recipe, image_file)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('limit', res.data['image'][0])
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_non_image_rejected_early(self):
+        """Test files without an image signature are refused."""
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as fake:
+            fake.write(b'#!/bin/sh\necho not an image\n')
+            res = self._upload(self.recipe, fake)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['image'], ['Upload a valid image.'])
+
+    def _upload_sample(self, size=(20, 20)):
+        """Upload a sample JPEG to the test recipe."""
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', size, 'white').save(image_file, format='JPEG')
+            self._upload(self.recipe, image_file)
+        self.recipe.refresh_from_db()
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=True)
+    def test_image_download_uses_accel_redirect(self):
+        """Test nginx is told to send the file with immutable caching."""
+        self._upload_sample()
+        url = self.client.get(detail_url(self.recipe.id)).data['image']
+
+        res = self.client.get(url, HTTP_ACCEPT='image/*')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            f'/protected-media/{self.recipe.image.name}',
+        )
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertEqual(res.content, b'')
+
+    def test_unversioned_image_download_revalidated(self):
+        """Test image URLs without the current version are not immutable."""
+        self._upload_sample()
+
+        res = self.client.get(image_url(self.recipe.id), {'v': 'stale'})
+
+        b''.join(res.streaming_content)
+        self.assertEqual(res['Cache-Control'], 'private, no-cache')
+
+    def test_image_urls_use_authenticated_endpoint(self):
+        """Test serialized image URLs never point at public media."""
+        self._upload_sample()
+        first = self.client.get(detail_url(self.recipe.id)).data['image']
+
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            Image.new('RGB', (20, 20), 'black').save(image_file, format='PNG')
+            res = self._upload(self.recipe, image_file)
+        second = self.client.get(detail_url(self.recipe.id)).data['image']
+
+        self.assertEqual(res.data['image'], second)
+        self.assertTrue(first.startswith(
+            f'http://testserver{image_url(self.recipe.id)}?v=',
+        ))
+        self.assertNotEqual(first, second)
+        self.assertNotIn(settings.MEDIA_URL, second)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=True)
+    def test_image_download_variant(self):
+        """Test a variant can be requested by size and format."""
+        self._upload_sample(size=(300, 300))
+
+        res = self.client.get(
+            image_url(self.recipe.id), {'size': 128, 'variant_format': 'webp'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['X-Accel-Redirect'].endswith('_128.webp'))
+        self.assertEqual(res['Content-Type'], 'image/webp')
+
+    def test_image_download_streams_without_accel(self):
+        """Test Django serves the file itself when nginx is not in front."""
+        self._upload_sample()
+
+        res = self.client.get(image_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with open(self.recipe.image.path, 'rb') as fh:
+            self.assertEqual(b''.join(res.streaming_content), fh.read())
+
+    def test_image_download_other_users_recipe(self):
+        """Test another user's image cannot be downloaded."""
+        self._upload_sample()
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'password123',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(image_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_image_download_without_image(self):
+        """Test a recipe without an image gives 404."""
+        res = self.client.get(image_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
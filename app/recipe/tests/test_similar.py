@@ -0,0 +1,130 @@
+"""
+Tests for the similar recipes API.
+"""
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+
+from core.models import Ingredient, RecipeBand, Tag
+from recipe import similar
+from recipe.tests.helpers import (
+    AuthenticatedClientMixin, create_recipe, create_user,
+)
+
+
+def similar_url(recipe_id):
+    """Create and return a similar recipes URL."""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+class MinHashTests(TestCase):
+    """Test signatures and bands on their own."""
+
+    def test_signature_estimates_jaccard(self):
+        """Test matching signature rows approximate Jaccard similarity."""
+        a = similar.compute_signature(set(range(0, 300)))
+        b = similar.compute_signature(set(range(100, 400)))
+
+        estimate = (a == b).mean()
+
+        self.assertAlmostEqual(estimate, 0.5, delta=0.15)
+
+    def test_equal_sets_share_every_band(self):
+        """Test identical sets land in the same bucket in every band."""
+        a = similar.compute_signature({1, 2, 3})
+        b = similar.compute_signature({3, 2, 1})
+
+        self.assertEqual(similar.band_buckets(a), similar.band_buckets(b))
+        self.assertEqual(len(similar.band_buckets(a)), similar.BANDS)
+
+    def test_empty_set_has_no_signature(self):
+        """Test a recipe without relations has no signature."""
+        self.assertIsNone(similar.compute_signature(set()))
+
+
+class SimilarApiTests(AuthenticatedClientMixin, TestCase):
+    """Test the similar recipes endpoint."""
+
+    def setUp(self):
+        super().setUp()
+        self.tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(4)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=f'Ing {i}')
+            for i in range(8)
+        ]
+
+    def test_similar_ranked_by_jaccard(self):
+        """Test recipes sharing most relations come first with scores."""
+        base = create_recipe(self.user, self.tags[:2], self.ingredients[:6])
+        close = create_recipe(self.user, self.tags[:2], self.ingredients[:5])
+        closer = create_recipe(self.user, self.tags[:2], self.ingredients[:6])
+        create_recipe(self.user, self.tags[2:], self.ingredients[6:])
+
+        res = self.client.get(similar_url(base.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [closer.id, close.id])
+        self.assertEqual(res.data[0]['similarity'], 1.0)
+        self.assertEqual(res.data[1]['similarity'], round(7 / 8, 4))
+        self.assertEqual(len(res.data[0]['ingredients']), 6)
+
+    def test_similar_limit(self):
+        """Test limit caps the number of results."""
+        base = create_recipe(self.user, self.tags, self.ingredients)
+        for _ in range(3):
+            create_recipe(self.user, self.tags, self.ingredients)
+
+        res = self.client.get(similar_url(base.id), {'limit': 2})
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_similar_invalid_limit(self):
+        """Test a malformed limit is rejected."""
+        base = create_recipe(self.user, self.tags, self.ingredients)
+
+        res = self.client.get(similar_url(base.id), {'limit': 'x'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_similar_limited_to_user(self):
+        """Test other users' recipes are never suggested."""
+        other = create_user(email='other@example.com')
+        base = create_recipe(self.user, self.tags, self.ingredients)
+        copy = create_recipe(other)
+        copy.tags.add(*self.tags)
+        copy.ingredients.add(*self.ingredients)
+
+        res = self.client.get(similar_url(base.id))
+
+        self.assertEqual(res.data, [])
+
+    def test_similar_without_relations(self):
+        """Test a recipe without tags or ingredients has no matches."""
+        base = create_recipe(self.user)
+        create_recipe(self.user)
+
+        res = self.client.get(similar_url(base.id))
+
+        self.assertEqual(res.data, [])
+
+    def test_signatures_follow_relation_changes(self):
+        """Test signatures and bands refresh as relations change."""
+        base = create_recipe(self.user, self.tags[:2], self.ingredients[:4])
+        other = create_recipe(self.user, self.tags[:2], self.ingredients[:4])
+        self.assertEqual(other.bands.count(), similar.BANDS)
+
+        other.ingredients.set(self.ingredients[4:])
+        other.tags.clear()
+
+        res = self.client.get(similar_url(base.id))
+        self.assertEqual(res.data, [])
+
+        for ingredient in self.ingredients[4:]:
+            ingredient.delete()
+        other.refresh_from_db()
+        self.assertIsNone(other.minhash)
+        self.assertFalse(RecipeBand.objects.filter(recipe=other).exists())
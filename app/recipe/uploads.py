@@ -0,0 +1,80 @@
+"""
+Upload handlers for recipe images.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import (
+    StopUpload,
+    TemporaryFileUploadHandler,
+)
+
+# Leading bytes of the formats Pillow is allowed to receive.
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+)
+
+# Room for multipart boundaries and headers around the file itself.
+MULTIPART_SLACK = 64 * 1024
+
+
+def sniff_image_format(data):
+    """Return the image format from a file's first bytes, if known."""
+    for signature, name in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return name
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Stream uploads to disk while hashing and vetting them.
+
+    Bodies larger than ``max_size`` and files that do not start with a
+    known image signature stop the upload at once, before the rest of the
+    body is read. The reason is kept on ``rejection``. Accepted files get
+    a ``content_hash`` attribute holding their SHA-256 hex digest.
+    """
+
+    def __init__(self, request=None, max_size=None):
+        super().__init__(request)
+        self.max_size = max_size
+        self.rejection = None
+
+    def _reject(self, reason):
+        self.rejection = reason
+        raise StopUpload(connection_reset=True)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        """Flag bodies that cannot fit under the size limit."""
+        if content_length > self.max_size + MULTIPART_SLACK:
+            self.rejection = self._too_large()
+
+    def _too_large(self):
+        return f'Image exceeds the {self.max_size} byte upload limit.'
+
+    def new_file(self, *args, **kwargs):
+        """Start hashing a new file, unless the body was already refused."""
+        if self.rejection:
+            raise StopUpload(connection_reset=True)
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        """Vet, hash and write one chunk."""
+        if start == 0 and sniff_image_format(raw_data) is None:
+            self._reject('Upload a valid image.')
+        if start + len(raw_data) > self.max_size:
+            self._reject(self._too_large())
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        """Return the temporary file tagged with its content hash."""
+        file = super().file_complete(file_size)
+        file.content_hash = self.hasher.hexdigest()
+        return file
@@ -1,7 +1,8 @@
 """
 Views for the recipe APIs.
 """
-
+from django.conf import settings
+from django.db import transaction
 
 from drf_spectacular.utils import (
     extend_schema_view,
@@ -17,8 +18,9 @@ from rest_framework import (
 
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.negotiation import BaseContentNegotiation
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
 from core.models import (
@@ -26,7 +28,54 @@ from core.models import (
     Tag,
     Ingredient,
     )
-from recipe import serializers
+from recipe import (
+    completion,
+    counts,
+    export,
+    images,
+    pantry,
+    serializers,
+    similar,
+)
+from recipe.cache import CachedListMixin
+from recipe.conditional import (
+    ConditionalListMixin,
+    ConditionalRetrieveMixin,
+)
+from recipe.filters import (
+    TAGS_MODE_ANY,
+    TAGS_MODES,
+    filter_assigned,
+    filter_by_ingredients,
+    filter_by_tags,
+)
+from recipe.pagination import RecipeCursorPagination, RecipeSearchPagination
+from recipe.search import search_recipes
+from recipe.uploads import HashingUploadHandler
+from user.authentication import CachedTokenAuthentication
+
+
+def _limit_param(request, default, maximum):
+    """Return the request's limit parameter, capped at maximum."""
+    try:
+        limit = int(request.query_params.get('limit', default))
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        raise ValidationError({'limit': 'Must be a positive integer.'})
+    return min(limit, maximum)
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Skip Accept checks for endpoints that return raw files."""
+
+    def select_parser(self, request, parsers):
+        """Select the first parser in the `.parser_classes` list."""
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        """Select the first renderer in the `.renderer_classes` list."""
+        return (renderers[0], renderers[0].media_type)
 
 
 @extend_schema_view(
@@ -37,47 +86,186 @@ from recipe import serializers
                 OpenApiTypes.STR,
                 description='Comma seperted list of tag IDs to filter'
             ),
+            OpenApiParameter(
+                'tags_mode',
+                OpenApiTypes.STR, enum=list(TAGS_MODES),
+                description='Match recipes with any (default) or all tags.',
+            ),
 
             OpenApiParameter(
                 'ingredients',
                 OpenApiTypes.STR,
                 description='Comma seperted list of ingredient IDs to filter'
-            )
+            ),
+            OpenApiParameter(
+                'search',
+                OpenApiTypes.STR,
+                description=(
+                    'Search title, description, tags and ingredients. '
+                    'Results are ranked best first and paged by cursor.'
+                ),
+            ),
         ]
-    )
+    ),
+    image_file=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'size',
+                OpenApiTypes.STR,
+                description='Variant size to fetch instead of the original.',
+            ),
+            OpenApiParameter(
+                'variant_format',
+                OpenApiTypes.STR, enum=['jpeg', 'webp'],
+                description='Variant format, jpeg by default.',
+            ),
+            OpenApiParameter(
+                'v',
+                OpenApiTypes.STR,
+                description=(
+                    'Image version from the recipe detail URLs; matching '
+                    'responses may be cached indefinitely.'
+                ),
+            ),
+        ],
+        responses={(200, 'image/*'): OpenApiTypes.BINARY},
+    ),
+    pantry_matches=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'ingredients',
+                OpenApiTypes.STR,
+                description='Comma separated IDs of ingredients on hand.',
+            ),
+            OpenApiParameter(
+                'names',
+                OpenApiTypes.STR,
+                description='Comma separated names of ingredients on hand.',
+            ),
+            OpenApiParameter(
+                'min_coverage',
+                OpenApiTypes.FLOAT,
+                description='Smallest fraction of ingredients on hand.',
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Number of recipes to return.',
+            ),
+        ],
+        responses=serializers.PantryMatchSerializer(many=True),
+    ),
+    similar_recipes=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Number of similar recipes to return.',
+            ),
+        ],
+        responses=serializers.SimilarRecipeSerializer(many=True),
+    ),
+    bulk=extend_schema(
+        description=(
+            'POST an array of recipes to create, PATCH an array of recipes '
+            'with their id to update, or DELETE an array of ids. Errors '
+            'are reported per item, in request order, and nothing is '
+            'written unless every item is valid.'
+        ),
+        request=serializers.RecipeSerializer(many=True),
+        responses=serializers.RecipeSerializer(many=True),
+    ),
+    export_recipes=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'export_format',
+                OpenApiTypes.STR, enum=list(export.FORMATS),
+                description='ndjson (default) or csv.',
+            ),
+            OpenApiParameter(
+                'tags',
+                OpenApiTypes.STR,
+                description='Comma separated list of tag IDs to filter',
+            ),
+            OpenApiParameter(
+                'ingredients',
+                OpenApiTypes.STR,
+                description='Comma separated list of ingredient IDs to filter',
+            ),
+        ],
+        responses={
+            (200, 'application/x-ndjson'): OpenApiTypes.BINARY,
+            (200, 'text/csv'): OpenApiTypes.BINARY,
+        },
+    ),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalListMixin,
+                    ConditionalRetrieveMixin,
+                    CachedListMixin,
+                    viewsets.ModelViewSet):
     """View for manage recipe APIs."""
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeCursorPagination
+    prefetch_actions = ('list', 'retrieve', 'update', 'partial_update')
 
     def _params_to_ints(self, qs):
         """Convert a list of strings to integer"""
         return[int(str_id) for str_id in qs.split(',')]
 
+    def _search_text(self):
+        """Return the search text for the request, if any."""
+        request = getattr(self, 'request', None)
+        if request is None:
+            return ''
+        return request.query_params.get('search', '').strip()
+
+    @property
+    def paginator(self):
+        """Rank search results rather than paging them by id."""
+        if self._search_text() and not hasattr(self, '_paginator'):
+            self._paginator = RecipeSearchPagination()
+        return super().paginator
+
     def get_queryset(self):
         """Retrieve recipes for the autheticated user."""
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        tags_mode = self.request.query_params.get('tags_mode', TAGS_MODE_ANY)
+        if tags_mode not in TAGS_MODES:
+            raise ValidationError(
+                {'tags_mode': f'Must be one of: {", ".join(TAGS_MODES)}.'}
+            )
         queryset = self.queryset
+        if self.action in self.prefetch_actions:
+            queryset = queryset.prefetch_related('tags', 'ingredients')
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = filter_by_tags(queryset, tag_ids, tags_mode)
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-id').distinct()
+            queryset = filter_by_ingredients(queryset, ingredient_ids)
+        queryset = queryset.filter(user=self.request.user)
+        search = self._search_text()
+        if search and self.action == 'list':
+            return search_recipes(
+                queryset, self.request.user.pk, search,
+                **self.paginator.get_window(self.request),
+            )
+        return queryset.order_by('-id')
 
     def get_serializer_class(self):
         """Return the serializer class for request."""
-        if self.action == 'list':
+        if self.action in ('list', 'bulk'):
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'pantry_matches':
+            return serializers.PantryMatchSerializer
+        elif self.action == 'similar_recipes':
+            return serializers.SimilarRecipeSerializer
 
         return self.serializer_class
 
@@ -88,15 +276,221 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """Upload an image to recipe."""
+        handler = HashingUploadHandler(
+            request, max_size=settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE,
+        )
+        request.upload_handlers = [handler]
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data=request.data)
 
+        if handler.rejection:
+            return Response(
+                {'image': [handler.rejection]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         if serializer.is_valid():
             serializer.save()
+            if not recipe.image_variants:
+                images.generate_variants(recipe)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def _pantry_params(self, params):
+        """Parse and validate the pantry query parameters."""
+        errors = {}
+        ingredient_ids = []
+        try:
+            if params.get('ingredients'):
+                ingredient_ids = self._params_to_ints(params['ingredients'])
+        except ValueError:
+            errors['ingredients'] = 'Must be a comma separated list of IDs.'
+        names = [
+            name.strip() for name in params.get('names', '').split(',')
+            if name.strip()
+        ]
+        try:
+            min_coverage = float(params.get('min_coverage', 0))
+            if not 0 <= min_coverage <= 1:
+                raise ValueError
+        except ValueError:
+            errors['min_coverage'] = 'Must be a number between 0 and 1.'
+        try:
+            limit = int(params.get('limit', settings.RECIPE_PAGE_SIZE))
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            errors['limit'] = 'Must be a positive integer.'
+        if errors:
+            raise ValidationError(errors)
+        return {
+            'ingredient_ids': ingredient_ids,
+            'names': names,
+            'min_coverage': min_coverage,
+            'limit': min(limit, settings.RECIPE_MAX_PAGE_SIZE),
+        }
+
+    @action(
+        methods=['GET'], detail=False, url_path='pantry', url_name='pantry',
+    )
+    def pantry_matches(self, request):
+        """Rank recipes by the share of their ingredients on hand."""
+        matches = pantry.find_matches(
+            request.user.pk, **self._pantry_params(request.query_params),
+        )
+        serializer = self.get_serializer(matches, many=True)
+        return Response(serializer.data)
+
+    @action(
+        methods=['GET'], detail=True, url_path='similar', url_name='similar',
+    )
+    def similar_recipes(self, request, pk=None):
+        """List the recipes sharing the most tags and ingredients."""
+        limit = _limit_param(
+            request,
+            settings.RECIPE_SIMILAR_LIMIT,
+            settings.RECIPE_SIMILAR_MAX_LIMIT,
+        )
+        recipe = self.get_object()
+        scores = dict(similar.similar_recipes(recipe, limit))
+        recipes = sorted(
+            Recipe.objects.filter(id__in=scores)
+            .prefetch_related('tags', 'ingredients'),
+            key=lambda r: (-scores[r.id], -r.id),
+        )
+        for match in recipes:
+            match.similarity = round(scores[match.id], 4)
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data)
+
+    def _bulk_items(self, data):
+        """Return the request body as a list of at most the allowed size."""
+        if not isinstance(data, list):
+            raise ValidationError(
+                {'non_field_errors': ['Expected a list of items.']}
+            )
+        if len(data) > settings.RECIPE_BULK_MAX_ITEMS:
+            raise ValidationError({'non_field_errors': [
+                f'At most {settings.RECIPE_BULK_MAX_ITEMS} items '
+                'per request.'
+            ]})
+        return data
+
+    def _bulk_instances(self, ids):
+        """Return the user's recipes for ids in order, or per-item errors."""
+        found = self.get_queryset().in_bulk(
+            [i for i in ids if isinstance(i, int)],
+        )
+        errors = []
+        for recipe_id in ids:
+            if not isinstance(recipe_id, int):
+                errors.append({'id': ['A valid integer is required.']})
+            elif recipe_id not in found:
+                errors.append({'id': ['Recipe not found.']})
+            else:
+                errors.append({})
+        if any(errors):
+            raise ValidationError(errors)
+        return [found[recipe_id] for recipe_id in ids]
+
+    def _bulk_response(self, recipes, status_code):
+        """Serialize written recipes in request order."""
+        order = {recipe.id: i for i, recipe in enumerate(recipes)}
+        recipes = sorted(
+            self.get_queryset().filter(id__in=order)
+            .prefetch_related('tags', 'ingredients'),
+            key=lambda recipe: order[recipe.id],
+        )
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data, status=status_code)
+
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False)
+    def bulk(self, request):
+        """Create, update or delete many recipes in one transaction."""
+        items = self._bulk_items(request.data)
+        if request.method == 'DELETE':
+            self._bulk_delete(self._bulk_instances(items))
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        save_kwargs = {}
+        if request.method == 'POST':
+            serializer = self.get_serializer(data=items, many=True)
+            save_kwargs['user'] = request.user
+            status_code = status.HTTP_201_CREATED
+        else:
+            ids = [
+                item.get('id') if isinstance(item, dict) else None
+                for item in items
+            ]
+            serializer = self.get_serializer(
+                self._bulk_instances(ids), data=items,
+                many=True, partial=True,
+            )
+            status_code = status.HTTP_200_OK
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.save(**save_kwargs)
+        return self._bulk_response(recipes, status_code)
+
+    @transaction.atomic
+    def _bulk_delete(self, recipes):
+        """Delete recipes, recounting their tags and ingredients once."""
+        ids = [recipe.id for recipe in recipes]
+        tags = list(
+            Tag.objects.filter(recipe__in=ids)
+            .values_list('id', flat=True).distinct()
+        )
+        ingredients = list(
+            Ingredient.objects.filter(recipe__in=ids)
+            .values_list('id', flat=True).distinct()
+        )
+        with counts.deferred():
+            Recipe.objects.filter(id__in=ids).delete()
+        counts.recount(Tag, Tag.objects.filter(id__in=tags))
+        counts.recount(
+            Ingredient, Ingredient.objects.filter(id__in=ingredients),
+        )
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='export',
+        url_name='export',
+        content_negotiation_class=IgnoreClientContentNegotiation,
+    )
+    def export_recipes(self, request):
+        """Stream every recipe of the user as NDJSON or CSV."""
+        export_format = request.query_params.get(
+            'export_format', export.FORMAT_NDJSON,
+        )
+        if export_format not in export.FORMATS:
+            raise ValidationError({'export_format': (
+                f'Must be one of: {", ".join(export.FORMATS)}.'
+            )})
+        return export.export_response(self.get_queryset(), export_format)
+
+    @action(
+        methods=['GET'],
+        detail=True,
+        url_path='image',
+        content_negotiation_class=IgnoreClientContentNegotiation,
+    )
+    def image_file(self, request, pk=None):
+        """Deliver the recipe image, or one of its variants, to its owner."""
+        recipe = self.get_object()
+        name = recipe.image.name
+        size = request.query_params.get('size')
+        if size:
+            fmt = request.query_params.get('variant_format', 'jpeg')
+            name = recipe.image_variants.get(size, {}).get(fmt)
+        if not name:
+            raise NotFound('Image not found.')
+
+        version = images.image_version(recipe.image.name)
+        return images.image_response(
+            name, recipe.image.storage,
+            immutable=request.query_params.get('v') == version,
+        )
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -105,16 +499,42 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0, 1],
                 description='Filter by item assigned to recipes.',
-            )
+            ),
+            OpenApiParameter(
+                'with_counts',
+                OpenApiTypes.INT, enum=[0, 1],
+                description='Include how many recipes use each item.',
+            ),
         ]
-    )
+    ),
+    autocomplete=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'prefix',
+                OpenApiTypes.STR,
+                description='Case-insensitive start of the name.',
+            ),
+            OpenApiParameter(
+                'q',
+                OpenApiTypes.STR,
+                description='Fuzzy match on the name; overrides prefix.',
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Number of names to return.',
+            ),
+        ]
+    ),
 )
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
+class BaseRecipeAttrViewSet(ConditionalListMixin,
+                            CachedListMixin,
+                            mixins.DestroyModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.ListModelMixin,
                             viewsets.GenericViewSet,):
     """Base viewset of Recipe attributes."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -124,16 +544,45 @@ class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
         )
         queryset = self.queryset
         if assinged_only:
-            queryset = queryset.filter(recipe__isnull=False)
+            queryset = filter_assigned(queryset)
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by('-name')
+
+    def get_serializer_class(self):
+        """Add recipe counts to lists requested with_counts."""
+        with_counts = self.request.query_params.get('with_counts', '0')
+        if self.action == 'list' and with_counts == '1':
+            return self.count_serializer_class
+        return self.serializer_class
+
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        """Return the user's best matches for a prefix or fuzzy query."""
+        prefix = request.query_params.get('prefix', '').strip()
+        q = request.query_params.get('q', '').strip()
+        if not prefix and not q:
+            raise ValidationError(
+                {'prefix': 'Provide a prefix or q parameter.'}
+            )
+        limit = _limit_param(
+            request,
+            settings.RECIPE_AUTOCOMPLETE_LIMIT,
+            settings.RECIPE_AUTOCOMPLETE_MAX_LIMIT,
+        )
+        matches = completion.complete(
+            self.queryset.model, request.user.pk,
+            prefix=prefix, q=q, limit=limit,
+        )
+        serializer = self.get_serializer(matches, many=True)
+        return Response(serializer.data)
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database."""
     serializer_class = serializers.TagSerializer
+    count_serializer_class = serializers.TagCountSerializer
     queryset = Tag.objects.all()
 
 
@@ -141,4 +590,5 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in database."""
 
     serializer_class = serializers.IngredientSerializer
+    count_serializer_class = serializers.IngredientCountSerializer
     queryset = Ingredient.objects.all()
@@ -0,0 +1,169 @@
+"""
+Authentication classes for the APIs.
+"""
+import copy
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from core import metrics
+
+SHARED_KEY_PREFIX = 'auth-token:'
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value or None if missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store value, evicting the least recently used entries."""
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove key if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+_local = {'config': None, 'cache': None}
+
+
+def _config():
+    """Return the token cache settings."""
+    return settings.TOKEN_AUTH_CACHE
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+    metrics.inc('cache_events_total', cache='token_auth', event=name)
+
+
+def get_stats():
+    """Return a snapshot of the token cache hit/miss counters."""
+    with _stats_lock:
+        return {
+            name: _stats[name]
+            for name in ('hits', 'shared_hits', 'misses', 'invalidations')
+        }
+
+
+def get_local_cache():
+    """Return this worker's token cache, rebuilt if settings changed."""
+    config = _config()
+    key = (config['LOCAL_MAX_SIZE'], config['LOCAL_TTL'])
+    if _local['config'] != key:
+        _local['cache'] = TTLCache(*key)
+        _local['config'] = key
+    return _local['cache']
+
+
+def _get_shared_cache():
+    """Return the optional shared cache tier."""
+    alias = _config().get('SHARED_ALIAS')
+    return caches[alias] if alias else None
+
+
+def invalidate_token(key):
+    """Drop a token from every cache tier."""
+    _count('invalidations')
+    get_local_cache().delete(key)
+    shared = _get_shared_cache()
+    if shared is not None:
+        shared.delete(SHARED_KEY_PREFIX + key)
+
+
+def invalidate_user(user_id):
+    """Drop every token belonging to a user from the caches."""
+    keys = Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+    for key in keys:
+        invalidate_token(key)
+
+
+def clear_cache():
+    """Empty this worker's token cache and reset the counters."""
+    get_local_cache().clear()
+    with _stats_lock:
+        _stats.clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication backed by a worker LRU and a shared cache.
+
+    Each worker keeps users for recently seen tokens for ``LOCAL_TTL``
+    seconds. When ``SHARED_ALIAS`` names a Django cache, misses fall
+    through to it before querying the token table. The shared tier only
+    maps tokens to user ids, so no password hashes are written to it; a
+    shared hit loads the user by primary key. Signals in
+    :mod:`user.signals` invalidate entries when a token is deleted or its
+    user is saved.
+    """
+
+    def authenticate_credentials(self, key):
+        """Return (user, token) for key, consulting the caches first."""
+        local = get_local_cache()
+        shared = _get_shared_cache()
+        user = local.get(key)
+        if user is not None:
+            _count('hits')
+        elif shared is not None:
+            user_id = shared.get(SHARED_KEY_PREFIX + key)
+            if user_id is not None:
+                user = get_user_model().objects.filter(
+                    pk=user_id, is_active=True,
+                ).first()
+            if user is not None:
+                _count('shared_hits')
+                local.set(key, user)
+
+        if user is None:
+            _count('misses')
+            user, token = super().authenticate_credentials(key)
+            local.set(key, user)
+            if shared is not None:
+                shared.set(
+                    SHARED_KEY_PREFIX + key, user.pk,
+                    _config()['SHARED_TTL'],
+                )
+
+        # Views may mutate request.user, so never hand out the cached one.
+        user = copy.copy(user)
+        return (user, Token(key=key, user=user))
@@ -0,0 +1,148 @@
+"""
+Tests for the cached token authentication.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import exceptions, status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user import authentication
+from user.authentication import CachedTokenAuthentication, TTLCache
+
+ME_URL = reverse('user:me')
+SHARED_CACHE = {
+    'LOCAL_TTL': 30,
+    'LOCAL_MAX_SIZE': 100,
+    'SHARED_ALIAS': 'default',
+    'SHARED_TTL': 60,
+}
+
+
+class TTLCacheTests(TestCase):
+    """Test the worker local LRU cache."""
+
+    def test_evicts_least_recently_used(self):
+        """Test the oldest untouched entry is evicted at capacity."""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire(self):
+        """Test entries are dropped once their TTL has passed."""
+        cache = TTLCache(maxsize=2, ttl=-1)
+        cache.set('a', 1)
+
+        self.assertIsNone(cache.get('a'))
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating with cached tokens."""
+
+    def setUp(self):
+        authentication.clear_cache()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def test_repeat_lookup_skips_database(self):
+        """Test a second lookup of a token is served from memory."""
+        self.auth.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.key, self.token.key)
+        stats = authentication.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_deleted_token_rejected(self):
+        """Test deleting a token invalidates the cached entry."""
+        key = self.token.key
+        self.auth.authenticate_credentials(key)
+
+        self.token.delete()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+    def test_deactivated_user_rejected(self):
+        """Test deactivating a user invalidates cached tokens."""
+        self.auth.authenticate_credentials(self.token.key)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_password_change_reloads_user(self):
+        """Test changing the password forces a fresh lookup."""
+        self.auth.authenticate_credentials(self.token.key)
+
+        self.user.set_password('newpass123')
+        self.user.save()
+        user, _ = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertTrue(user.check_password('newpass123'))
+        self.assertEqual(authentication.get_stats()['misses'], 2)
+
+    @override_settings(TOKEN_AUTH_CACHE=SHARED_CACHE)
+    def test_shared_tier_used_after_local_miss(self):
+        """Test another worker's lookup is served by the shared cache."""
+        self.auth.authenticate_credentials(self.token.key)
+        authentication.get_local_cache().clear()
+
+        with self.assertNumQueries(1):
+            user, _ = self.auth.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(authentication.get_stats()['shared_hits'], 1)
+
+    @override_settings(TOKEN_AUTH_CACHE=SHARED_CACHE)
+    def test_shared_tier_stores_user_id_only(self):
+        """Test the shared cache holds the user id, not the user."""
+        self.auth.authenticate_credentials(self.token.key)
+
+        cached = caches['default'].get(
+            authentication.SHARED_KEY_PREFIX + self.token.key,
+        )
+
+        self.assertEqual(cached, self.user.pk)
+
+    @override_settings(TOKEN_AUTH_CACHE=SHARED_CACHE)
+    def test_shared_tier_rechecks_active_flag(self):
+        """Test a shared hit for a deactivated user is rejected."""
+        self.auth.authenticate_credentials(self.token.key)
+        authentication.get_local_cache().clear()
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            is_active=False,
+        )
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_api_request_with_cached_token(self):
+        """Test API requests authenticate with the cached token class."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        client.get(ME_URL)
+        res = client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+        self.assertEqual(authentication.get_stats()['hits'], 1)
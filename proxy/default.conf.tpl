@@ -5,6 +5,28 @@ server {
         alias /vol/static;
     }
 
+    # Uploaded media shares the static volume but is only sent through
+    # /protected-media/ below, never to anonymous clients.
+    location /static/media/ {
+        return 404;
+    }
+
+    # Only reachable through X-Accel-Redirect from the app, after it has
+    # checked ownership. Cache-Control is passed through from the app.
+    location /protected-media/ {
+        internal;
+        alias /vol/static/media/;
+    }
+
+    # Only the Prometheus scraper's network may reach metrics. The app
+    # checks the address again, and the bearer token when one is set.
+    location = /api/metrics {
+        allow                   ${METRICS_SCRAPER_NETWORK};
+        deny                    all;
+        uwsgi_pass              ${APP_HOST}:${APP_PORT};
+        include                 /etc/nginx/uwsgi_params;
+    }
+
     location / {
         uwsgi_pass              ${APP_HOST}:${APP_PORT};
         include                 /etc/nginx/uwsgi_params;
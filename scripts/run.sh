@@ -2,8 +2,13 @@
 
 set -e
 
-python manage.py wait_for_db
+python manage.py wait_for_db --wait-for database,cache,media
 python manage.py collectstatic --noinput
 python manage.py migrate
+# Signatures for recipes that predate similar-recipe support.
+python manage.py refresh_signatures
+
+# Counters restart with the server; drop files left by old workers.
+rm -rf "${METRICS_DIR:-/tmp/recipe-app-metrics}"
 
 uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file